@@ -1,165 +1,900 @@
-import schedule
 import time
+import heapq
+import statistics
+import random
+import argparse
+import threading
 import requests
 import json
-import csv
+import codecs
+import os
+import hashlib
+import shutil
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from os import makedirs, path
 from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypedDict
+from urllib.parse import urlparse
+
+from requests.adapters import HTTPAdapter
+
+from utils.archive import ResponseArchiver, iter_archived_responses, list_archived_stations
+from utils.storage import (
+    TIME_FORMAT, FileLock, PartitionWriter, ViewRefreshQueue, atomic_write_text, latest_stored_time, list_partitions,
+    local_now, parse_time, partition_name, read_csv_rows, read_partition_times, sidecar_path, store_root,
+    update_derived_views,
+)
+from utils.rollup import rollup_root
+from utils.tensor import tensor_root
 
 OUTPUT = "dataset/buoy/"
-CSV_COLUMNS = [
-    "StationID",
-    "time",
-    "Wind_Gust_Speed",
-    "Wind_Speed",
-    "Wind_Direction",
-    "Air_Pressure",
-    "Air_Temperature",
-    "Sea_Temperature",
-    "Wave_Height_Significant",
-    "Wave_Mean_Period",
-    "Wave_Main_Direction",
-    "Wave_Peak_Period",
-    "Current_Speed",
-    "Current_Speed_Layer",
-    "Current_Direction",
-    "Current_Direction_Layer",
-    "Current_Speed_knot",
-    "Tide_Height"
-]
-
-CSV_CHINESE_COLUMNS = [
-    "測站編號",
-    "時間",
-    "陣風_風速",
-    "風速",
-    "風向",
-    "氣壓",
-    "氣溫",
-    "海面溫度",
-    "示性波高",
-    "平均週期",
-    "波向",
-    "波浪尖峰週期",
-    "流速",
-    "分層流速{深度:流速}",
-    "流向",
-    "分層流向{深度:流向}",
-    "流速(節)",
-    "潮高"
-]
-
-CSV_UNITS = [
-    "",
-    "UTC+8",
-    "m/s",
-    "m/s",
-    "degree",
-    "hPa",
-    "C",
-    "C",
-    "m",
-    "sec",
-    "degree",
-    "sec",
-    "m/s",
-    "m/s",
-    "degree",
-    "degree",
-    "knot",
-    "m"
-]
-
-def fetch_data(device_id: str):
-    now = datetime.now()
-    start_time = (now - timedelta(days=2)).strftime("%Y-%m-%dT%H:%M:%S")
-    end_time = now.strftime("%Y-%m-%dT%H:%M:%S")
-
-    # Format the URL with query parameters
-    API_URL = f"https://nodass.namr.gov.tw/noapi/namr/v1/obs/{device_id}/data?date1={start_time}&date2={end_time}"
-
-    print(f"[{now}] Requesting: {API_URL}")
-    max_retries = 3
-    for attempt in range(1, max_retries + 1):
+ARCHIVE_OUTPUT = "dataset/buoy_archive/"  # Raw API responses, one gzip segment per station and day
+API_BASE = "https://nodass.namr.gov.tw/noapi"
+
+# Fetch engine tuning (overridable from the command line)
+FETCH_CONCURRENCY = 8       # Number of stations fetched in parallel
+RATE_LIMIT_PER_HOST = 4.0   # Max requests per second sent to one host (0 disables)
+MAX_RETRIES = 3
+BACKOFF_BASE = 1.0          # Seconds, doubled on every failed attempt
+BACKOFF_MAX = 30.0
+REQUEST_TIMEOUT = 10
+STREAM_CHUNK_SIZE = 64 * 1024  # Bytes read from the response body at a time
+STREAM_FLUSH_ROWS = 5000       # Rows buffered before the partition writer is flushed
+
+# Device list
+DEVICES_FILE = path.join(OUTPUT, "devices.json")
+DEVICES_META_FILE = path.join(OUTPUT, "devices.meta.json")  # ETag / Last-Modified / content hash of devices.json
+
+# Historical backfill
+BACKFILL_CHUNK = timedelta(days=7)  # Range requested per API call
+BACKFILL_STATE_FILE = path.join(OUTPUT, "backfill_state.json")
+
+# Adaptive polling
+DEFAULT_REPORT_INTERVAL = timedelta(hours=1)   # Assumed until a station's own cadence is learned
+MIN_POLL_INTERVAL = timedelta(minutes=10)
+MAX_POLL_INTERVAL = timedelta(hours=12)        # Longest wait for a station that keeps returning nothing
+POLL_GRACE = timedelta(minutes=5)              # Wait after the expected report time before polling
+POLL_JITTER = 0.1                              # Random extra delay, as a fraction of the interval
+RECENT_TIMES_KEPT = 48                         # Observation times used to learn a station's interval
+DEVICE_REFRESH_INTERVAL = timedelta(days=1)
+VIEW_REFRESH_INTERVAL = timedelta(minutes=10)  # Derived views (tensors, rollups) are refreshed in batches this often
+
+# Metrics export
+STATUS_FILE = path.join(OUTPUT, "fetch_status.json")    # Read by the fetch status page
+METRICS_FILE = path.join(OUTPUT, "fetch_metrics.prom")  # Prometheus node-exporter textfile format
+METRICS_WRITE_INTERVAL = 60                             # Seconds between exports while scheduling
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)  # Seconds
+
+# Incremental ingestion
+WATERMARK_FILE = path.join(OUTPUT, "watermarks.json")
+INITIAL_LOOKBACK = timedelta(days=2)  # Window requested for a station without any stored data
+
+
+class FetchResult(TypedDict):
+    station_id: str
+    ok: bool
+    attempts: int
+    rows: int
+    bytes: int
+    elapsed: float
+    error: Optional[str]
+    recent_times: List[datetime]  # Times of the newest ingested observations
+
+
+class IngestStats(TypedDict):
+    rows: int
+    attempts: int
+    bytes: int
+    recent_times: List[datetime]
+
+
+class RateLimiter:
+    """Token bucket shared by every worker that talks to the same host."""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        :param rate: Allowed requests per second (0 or less disables limiting)
+        :param burst: Number of requests that may be sent back to back
+        """
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_rate_limiters: Dict[str, RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(url: str) -> RateLimiter:
+    """Return the rate limiter of the host serving `url`."""
+    host = urlparse(url).netloc
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(host)
+        if limiter is None:
+            limiter = _rate_limiters[host] = RateLimiter(RATE_LIMIT_PER_HOST)
+        return limiter
+
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def get_session(pool_size: int = FETCH_CONCURRENCY) -> requests.Session:
+    """Return the shared keep-alive session, creating it with a pool of `pool_size` connections per host."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size))
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+
+def backoff_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter for the given (1-based) failed attempt."""
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)))
+
+
+class WatermarkStore:
+    """Persisted per-station high-water mark (newest ingested observation time)."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.marks: Dict[str, datetime] = {}
+        # Marks bootstrapped from the CSVs but not written to the file yet
+        self.unsaved: Set[str] = set()
+        if path.exists(file_path):
+            try:
+                with open(file_path, "r", encoding="utf-8") as f:
+                    stored = json.load(f)
+                if not isinstance(stored, dict):
+                    raise ValueError("expected an object of StationID to time")
+            except ValueError as e:
+                # Watermarks are derived state: start empty and let get() bootstrap them from the stored CSVs
+                aside = f"{file_path}.corrupt-{local_now().strftime('%Y%m%dT%H%M%S')}"
+                os.replace(file_path, aside)
+                print(f"⚠️ Unreadable watermark file ({e}); moved to {aside}, rebuilding from stored data")
+                stored = {}
+            for station_id, value in stored.items():
+                parsed = parse_time(value)
+                if parsed:
+                    self.marks[station_id] = parsed
+
+    def get(self, device_id: str) -> Optional[datetime]:
+        """Return the station's watermark, bootstrapping it from stored CSVs on first use."""
+        with self.lock:
+            if device_id in self.marks:
+                return self.marks[device_id]
+        latest = latest_stored_time(OUTPUT, device_id)
+        if latest:
+            with self.lock:
+                if device_id not in self.marks:
+                    self.marks[device_id] = latest
+                    self.unsaved.add(device_id)
+        return latest
+
+    def advance(self, device_id: str, value: datetime):
+        """Move the station's watermark forward and persist all watermarks atomically."""
+        # Seed a missing mark from the stored CSVs first, so the first advance never moves it behind them
+        self.get(device_id)
+        with self.lock:
+            current = self.marks.get(device_id)
+            if current and current >= value and device_id not in self.unsaved:
+                return
+            self.marks[device_id] = max(current, value) if current else value
+            serialized = {k: v.strftime(TIME_FORMAT) for k, v in sorted(self.marks.items())}
+            atomic_write_text(self.file_path, json.dumps(serialized, indent=2))
+            self.unsaved.clear()
+
+
+_watermarks: Optional[WatermarkStore] = None
+_watermarks_lock = threading.Lock()
+
+
+def get_watermarks() -> WatermarkStore:
+    global _watermarks
+    with _watermarks_lock:
+        if _watermarks is None:
+            _watermarks = WatermarkStore(WATERMARK_FILE)
+        return _watermarks
+
+
+class FetchMetrics:
+    """Per-station fetch counters and latency histograms, exported as JSON and a Prometheus textfile."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stations: Dict[str, dict] = {}
+        self.last_write = 0.0
+
+    def observe(self, result: FetchResult, last_observation: Optional[datetime]):
+        with self.lock:
+            station = self.stations.setdefault(result["station_id"], {
+                "fetches": 0, "failures": 0, "retries": 0, "rows": 0, "bytes": 0,
+                "latency_buckets": [0] * len(LATENCY_BUCKETS), "latency_sum": 0.0,
+                "last_attempt": None, "last_success": None, "last_observation": None, "last_error": None,
+            })
+            station["fetches"] += 1
+            station["failures"] += 0 if result["ok"] else 1
+            station["retries"] += max(result["attempts"] - 1, 0)
+            station["rows"] += result["rows"]
+            station["bytes"] += result["bytes"]
+            station["latency_sum"] += result["elapsed"]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if result["elapsed"] <= bound:
+                    station["latency_buckets"][i] += 1
+            now = local_now().strftime(TIME_FORMAT)
+            station["last_attempt"] = now
+            if result["ok"]:
+                station["last_success"] = now
+            station["last_error"] = result["error"]
+            if last_observation:
+                station["last_observation"] = last_observation.strftime(TIME_FORMAT)
+
+    def to_prometheus(self, stations: Dict[str, dict]) -> str:
+        lines = []
+        counters = [("fetches", "Observation requests"), ("failures", "Requests that failed after all retries"),
+                    ("retries", "Retried attempts"), ("rows", "Rows written"), ("bytes", "Response bytes received")]
+        for key, help_text in counters:
+            lines += [f"# HELP buoy_fetch_{key}_total {help_text}", f"# TYPE buoy_fetch_{key}_total counter"]
+            lines += [f'buoy_fetch_{key}_total{{station="{sid}"}} {s[key]}' for sid, s in stations.items()]
+
+        lines += ["# HELP buoy_fetch_latency_seconds Request latency including retries", "# TYPE buoy_fetch_latency_seconds histogram"]
+        for sid, s in stations.items():
+            for bound, count in zip(LATENCY_BUCKETS, s["latency_buckets"]):
+                lines.append(f'buoy_fetch_latency_seconds_bucket{{station="{sid}",le="{bound}"}} {count}')
+            lines.append(f'buoy_fetch_latency_seconds_bucket{{station="{sid}",le="+Inf"}} {s["fetches"]}')
+            lines.append(f'buoy_fetch_latency_seconds_sum{{station="{sid}"}} {s["latency_sum"]:.3f}')
+            lines.append(f'buoy_fetch_latency_seconds_count{{station="{sid}"}} {s["fetches"]}')
+
+        lines += ["# HELP buoy_observation_lag_seconds Age of the newest stored observation", "# TYPE buoy_observation_lag_seconds gauge"]
+        now = local_now()
+        for sid, s in stations.items():
+            if s["last_observation"]:
+                lag = (now - datetime.strptime(s["last_observation"], TIME_FORMAT)).total_seconds()
+                lines.append(f'buoy_observation_lag_seconds{{station="{sid}"}} {lag:.0f}')
+        return "\n".join(lines) + "\n"
+
+    def write(self, force: bool = True):
+        """Export the current metrics; without `force`, at most once per METRICS_WRITE_INTERVAL."""
+        if not force and time.monotonic() - self.last_write < METRICS_WRITE_INTERVAL:
+            return
+        with self.lock:
+            stations = json.loads(json.dumps(self.stations))
+            self.last_write = time.monotonic()
+        status = {"updated": local_now().strftime(TIME_FORMAT), "latency_buckets": LATENCY_BUCKETS, "stations": stations}
+        atomic_write_text(STATUS_FILE, json.dumps(status, indent=2))
+        atomic_write_text(METRICS_FILE, self.to_prometheus(stations))
+
+
+_metrics = FetchMetrics()
+
+
+def get_metrics() -> FetchMetrics:
+    return _metrics
+
+
+# Partitions written by the fetch threads whose tensors and rollups are out of date
+_view_queue = ViewRefreshQueue()
+
+
+def get_view_queue() -> ViewRefreshQueue:
+    return _view_queue
+
+
+def refresh_views() -> int:
+    """Refresh the derived views of every partition written since the last refresh."""
+    started = time.monotonic()
+    refreshed = get_view_queue().refresh()
+    if refreshed:
+        print(f"🧊 Refreshed the derived views of {refreshed} partition(s) in {time.monotonic() - started:.1f}s")
+    return refreshed
+
+
+def filter_new_rows(rows: Iterable[dict], since: Optional[datetime]) -> Iterator[dict]:
+    """Drop rows without a usable time or at/before the watermark (duplicates are left to the writer)."""
+    for row in rows:
+        row_time = parse_time(row.get("time"))
+        if row_time is None or (since and row_time <= since):
+            continue
+        yield row
+
+
+def iter_json_records(chunks: Iterable[bytes]) -> Iterator[dict]:
+    """
+    Incrementally decode a JSON response body, yielding the elements of a
+    top-level array as soon as each one is complete. A top-level object is
+    yielded as a single record. Only the undecoded tail of the body is kept
+    in memory.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer, pos, is_array, finished = "", 0, None, False
+    chunks = iter(chunks)
+
+    while True:
+        # Skip separators between array elements
+        while pos < len(buffer) and (buffer[pos].isspace() or (is_array and buffer[pos] == ",")):
+            pos += 1
+
+        if pos < len(buffer):
+            if is_array is None:
+                is_array = buffer[pos] == "["
+                if is_array:
+                    pos += 1
+                    continue
+            if is_array and buffer[pos] == "]":
+                return
+            if is_array or finished:
+                try:
+                    record, end = decoder.raw_decode(buffer, pos)
+                    # A value touching the end of the buffer may still be truncated (e.g. a number)
+                    if end < len(buffer) or finished:
+                        yield record
+                        pos = end
+                        if not is_array:
+                            return
+                        continue
+                except json.JSONDecodeError:
+                    if finished:
+                        raise
+        elif finished:
+            return
+
+        chunk = next(chunks, None)
+        if chunk is None:
+            buffer = buffer[pos:] + utf8.decode(b"", final=True)
+            pos, finished = 0, True
+        else:
+            buffer = buffer[pos:] + utf8.decode(chunk)
+            pos = 0
+
+
+class FetchError(Exception):
+    def __init__(self, message: str, attempts: int, bytes_received: int = 0):
+        super().__init__(message)
+        self.attempts = attempts
+        self.bytes_received = bytes_received
+
+
+def observations_url(device_id: str, start: datetime, end: datetime) -> str:
+    return f"{API_BASE}/namr/v1/obs/{device_id}/data?date1={start.strftime(TIME_FORMAT)}&date2={end.strftime(TIME_FORMAT)}"
+
+
+def ingest_observations(device_id: str, url: str, since: Optional[datetime], advance_watermark: bool = True) -> IngestStats:
+    """
+    Stream observations from `url` into the partitioned writer, retrying with jittered backoff.
+    Records are written in batches of STREAM_FLUSH_ROWS while the body is still downloading, so
+    memory stays bounded however long the requested range is. A retry after a partial write is
+    safe because the writer skips rows that are already stored.
+    :param since: Watermark; rows at or before it are dropped
+    :param advance_watermark: Move the live watermark to the newest row written; backfills leave it alone
+    :raises FetchError: When every attempt failed
+    """
+    limiter = get_rate_limiter(url)
+    bytes_received = 0
+
+    def archive_and_count(chunks: Iterable[bytes], archiver: ResponseArchiver) -> Iterator[bytes]:
+        nonlocal bytes_received
+        for chunk in chunks:
+            bytes_received += len(chunk)
+            archiver.write(chunk)
+            yield chunk
+
+    for attempt in range(1, MAX_RETRIES + 1):
+        limiter.acquire()
+        # Derived views are refreshed in batches by the caller (see refresh_views)
+        writer = PartitionWriter(OUTPUT, get_view_queue())
+        written, newest = 0, None
+        recent_times = deque(maxlen=RECENT_TIMES_KEPT)
+        archiver = None
         try:
-            response = requests.get(API_URL, timeout=10)
-            response.raise_for_status()
-            print(f"✅ Success on attempt {attempt}")
-            data = response.json()
-            parse_to_csv(data, device_id)
-            break
+            archiver = ResponseArchiver(ARCHIVE_OUTPUT, device_id, url)
+            with get_session().get(url, timeout=REQUEST_TIMEOUT, stream=True) as response:
+                response.raise_for_status()
+                body = archive_and_count(response.iter_content(STREAM_CHUNK_SIZE), archiver)
+                for row in filter_new_rows(iter_json_records(body), since):
+                    writer.add(device_id, row)
+                    row_time = parse_time(row["time"])
+                    recent_times.append(row_time)
+                    newest = row_time if newest is None or row_time > newest else newest
+                    if writer.pending >= STREAM_FLUSH_ROWS:
+                        written += sum(writer.flush().values())
+            written += sum(writer.flush().values())
+            archiver.commit()
+            if newest and advance_watermark:
+                get_watermarks().advance(device_id, newest)
+            return {"rows": written, "attempts": attempt, "bytes": bytes_received, "recent_times": sorted(recent_times)}
         except Exception as e:
-            print(f"⚠️ Attempt {attempt} failed: {e}")
-            if attempt < max_retries:
-                time.sleep(5)
-            else:
-                print("❌ All retries failed.")
+            if archiver is not None:
+                archiver.discard()
+            if attempt == MAX_RETRIES:
+                raise FetchError(str(e), attempt, bytes_received) from e
+            delay = backoff_delay(attempt)
+            print(f"⚠️ [{device_id}] Attempt {attempt} failed: {e}. Retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def last_observation_time(device_id: str) -> Optional[datetime]:
+    """The station's watermark, or None when it cannot be read."""
+    try:
+        return get_watermarks().get(device_id)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ [{device_id}] Failed to read the watermark: {e}")
+        return None
+
+
+def fetch_data(device_id: str) -> FetchResult:
+    """Fetch one station; never raises, so one station's failure cannot stop a sweep or the scheduler."""
+    now = local_now()
+    result: FetchResult = {"station_id": device_id, "ok": False, "attempts": 0, "rows": 0, "bytes": 0,
+                           "elapsed": 0.0, "error": None, "recent_times": []}
+    started = time.monotonic()
+    try:
+        since = get_watermarks().get(device_id)
+        # Only ask for the interval after the newest stored observation
+        API_URL = observations_url(device_id, since or now - INITIAL_LOOKBACK, now)
+        print(f"[{now}] Requesting: {API_URL}")
+        stats = ingest_observations(device_id, API_URL, since)
+        result.update(stats)
+        result["ok"] = True
+    except FetchError as e:
+        result["attempts"], result["bytes"], result["error"] = e.attempts, e.bytes_received, str(e)
+    except (OSError, ValueError) as e:
+        # Local storage errors, e.g. an unreadable watermark file or CSV partition
+        result["error"] = f"{type(e).__name__}: {e}"
+
+    result["elapsed"] = time.monotonic() - started
+    get_metrics().observe(result, last_observation_time(device_id))
+    if result["ok"]:
+        print(f"✅ [{device_id}] {result['rows']} rows in {result['elapsed']:.1f}s (attempt {result['attempts']})")
+    else:
+        print(f"❌ [{device_id}] Failed after {result['attempts']} attempt(s): {result['error']}")
+    return result
 
 
-def parse_to_csv(data, device_id):
+def parse_to_csv(data, device_id) -> int:
+    """Write observation rows to their monthly CSV partitions; returns the rows written."""
     rows = data if isinstance(data, list) else [data]
-    # TODO: The beginning of the month may contain data from the previous month
-    filename = f"{datetime.now().strftime('%Y%m')}.csv"
-    output = path.join(OUTPUT, device_id, filename)
+    writer = PartitionWriter(OUTPUT)
+    writer.extend(device_id, rows)
+    return sum(writer.flush().values())
 
-    with open(output, mode="a+", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=CSV_COLUMNS)
 
-        if file.tell() == 0:
-            # Header have 3 lines: Chinese names, English names, and units
-            chinese_header = {key: value for key, value in zip(CSV_COLUMNS, CSV_CHINESE_COLUMNS)}
-            writer.writerow(chinese_header)
+def fetch_stations(device_ids: List[str], concurrency: int = FETCH_CONCURRENCY) -> List[FetchResult]:
+    """Fetch every station in a bounded thread pool; each station reports its own result."""
+    for device_id in device_ids:
+        makedirs(path.join(OUTPUT, device_id), exist_ok=True)
+
+    started = time.monotonic()
+    results: List[FetchResult] = []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="fetch") as executor:
+        futures = {executor.submit(fetch_data, device_id): device_id for device_id in device_ids}
+        for future in as_completed(futures):
+            results.append(future.result())
 
-            writer.writeheader()  # Write English header
+    refresh_views()
+    get_metrics().write()
+    failed = [r["station_id"] for r in results if not r["ok"]]
+    print(f"📊 Sweep finished in {time.monotonic() - started:.1f}s: "
+          f"{len(results) - len(failed)} succeeded, {len(failed)} failed")
+    if failed:
+        print(f"❌ Failed stations: {', '.join(sorted(failed))}")
+    return results
 
-            header_units = {key: value for key, value in zip(CSV_COLUMNS, CSV_UNITS)}
-            writer.writerow(header_units)
 
-        for row in rows:
-            filtered = {key: row.get(key, "") for key in CSV_COLUMNS}
-            writer.writerow(filtered)
-            print(f"📝 Appended row: {filtered}")
+def devices_digest(devices: List[dict]) -> str:
+    """Content hash of a device list, independent of the order the API returns it in."""
+    canonical = json.dumps(sorted(devices, key=lambda d: d.get("StationID", "")), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
 
 
-def fetch_all_devices():
+def refresh_devices() -> Optional[List[dict]]:
+    """
+    Refresh devices.json from the API, rewriting it only when its content changes.
+    Sends the validators of the last response so an unchanged list costs a 304.
+    :return: The floating buoy device list, or None if neither the API nor the local file is available
+    """
+    meta = {}
+    if path.exists(DEVICES_META_FILE) and path.exists(DEVICES_FILE):
+        try:
+            with open(DEVICES_META_FILE, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError) as e:
+            # Only a validator cache: without it the list is simply fetched in full
+            print(f"⚠️ Ignoring unreadable {DEVICES_META_FILE}: {e}")
+        if not isinstance(meta, dict):
+            meta = {}
+
     try:
-        # Write a devices data file
-        API_URL = "https://nodass.namr.gov.tw/noapi/query/OBS?StationChargeID[]=OCA&StationChargeID[]=CWA&StationChargeID[]=WRA&StationChargeID[]=IHMT&StationChargeID[]=NAMR"
+        API_URL = f"{API_BASE}/query/OBS?StationChargeID[]=OCA&StationChargeID[]=CWA&StationChargeID[]=WRA&StationChargeID[]=IHMT&StationChargeID[]=NAMR"
         print(f"Fetching devices data from {API_URL}")
-        response = requests.get(API_URL, timeout=10)
-        response.raise_for_status()
-        response_data = response.json()
-
-        # Filter StationTypeID to only include "FB" (Floating Buoy)
-        devices_data = [device for device in response_data if device.get("StationTypeID") == "FB"]
-        # Convert the list of devices to JSON format
-        devices_data = json.dumps(devices_data)
-        # Write the devices data to a file (output/devices.json)
-        devices_output = path.join(OUTPUT, "devices.json")
-        with open(devices_output, "w", encoding="utf-8") as f:
-            f.write(devices_data)
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        get_rate_limiter(API_URL).acquire()
+        response = get_session().get(API_URL, headers=headers, timeout=REQUEST_TIMEOUT)
+
+        if response.status_code != 304:
+            response.raise_for_status()
+            # Filter StationTypeID to only include "FB" (Floating Buoy)
+            devices_data = [device for device in response.json() if device.get("StationTypeID") == "FB"]
+            digest = devices_digest(devices_data)
+            if digest != meta.get("sha256") or not path.exists(DEVICES_FILE):
+                atomic_write_text(DEVICES_FILE, json.dumps(devices_data))
+                print(f"🔄 Device list changed, wrote {len(devices_data)} stations to {DEVICES_FILE}")
+            else:
+                print("Device list unchanged.")
+            meta = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified"), "sha256": digest}
+            atomic_write_text(DEVICES_META_FILE, json.dumps(meta))
+            return devices_data
+        print("Device list not modified (304).")
     except requests.RequestException as e:
         print(f"❌ Failed to fetch devices data: {e}")
-        if not path.exists(path.join(OUTPUT, "devices.json")):
-            print("⚠️ No local devices data file found. Exiting.")
-            return
-        # If the request fails, try to read from the local file
-        # fetch devices data from the file (dataset/devices.json)
-        with open("dataset/buoy/devices.json", "r", encoding="utf-8") as f:
-            response_data = json.load(f)
 
-    device_ids = [device["StationID"] for device in response_data]
+    if not path.exists(DEVICES_FILE):
+        print("⚠️ No local devices data file found.")
+        return None
+    # Fall back to (or reuse on 304) the local file
+    with open(DEVICES_FILE, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def fetch_all_devices(concurrency: int = FETCH_CONCURRENCY) -> List[FetchResult]:
+    devices_data = refresh_devices()
+    if devices_data is None:
+        print("⚠️ No device list available. Exiting.")
+        return []
+
+    device_ids = [device["StationID"] for device in devices_data]
+    return fetch_stations(device_ids, concurrency)
+
+
+def split_range(start: datetime, end: datetime, chunk: timedelta) -> List[Tuple[datetime, datetime]]:
+    """Split [start, end] into consecutive API-sized chunks."""
+    chunks = []
+    while start < end:
+        chunk_end = min(start + chunk, end)
+        chunks.append((start, chunk_end))
+        start = chunk_end
+    return chunks
+
+
+class BackfillCheckpoint:
+    """Completed backfill chunks, persisted after every chunk so an interrupted run can resume."""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.lock = threading.Lock()
+        self.done: Set[str] = set()
+        if path.exists(file_path):
+            with open(file_path, "r", encoding="utf-8") as f:
+                self.done = set(json.load(f).get("done", []))
+
+    @staticmethod
+    def key(device_id: str, start: datetime, end: datetime) -> str:
+        return f"{device_id}|{start.strftime(TIME_FORMAT)}|{end.strftime(TIME_FORMAT)}"
+
+    def is_done(self, device_id: str, start: datetime, end: datetime) -> bool:
+        with self.lock:
+            return self.key(device_id, start, end) in self.done
+
+    def mark_done(self, device_id: str, start: datetime, end: datetime):
+        with self.lock:
+            self.done.add(self.key(device_id, start, end))
+            atomic_write_text(self.file_path, json.dumps({"done": sorted(self.done)}))
+
+
+def backfill_chunk(device_id: str, start: datetime, end: datetime) -> int:
+    """Fetch one chunk and write it through the partitioned writer; returns the rows written. The live watermark is not touched."""
+    return ingest_observations(device_id, observations_url(device_id, start, end), None, advance_watermark=False)["rows"]
+
+
+def backfill(device_ids: List[str], start: datetime, end: datetime, chunk: timedelta = BACKFILL_CHUNK,
+             concurrency: int = FETCH_CONCURRENCY, state_file: str = BACKFILL_STATE_FILE) -> int:
+    """
+    Fetch [start, end] for every station, running chunks in parallel under the global rate limit.
+    Chunks already recorded in `state_file` are skipped.
+    :return: Number of chunks that failed
+    """
+    checkpoint = BackfillCheckpoint(state_file)
+    pending = [(device_id, chunk_start, chunk_end)
+               for device_id in device_ids
+               for chunk_start, chunk_end in split_range(start, end, chunk)
+               if not checkpoint.is_done(device_id, chunk_start, chunk_end)]
     for device_id in device_ids:
         makedirs(path.join(OUTPUT, device_id), exist_ok=True)
-        fetch_data(device_id)
-
-# Schedule every 2 days at 08:00
-# TODO: Maybe every 2 days is too long, consider changing to 1 day
-schedule.every(2).days.at("08:00").do(fetch_all_devices)
-
-# Run immediately on startup
-fetch_all_devices()
-print("🔄 Scheduler started. Will run every 2 days.")
-while True:
-    schedule.run_pending()
-    time.sleep(3600)
+    print(f"⏪ Backfilling {len(device_ids)} station(s) from {start} to {end}: {len(pending)} chunk(s) pending")
+
+    started = time.monotonic()
+    total_rows, failed = 0, []
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="backfill") as executor:
+        futures = {executor.submit(backfill_chunk, *job): job for job in pending}
+        for i, future in enumerate(as_completed(futures), start=1):
+            device_id, chunk_start, chunk_end = futures[future]
+            try:
+                total_rows += future.result()
+                checkpoint.mark_done(device_id, chunk_start, chunk_end)
+            except Exception as e:
+                failed.append(futures[future])
+                print(f"❌ [{device_id}] Chunk {chunk_start:%Y-%m-%d}..{chunk_end:%Y-%m-%d} failed: {e}")
+            if i % 50 == 0 or i == len(pending):
+                print(f"⏳ {i}/{len(pending)} chunks, {total_rows} rows written")
+
+    refresh_views()
+    print(f"📊 Backfill finished in {time.monotonic() - started:.1f}s: {total_rows} rows, "
+          f"{len(pending) - len(failed)} chunk(s) done, {len(failed)} failed")
+    if failed:
+        print("↩️ Re-run the same command to retry the failed chunks.")
+    return len(failed)
+
+
+def replay_station(device_id: str, archive_path: str, output_path: str) -> int:
+    """
+    Rebuild a station's monthly CSVs and sidecars from its archived raw responses.
+    Months are rebuilt in a staging folder and swapped in one file at a time under the
+    partition lock. Stored rows the archive does not cover (e.g. history older than the
+    archive) are carried over, so a replay never loses data.
+    :return: Number of rows rebuilt from the archive
+    """
+    staging_path = path.join(output_path, f".replay-{device_id}")
+    shutil.rmtree(staging_path, ignore_errors=True)
+    shutil.rmtree(store_root(staging_path), ignore_errors=True)
+    shutil.rmtree(tensor_root(staging_path), ignore_errors=True)
+    shutil.rmtree(rollup_root(staging_path), ignore_errors=True)
+    try:
+        writer = PartitionWriter(staging_path)
+        rows = 0
+        for _, _, body in iter_archived_responses(archive_path, device_id):
+            for row in filter_new_rows(iter_json_records([body.encode("utf-8")]), None):
+                writer.add(device_id, row)
+                if writer.pending >= STREAM_FLUSH_ROWS:
+                    rows += sum(writer.flush(update_views=False).values())
+        # The staging folder's own views are never read; each swapped-in month is refreshed below
+        rows += sum(writer.flush(update_views=False).values())
+
+        station_path = path.join(output_path, device_id)
+        staged_path = path.join(staging_path, device_id)
+        makedirs(station_path, exist_ok=True)
+        misplaced = []
+        for filename in list_partitions(staged_path):
+            target = path.join(station_path, filename)
+            with FileLock(f"{target}.lock"):
+                if path.exists(target):
+                    carried = []
+                    for row in read_csv_rows(target):
+                        row_time = parse_time(row.get("time"))
+                        if row_time is None:
+                            continue
+                        (carried if partition_name(row_time) == filename else misplaced).append(row)
+                    merge_writer = PartitionWriter(staging_path)
+                    merge_writer.extend(device_id, carried)
+                    merge_writer.flush(update_views=False)
+                staged = path.join(staged_path, filename)
+                os.replace(staged, target)
+                if path.exists(sidecar_path(staged)):
+                    makedirs(path.dirname(sidecar_path(target)), exist_ok=True)
+                    os.replace(sidecar_path(staged), sidecar_path(target))
+                update_derived_views(output_path, target)
+        if misplaced:
+            # Rows an older writer put in the wrong month go to their own month
+            fix_writer = PartitionWriter(output_path)
+            fix_writer.extend(device_id, misplaced)
+            fix_writer.flush()
+        return rows
+    finally:
+        shutil.rmtree(staging_path, ignore_errors=True)
+        shutil.rmtree(store_root(staging_path), ignore_errors=True)
+        shutil.rmtree(tensor_root(staging_path), ignore_errors=True)
+        shutil.rmtree(rollup_root(staging_path), ignore_errors=True)
+
+
+def replay(device_ids: List[str], workers: Optional[int] = None) -> int:
+    """Rebuild derived files from the raw archive, one process per station; returns the failures."""
+    started = time.monotonic()
+    failed = 0
+    print(f"🔁 Replaying {len(device_ids)} station(s) from {ARCHIVE_OUTPUT}")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(replay_station, device_id, ARCHIVE_OUTPUT, OUTPUT): device_id for device_id in device_ids}
+        for future in as_completed(futures):
+            device_id = futures[future]
+            try:
+                print(f"✅ [{device_id}] Replayed {future.result()} rows")
+            except Exception as e:
+                failed += 1
+                print(f"❌ [{device_id}] Replay failed: {e}")
+    print(f"📊 Replay finished in {time.monotonic() - started:.1f}s: {len(device_ids) - failed} succeeded, {failed} failed")
+    return failed
+
+
+def recent_stored_times(device_id: str) -> List[datetime]:
+    """Times of the station's newest stored observations, used to seed its reporting interval."""
+    station_path = path.join(OUTPUT, device_id)
+    times: List[datetime] = []
+    for filename in reversed(list_partitions(station_path)):
+        times = sorted(read_partition_times(path.join(station_path, filename))) + times
+        if len(times) >= RECENT_TIMES_KEPT:
+            break
+    return times[-RECENT_TIMES_KEPT:]
+
+
+class StationPoller:
+    """Learns one station's reporting interval and decides when to poll it next."""
+
+    def __init__(self, station_id: str, recent_times: List[datetime]):
+        self.station_id = station_id
+        self.recent_times = deque(sorted(recent_times), maxlen=RECENT_TIMES_KEPT)
+        self.misses = 0  # Consecutive polls that failed or returned no new data
+
+    @property
+    def interval(self) -> timedelta:
+        """Median gap between recent observations, clamped to the polling bounds."""
+        times = list(self.recent_times)
+        gaps = [b - a for a, b in zip(times, times[1:]) if b > a]
+        interval = statistics.median(gaps) if gaps else DEFAULT_REPORT_INTERVAL
+        return min(max(interval, MIN_POLL_INTERVAL), MAX_POLL_INTERVAL)
+
+    def record(self, result: FetchResult):
+        for value in result["recent_times"]:
+            if not self.recent_times or value > self.recent_times[-1]:
+                self.recent_times.append(value)
+        self.misses = 0 if result["ok"] and result["rows"] > 0 else self.misses + 1
+
+    def next_delay(self, now: datetime) -> float:
+        """
+        Seconds until the next poll: shortly after the next report is expected, backing off while the station is quiet.
+        :param now: Current time as a naive UTC+8 datetime (`local_now`), like the observation times
+        """
+        interval = self.interval
+        jitter = random.uniform(0, POLL_JITTER) * interval
+        if self.misses:
+            delay = min(interval * 2 ** (self.misses - 1), MAX_POLL_INTERVAL)
+        elif self.recent_times:
+            delay = self.recent_times[-1] + interval + POLL_GRACE - now
+        else:
+            delay = interval
+        return max(delay, MIN_POLL_INTERVAL if self.misses else timedelta(0)).total_seconds() + jitter.total_seconds()
+
+
+class AdaptiveScheduler:
+    """
+    Polls every station on its own cadence from a small worker pool.
+
+    Each station is polled shortly after its next observation is expected
+    (learned from its recent timestamps), with jitter to spread the load.
+    Stations that fail or return nothing are backed off exponentially up to
+    MAX_POLL_INTERVAL. The device list is refreshed once per
+    DEVICE_REFRESH_INTERVAL to pick up new stations, and the derived views of
+    the partitions written meanwhile once per VIEW_REFRESH_INTERVAL.
+    """
+
+    def __init__(self, concurrency: int = FETCH_CONCURRENCY):
+        self.concurrency = max(1, concurrency)
+        self.pollers: Dict[str, StationPoller] = {}
+        self.queue: List[Tuple[float, str]] = []  # (due time in time.monotonic(), station_id)
+        self.next_device_refresh = 0.0
+        self.next_view_refresh = time.monotonic() + VIEW_REFRESH_INTERVAL.total_seconds()
+        self.view_refresh = None  # Future of the running view refresh
+
+    def sync_stations(self):
+        devices_data = refresh_devices()
+        if devices_data is None:
+            return
+        device_ids = {device["StationID"] for device in devices_data}
+        for device_id in sorted(device_ids - self.pollers.keys()):
+            makedirs(path.join(OUTPUT, device_id), exist_ok=True)
+            self.pollers[device_id] = StationPoller(device_id, recent_stored_times(device_id))
+            # New stations are polled right away, spread over a few seconds
+            heapq.heappush(self.queue, (time.monotonic() + random.uniform(0, 5), device_id))
+        for device_id in self.pollers.keys() - device_ids:
+            del self.pollers[device_id]
+        print(f"📡 Scheduling {len(self.pollers)} stations")
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="poll") as executor:
+            inflight = {}
+            while True:
+                now = time.monotonic()
+                if now >= self.next_device_refresh:
+                    self.sync_stations()
+                    self.next_device_refresh = now + DEVICE_REFRESH_INTERVAL.total_seconds()
+                if now >= self.next_view_refresh and (self.view_refresh is None or self.view_refresh.done()):
+                    # Runs on a worker so polling goes on; one refresh at a time
+                    self.view_refresh = executor.submit(refresh_views)
+                    self.next_view_refresh = now + VIEW_REFRESH_INTERVAL.total_seconds()
+
+                # Start due polls while workers are free
+                while self.queue and self.queue[0][0] <= now and len(inflight) < self.concurrency:
+                    _, device_id = heapq.heappop(self.queue)
+                    if device_id in self.pollers:
+                        inflight[executor.submit(fetch_data, device_id)] = device_id
+
+                get_metrics().write(force=False)
+                timeout = max(min(self.queue[0][0] - now, 60) if self.queue else 60, 0.1)
+                if not inflight:
+                    time.sleep(timeout)
+                    continue
+                done, _ = wait(inflight, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    device_id = inflight.pop(future)
+                    poller = self.pollers.get(device_id)
+                    if poller is None:
+                        continue
+                    poller.record(future.result())
+                    delay = poller.next_delay(local_now())
+                    heapq.heappush(self.queue, (time.monotonic() + delay, device_id))
+                    print(f"🕒 [{device_id}] Next poll in {delay / 60:.0f} min "
+                          f"(interval {poller.interval.total_seconds() / 60:.0f} min, misses {poller.misses})")
+
+
+def main():
+    global API_BASE, RATE_LIMIT_PER_HOST
+
+    parser = argparse.ArgumentParser(description="Fetch floating buoy observations into dataset/buoy/.")
+    parser.add_argument("--concurrency", type=int, default=FETCH_CONCURRENCY, help="Number of stations fetched in parallel")
+    parser.add_argument("--rate", type=float, default=RATE_LIMIT_PER_HOST, help="Max requests per second per host (0 disables)")
+    parser.add_argument("--api-base", default=API_BASE, help="Base URL of the observation API")
+    parser.add_argument("--once", action="store_true", help="Run a single sweep and exit")
+    subparsers = parser.add_subparsers(dest="command")
+
+    backfill_parser = subparsers.add_parser("backfill", help="Fetch a historical date range (resumable)")
+    backfill_parser.add_argument("--stations", nargs="+", help="StationIDs to backfill (default: every station in devices.json)")
+    backfill_parser.add_argument("--start", required=True, type=datetime.fromisoformat, help="Start of the range, e.g. 2023-01-01")
+    backfill_parser.add_argument("--end", type=datetime.fromisoformat, default=None, help="End of the range (default: now)")
+    backfill_parser.add_argument("--chunk-days", type=float, default=BACKFILL_CHUNK.days, help="Days requested per API call")
+    backfill_parser.add_argument("--state-file", default=BACKFILL_STATE_FILE, help="Checkpoint file used to resume")
+
+    replay_parser = subparsers.add_parser("replay", help="Rebuild CSVs and sidecars from the raw response archive")
+    replay_parser.add_argument("--stations", nargs="+", help="StationIDs to replay (default: every archived station)")
+    replay_parser.add_argument("--workers", type=int, default=None, help="Parallel processes (default: CPU count)")
+    args = parser.parse_args()
+
+    API_BASE = args.api_base.rstrip("/")
+    RATE_LIMIT_PER_HOST = args.rate
+    get_session(pool_size=args.concurrency)
+
+    if args.command == "backfill":
+        device_ids = args.stations
+        if not device_ids:
+            devices_data = refresh_devices() or []
+            device_ids = [device["StationID"] for device in devices_data]
+        failed = backfill(device_ids, args.start, args.end or local_now(), timedelta(days=args.chunk_days),
+                          args.concurrency, args.state_file)
+        raise SystemExit(1 if failed else 0)
+
+    if args.command == "replay":
+        failed = replay(args.stations or list_archived_stations(ARCHIVE_OUTPUT), args.workers)
+        raise SystemExit(1 if failed else 0)
+
+    if args.once:
+        fetch_all_devices(args.concurrency)
+        return
+
+    print("🔄 Adaptive scheduler started.")
+    AdaptiveScheduler(args.concurrency).run()
+
+
+if __name__ == "__main__":
+    main()
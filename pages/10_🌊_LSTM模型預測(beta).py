@@ -17,7 +17,7 @@ import zipfile
 import joblib
 import hashlib
 
-from utils.helpers import get_station_name_from_id, initialize_session_state, load_data
+from utils.helpers import get_station_data_span, get_station_name_from_id, initialize_session_state, load_data
 
 pio.templates.default = "plotly_white"
 
@@ -258,19 +258,20 @@ if not locations:
 
 selected_station = st.sidebar.selectbox("選擇測站:", locations, key='pages_10_lstm_station', format_func=get_station_name_from_id)
 selected_station_name = get_station_name_from_id(selected_station)
-df_initial_check = load_data(selected_station, st.session_state.get('parameter_info', {}))
+# 從資料集目錄取得可用參數與時間範圍，不必預先載入整個測站的歷史資料
+station_columns, min_time_available, max_time_available = get_station_data_span(selected_station)
 
 available_predictable_params_display_to_col = {}
-if not df_initial_check.empty:
+if station_columns:
     for col_name_config, display_name in predictable_params_config_map.items():
         param_info_for_check = st.session_state['parameter_info'].get(col_name_config, {})
         expected_names = [col_name_config.lower()]
         if "column_name_in_data" in param_info_for_check: expected_names.append(param_info_for_check["column_name_in_data"].lower())
         if "display_zh" in param_info_for_check: expected_names.append(param_info_for_check["display_zh"].lower())
         
-        target_col_to_check = next((name for name in expected_names if name in df_initial_check.columns), None)
+        target_col_to_check = next((name for name in expected_names if name in station_columns), None)
         
-        if target_col_to_check and pd.api.types.is_numeric_dtype(df_initial_check[target_col_to_check]) and df_initial_check[target_col_to_check].count() > 0:
+        if target_col_to_check and station_columns[target_col_to_check] > 0:
             available_predictable_params_display_to_col[display_name] = target_col_to_check
 
 if not available_predictable_params_display_to_col:
@@ -291,9 +292,9 @@ forecast_period_value = st.sidebar.number_input(f"預測未來多久 ({selected_
 st.sidebar.markdown("---")
 st.sidebar.subheader("訓練數據時間範圍")
 
-if not df_initial_check.empty and 'ds' in df_initial_check.columns and not df_initial_check['ds'].isnull().all():
-    min_date_available = df_initial_check['ds'].min().date()
-    max_date_available = df_initial_check['ds'].max().date()
+if min_time_available is not None:
+    min_date_available = min_time_available.date()
+    max_date_available = max_time_available.date()
 else:
     min_date_available = pd.to_datetime('1990-01-01').date()
     max_date_available = pd.Timestamp.now().date()
@@ -330,12 +331,13 @@ if st.sidebar.button("🌊 執行 LSTM 預測"):
         st.error("TensorFlow/Keras 庫不可用，無法執行 LSTM 預測。")
         st.stop()
 
-    if df_initial_check.empty or selected_param_col not in df_initial_check.columns:
+    df_loaded = load_data(selected_station, st.session_state.get('parameter_info', {}), train_start_date, train_end_date)
+    if df_loaded.empty or selected_param_col not in df_loaded.columns:
         st.error(f"所選測站 '{selected_station_name}' 的數據文件缺少參數 '{selected_param_display}'。")
         st.stop()
     
     with st.spinner("STEP 1/3: 正在預處理數據..."):
-        df_processed = df_initial_check[['ds', selected_param_col]].copy()
+        df_processed = df_loaded[['ds', selected_param_col]].copy()
         df_processed.columns = ['ds', 'y']
         
         train_start_datetime = pd.to_datetime(train_start_date)
@@ -13,7 +13,7 @@ from keras.layers import Input, Dense, Dropout, LayerNormalization, MultiHeadAtt
 from keras.callbacks import EarlyStopping
 import glob
 
-from utils.helpers import get_station_name_from_id, initialize_session_state, load_data 
+from utils.helpers import get_station_data_span, get_station_name_from_id, initialize_session_state, load_data 
 
 # 設置 TensorFlow 日誌級別，抑制 INFO 訊息
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2' 
@@ -139,15 +139,14 @@ predictable_params_config_map = {
     if info.get("type") == "linear" # 只選擇線性參數進行預測
 }
 
-# 預載入數據以動態獲取可用參數
-df_initial_check = load_data(selected_station, st.session_state.parameter_info)
+# 從資料集目錄取得可用參數與時間範圍，不必預先載入整個測站的歷史資料
+station_columns, min_time_available, max_time_available = get_station_data_span(selected_station)
 
 available_predictable_params_display_to_col = {}
 for col_name, display_name in predictable_params_config_map.items():
     col_name = col_name.lower()
-    if col_name in df_initial_check.columns and pd.api.types.is_numeric_dtype(df_initial_check[col_name]):
-        if df_initial_check[col_name].count() > 0: # 確保該列有非空數據
-            available_predictable_params_display_to_col[display_name] = col_name
+    if station_columns.get(col_name, 0) > 0: # 確保該列有非空數據
+        available_predictable_params_display_to_col[display_name] = col_name
 
 if not available_predictable_params_display_to_col:
     st.sidebar.error("載入數據後，沒有可供預測的有效數值型參數。請檢查數據文件和 `config.json` 中的參數配置。")
@@ -192,9 +191,9 @@ forecast_period_value = st.sidebar.number_input(
 st.sidebar.markdown("---")
 st.sidebar.subheader("訓練數據時間範圍")
 
-if not df_initial_check.empty and 'ds' in df_initial_check.columns:
-    min_date_available = df_initial_check['ds'].min().date()
-    max_date_available = df_initial_check['ds'].max().date()
+if min_time_available is not None:
+    min_date_available = min_time_available.date()
+    max_date_available = max_time_available.date()
 else:
     min_date_available = pd.to_datetime('1990-01-01').date() # 預設起始日期
     max_date_available = pd.Timestamp.now().date() # 預設結束日期
@@ -274,7 +273,7 @@ if st.sidebar.button("🤖 執行 Transformer 預測"):
     if not tf.test.is_built_with_cuda() and not tf.config.list_physical_devices('GPU'):
         st.warning("警告: TensorFlow 未啟用 GPU 加速。模型訓練可能較慢。")
 
-    df = df_initial_check
+    df = load_data(selected_station, st.session_state.parameter_info, train_start_date, train_end_date)
 
 
     if df.empty or selected_param_col not in df.columns:
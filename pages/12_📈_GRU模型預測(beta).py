@@ -24,7 +24,8 @@ from utils.helpers import (
     BASE_DATA_PATH_FROM_CONFIG,
     CHINESE_FONT_NAME,
     load_year_data,
-    get_available_years 
+    get_available_years,
+    get_dataset_catalog
 )
 
 # 設置 TensorFlow 日誌級別，抑制 INFO 訊息
@@ -84,14 +85,14 @@ available_predictable_params_display_to_col = {}
 if selected_station:
     current_year = pd.Timestamp.now().year
     temp_base_path = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', BASE_DATA_PATH_FROM_CONFIG))
-    temp_df_for_col_check = None
-    for y_check in range(current_year, current_year - 5, -1):
-        temp_df_for_col_check = load_year_data(temp_base_path, selected_station, y_check)
-        if temp_df_for_col_check is not None and not temp_df_for_col_check.empty: break
-    
-    if temp_df_for_col_check is not None and not temp_df_for_col_check.empty:
+    # 從資料集目錄找出近五年內最新一個有資料的年份，並取得該年有數值的欄位
+    station_catalog = get_dataset_catalog(temp_base_path, [selected_station])
+    recent_years = [y for y in station_catalog.years(selected_station) if current_year - 5 < y <= current_year]
+    columns_with_data = station_catalog.columns(selected_station, recent_years[-1:]) if recent_years else {}
+
+    if columns_with_data:
         for col_name, display_name in predictable_params_config_map.items():
-            if col_name in temp_df_for_col_check.columns and pd.api.types.is_numeric_dtype(temp_df_for_col_check[col_name]):
+            if col_name in columns_with_data:
                 available_predictable_params_display_to_col[display_name] = col_name
     else:
         st.sidebar.warning(f"無法為測站 '{selected_station_name}' 載入任何歷史數據以確認可用參數。請檢查數據檔案。")
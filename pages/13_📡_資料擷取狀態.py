@@ -0,0 +1,97 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+import os
+import json
+from utils.helpers import get_cache_stats, get_station_name_from_id, initialize_session_state, convert_df_to_csv
+from utils.storage import local_now
+
+st.set_page_config(layout="wide")
+initialize_session_state()
+st.title("📡 資料擷取狀態")
+st.write("檢視抓取程式回報的各測站資料延遲與擷取統計，不必翻閱日誌即可找出停滯的資料來源。")
+st.markdown("---")
+
+locations = st.session_state.get('locations', [])
+base_data_path = st.session_state.get('base_data_path', '')
+status_path = os.path.join(base_data_path, "fetch_status.json")
+
+if not os.path.exists(status_path):
+    st.warning(f"找不到擷取狀態檔 `{status_path}`。請確認抓取程式 (`python fetch.py`) 正在執行。")
+    st.stop()
+
+@st.cache_data
+def load_fetch_status(path, mtime):
+    """讀取抓取程式輸出的狀態檔；以檔案 mtime 作為快取鍵，檔案更新時自動重新讀取。"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+status = load_fetch_status(status_path, os.path.getmtime(status_path))
+
+with st.sidebar:
+    st.header("狀態設定")
+    stall_hours = st.slider("延遲超過幾小時視為停滯:", 1, 72, 6, key='pages_13_stall_hours')
+    if st.button("🔄 重新整理", key='pages_13_refresh_button', use_container_width=True):
+        st.rerun()
+
+# 觀測時間為 UTC+8，與主機時區無關
+now = pd.Timestamp(local_now())
+records = []
+for station_id in sorted(set(locations) | set(status.get('stations', {}))):
+    s = status.get('stations', {}).get(station_id)
+    if s is None:
+        records.append({'測站': get_station_name_from_id(station_id), '測站編號': station_id, '狀態': '無紀錄'})
+        continue
+    last_observation = pd.to_datetime(s.get('last_observation'))
+    lag_hours = (now - last_observation).total_seconds() / 3600 if pd.notna(last_observation) else None
+    records.append({
+        '測站': get_station_name_from_id(station_id),
+        '測站編號': station_id,
+        '狀態': '停滯' if lag_hours is None or lag_hours > stall_hours else '正常',
+        '資料延遲(小時)': round(lag_hours, 1) if lag_hours is not None else None,
+        '最新觀測時間': s.get('last_observation'),
+        '最後成功擷取': s.get('last_success'),
+        '擷取次數': s['fetches'],
+        '失敗次數': s['failures'],
+        '重試次數': s['retries'],
+        '寫入筆數': s['rows'],
+        '傳輸量(KB)': round(s['bytes'] / 1024, 1),
+        '平均耗時(秒)': round(s['latency_sum'] / s['fetches'], 2) if s['fetches'] else None,
+        '最後錯誤': s.get('last_error') or '',
+    })
+status_df = pd.DataFrame(records)
+
+col1, col2, col3 = st.columns(3)
+col1.metric("測站數", len(status_df))
+col2.metric("停滯/無紀錄測站", int((status_df['狀態'] != '正常').sum()))
+col3.metric("狀態檔更新時間", status.get('updated', 'N/A'))
+
+lag_df = status_df.dropna(subset=['資料延遲(小時)']) if '資料延遲(小時)' in status_df.columns else pd.DataFrame()
+if not lag_df.empty:
+    fig = px.bar(
+        lag_df.sort_values('資料延遲(小時)', ascending=False),
+        x='測站', y='資料延遲(小時)', color='狀態',
+        color_discrete_map={'正常': '#2ca02c', '停滯': '#d62728'},
+        title="各測站資料延遲"
+    )
+    fig.add_hline(y=stall_hours, line_dash="dash", line_color="gray", annotation_text="停滯門檻")
+    st.plotly_chart(fig, use_container_width=True)
+
+st.dataframe(status_df, use_container_width=True, hide_index=True)
+st.download_button(label="📥 下載狀態表 (CSV)", data=convert_df_to_csv(status_df), file_name="fetch_status.csv", mime="text/csv", key='pages_13_download_button')
+
+with st.expander("🧮 資料快取統計 (本程序)"):
+    cache_stats = get_cache_stats()
+    requests_total = cache_stats['memory_hits'] + cache_stats['disk_hits'] + cache_stats['misses']
+    cache_cols = st.columns(4)
+    cache_cols[0].metric("記憶體命中", f"{cache_stats['memory_hits']:,}", f"{cache_stats['memory_hits'] / requests_total:.0%}" if requests_total else None, delta_color="off")
+    cache_cols[1].metric("磁碟映射命中", f"{cache_stats['disk_hits']:,}")
+    cache_cols[2].metric("未命中 (重新讀取)", f"{cache_stats['misses']:,}")
+    cache_cols[3].metric("淘汰次數", f"{cache_stats['evictions']:,}")
+    st.progress(min(cache_stats['mapped_bytes'] / cache_stats['budget_bytes'], 1.0) if cache_stats['budget_bytes'] else 0.0,
+                text=f"月份快取 {cache_stats['entries']} 筆，已映射 {cache_stats['mapped_bytes'] / 1024 ** 2:.1f} / {cache_stats['budget_bytes'] / 1024 ** 2:.0f} MB")
+    st.caption(f"年度資料組合 {cache_stats['year_views']:,} 次、區間資料組合 {cache_stats['range_views']:,} 次 (由月份快取組出，不另存副本)")
+    if not cache_stats['copy_on_write']:
+        st.caption("⚠️ pandas 2 未開啟 Copy-on-Write：每次命中都交出私有副本，各工作階段不共用記憶體，快取鍵也退回雜湊整份資料 (詳見 utils/shared_cache.py)")
+    if cache_stats['scan_rows']:
+        st.caption(f"批次掃描共 {cache_stats['scan_rows']:,} 列，平均每秒 {cache_stats['scan_rows'] / max(cache_stats['scan_seconds'], 1e-9):,.0f} 列 (逐月讀取，不經過月份快取)")
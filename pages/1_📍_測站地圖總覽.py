@@ -12,7 +12,8 @@ import numpy as np
 import os
 import folium
 from streamlit_folium import folium_static, st_folium
-from utils.helpers import DatasetCategory, get_station_metadata, hsl_to_rgb, initialize_session_state, list_station_metadata, load_year_data, PARAMETER_INFO, convert_df_to_csv
+from utils.helpers import DatasetCategory, get_station_metadata, initialize_session_state, list_station_metadata, load_hourly_grid, load_rollup, load_year_data, PARAMETER_INFO, convert_df_to_csv
+from utils.storage import circular_mean
 from utils.radar import Radar
 
 # --- 1. 頁面設定與標題 ---
@@ -76,60 +77,63 @@ if analysis_mode == "靜態地圖":
                 label_visibility="collapsed",
             ) or dates[-1]['date']
 
-            radar_data = radar.load_data(date)
-            # 將雷達數據轉換為圖片
-
-            # Each point mean radar.resolution meters wave level
-            resolution = radar.resolution / 1000  # Convert to kilometers
-            [width, height] = radar_data.shape
-            [width, height] = [
-                width * resolution / 111,
-                height * resolution / (cos(np.radians(radar.latitude)) * 111)
-            ]
-            bounds = [
-                [radar.latitude + height / 2, radar.longitude + width / 2],
-                [radar.latitude - height / 2, radar.longitude - width / 2]
-            ]
-
-            # Linear normalization
-            max = np.ceil(np.nanmax(radar_data))
-            min = np.floor(np.nanmin(radar_data))
-            radar_data = (radar_data - min) / (max - min) * 255
-
-            st.html(f"""
-            <div>
-                <div style="
-                    display: flex;
-                    justify-content: space-between;
-                ">
-                        <span>{max}</span>
-                        <span>{(max + min) / 2}</span>
-                        <span>{min}</span>
-                </div>
-                <div style="
-                    height: 20px;
-                    background: linear-gradient(90deg, 
-                        hsl(360deg, 50%, 50%),
-                        hsl(225deg, 50%, 50%),
-                        hsl(90deg, 50%, 50%)
-                    );
-                ">
+            overlay = radar.load_overlay(date)
+            if overlay is None:
+                # 雷達資料由 python -m utils.radar_worker 離線準備並上色，頁面只讀取快取的 PNG，不在請求中解析掃描檔或繪製
+                if radar.is_preparing(date):
+                    st.sidebar.info("⏳ 此日期的雷達資料準備中，完成後請重新整理頁面。")
+                else:
+                    st.sidebar.info("⏳ 此日期的雷達資料尚未準備，請執行 `python -m utils.radar_worker` 後重新整理頁面。")
+            else:
+                if radar.prepared_state(date) == "stale":
+                    st.sidebar.caption("此日期有新的雷達掃描尚未準備，目前顯示先前準備的資料。")
+                # 雷達數據已依正規化方式上色並快取為 PNG (utils.radar_render)
+
+                # Each point mean radar.resolution meters wave level
+                resolution = radar.resolution / 1000  # Convert to kilometers
+                [width, height] = overlay["shape"]
+                [width, height] = [
+                    width * resolution / 111,
+                    height * resolution / (cos(np.radians(radar.latitude)) * 111)
+                ]
+                bounds = [
+                    [radar.latitude + height / 2, radar.longitude + width / 2],
+                    [radar.latitude - height / 2, radar.longitude - width / 2]
+                ]
+
+                # Linear normalization (色階兩端在上色時計算一次並與 PNG 一起快取)
+                max = overlay["vmax"]
+                min = overlay["vmin"]
+
+                st.html(f"""
+                <div>
+                    <div style="
+                        display: flex;
+                        justify-content: space-between;
+                    ">
+                            <span>{max}</span>
+                            <span>{(max + min) / 2}</span>
+                            <span>{min}</span>
+                    </div>
+                    <div style="
+                        height: 20px;
+                        background: linear-gradient(90deg, 
+                            hsl(360deg, 50%, 50%),
+                            hsl(225deg, 50%, 50%),
+                            hsl(90deg, 50%, 50%)
+                        );
+                    ">
+                    </div>
+                    <h4 style="text-align: center; margin: 0;">雷達數據顏色條</h4>
                 </div>
-                <h4 style="text-align: center; margin: 0;">雷達數據顏色條</h4>
-            </div>
-            """)
-
-            # Tanh normalization
-            # scale = 1.8
-            # radar_data = (np.tanh(radar_data / scale) + 1) / 2 * 255
+                """)
 
-            folium.raster_layers.ImageOverlay(
-                image=radar_data.astype(np.uint8).transpose(),
-                name=f"{radar.name} 雷達數據 ({date})",
-                colormap=lambda x: hsl_to_rgb(1 - float(x) / 255 * 3 / 4, 0.5, 0.5),
-                bounds=bounds,
-                opacity=0.6,
-            ).add_to(m)
+                folium.raster_layers.ImageOverlay(
+                    image=overlay["png_path"],
+                    name=f"{radar.name} 雷達數據 ({date})",
+                    bounds=bounds,
+                    opacity=0.6,
+                ).add_to(m)
 
 
     # Display map and capture interaction
@@ -186,23 +190,42 @@ elif analysis_mode == "動態向量場":
         
         with st.spinner(f"正在處理 {len(selected_stations)} 個測站的數據..."):
             all_vector_data_processed, skipped_stations = [], []
+            # 每小時平均直接讀取已依時間對齊的測站×小時張量，其他頻率讀取預先彙總的小時/日/月資料，都沒有時才載入原始資料重新取樣
+            hourly_grids = {}
+            if selected_anim_freq_pandas == 'h':
+                station_ids = [station['StationID'] for station in selected_stations]
+                hourly_grids = {col: load_hourly_grid(base_data_path, station_ids, col, selected_year_for_vector) for col in (direction_col, magnitude_col)}
             progress_bar = st.progress(0, text="準備開始...")
             for i, station in enumerate(selected_stations):
                 station_id = station['StationID']
                 station_name = station['Title']
 
                 progress_bar.progress((i + 1) / len(selected_stations), text=f"處理中: {station_name}")
-                df_station_year = load_year_data(base_data_path, station_id, selected_year_for_vector)
-                if df_station_year is None or df_station_year.empty:
-                    skipped_stations.append((station_id, f"找不到 {selected_year_for_vector} 年資料")); continue
-                if 'time' not in df_station_year.columns:
-                    df_station_year.reset_index(inplace=True); df_station_year.rename(columns={df_station_year.columns[0]: 'time'}, inplace=True)
-                df_station_year['time'] = pd.to_datetime(df_station_year['time'], errors='coerce')
-                df_station_year.dropna(subset=['time', direction_col, magnitude_col], inplace=True)
-                if df_station_year.empty:
+                df_resampled = None
+                if hourly_grids and all(station_id in grid.columns for grid in hourly_grids.values()):
+                    df_resampled = pd.DataFrame({col: grid[station_id] for col, grid in hourly_grids.items()}).dropna().rename_axis('time').reset_index()
+                else:
+                    df_rollup = load_rollup(base_data_path, station_id, (selected_year_for_vector,), (direction_col, magnitude_col), selected_anim_freq_pandas)
+                    if df_rollup is not None and {direction_col, magnitude_col}.issubset(df_rollup.columns):
+                        df_resampled = df_rollup[['time', direction_col, magnitude_col]].dropna()
+                if df_resampled is None:
+                    df_station_year = load_year_data(base_data_path, station_id, selected_year_for_vector)
+                    if df_station_year is None or df_station_year.empty:
+                        skipped_stations.append((station_id, f"找不到 {selected_year_for_vector} 年資料")); continue
+                    if 'time' not in df_station_year.columns:
+                        df_station_year.reset_index(inplace=True); df_station_year.rename(columns={df_station_year.columns[0]: 'time'}, inplace=True)
+                    df_station_year['time'] = pd.to_datetime(df_station_year['time'], errors='coerce')
+                    df_station_year.dropna(subset=['time', direction_col, magnitude_col], inplace=True)
+                    if df_station_year.empty:
+                        skipped_stations.append((station_id, "必要欄位無有效數值")); continue
+                    values = df_station_year.set_index('time')[[direction_col, magnitude_col]].apply(pd.to_numeric, errors='coerce')
+                    # 方向以單位向量平均，與張量及彙總資料一致 (350° 與 10° 的平均為 0° 而非 180°)
+                    radians = np.radians(values[direction_col])
+                    df_resampled = values[[magnitude_col]].resample(selected_anim_freq_pandas).mean()
+                    df_resampled[direction_col] = circular_mean(np.sin(radians).resample(selected_anim_freq_pandas).sum(), np.cos(radians).resample(selected_anim_freq_pandas).sum())
+                    df_resampled = df_resampled[[direction_col, magnitude_col]].dropna().reset_index()
+                if df_resampled.empty:
                     skipped_stations.append((station_id, "必要欄位無有效數值")); continue
-                df_resampled = df_station_year.set_index('time')[[direction_col, magnitude_col]].apply(pd.to_numeric, errors='coerce').resample(selected_anim_freq_pandas).mean().dropna().reset_index()
-                if df_resampled.empty: continue
                 current_station_coords = next((device for device in devices if device['Title'] == station_name), None)
                 df_resampled['arrow_angle'] = df_resampled[direction_col].apply(arrow_angle_converter)
                 df_resampled['station_name'] = station_id
@@ -2,7 +2,7 @@ import streamlit as st
 import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
-from utils.helpers import get_station_name_from_id, initialize_session_state, load_year_data, convert_df_to_csv, PARAMETER_INFO, analyze_data_quality
+from utils.helpers import get_station_name_from_id, initialize_session_state, load_year_data, convert_df_to_csv, PARAMETER_INFO, analyze_data_quality, with_layer_columns
 import numpy as np
 import io
 import datetime
@@ -237,6 +237,11 @@ if submitted or (st.session_state.current_report_data_pages2 is not None and \
     if df_display.empty:
         st.warning("數據載入或處理後為空，請重新選擇並生成報告。")
         st.stop()
+
+    # 分析用的資料不含分層流速/流向字串，下載的 CSV 依時間併回這兩欄
+    report_station_id = st.session_state.current_report_params_pages2[0]
+    df_display_export = with_layer_columns(df_display, base_data_path, report_station_id, current_year)
+    df_original_export = with_layer_columns(df_month_original, base_data_path, report_station_id, current_year)
     
     fig_wave, fig_wind, fig_weather, fig_pie = None, None, None, None
 
@@ -427,7 +432,7 @@ if submitted or (st.session_state.current_report_data_pages2 is not None and \
         st.subheader("瀏覽數據")
         st.write("顯示的數據為經過側邊欄所有預處理選項（缺失值填充、平滑等）後的最終結果。")
         st.dataframe(df_display)
-        st.download_button("📥 下載顯示數據 (CSV)", convert_df_to_csv(df_display), f"data_{station}_{year}{month:02d}.csv", "text/csv")
+        st.download_button("📥 下載顯示數據 (CSV)", convert_df_to_csv(df_display_export), f"data_{station}_{year}{month:02d}.csv", "text/csv")
 
     # ====================================================================
     #  報告下載區 (包含個別下載與打包下載)
@@ -479,8 +484,8 @@ if submitted or (st.session_state.current_report_data_pages2 is not None and \
             if fig_pie: st.download_button("📥 下載數據完整性圖", fig_pie.to_html().encode('utf-8'), f"chart_quality_{current_station}_{time_range_str.replace(' ', '')}.html", "text/html")
         with col2:
             st.markdown("##### **數據 (CSV)**")
-            st.download_button("📥 下載原始數據", convert_df_to_csv(df_month_original), f"data_original_{current_station}_{time_range_str.replace(' ', '')}.csv", "text/csv")
-            st.download_button("📥 下載處理後數據", convert_df_to_csv(df_display), f"data_processed_{current_station}_{time_range_str.replace(' ', '')}.csv", "text/csv")
+            st.download_button("📥 下載原始數據", convert_df_to_csv(df_original_export), f"data_original_{current_station}_{time_range_str.replace(' ', '')}.csv", "text/csv")
+            st.download_button("📥 下載處理後數據", convert_df_to_csv(df_display_export), f"data_processed_{current_station}_{time_range_str.replace(' ', '')}.csv", "text/csv")
         with col3:
             st.markdown("##### **摘要 (TXT)**")
             st.download_button("📥 下載文字摘要報告", summary_bytes, f"summary_{current_station}_{time_range_str.replace(' ', '')}.txt", "text/plain")
@@ -495,8 +500,8 @@ if submitted or (st.session_state.current_report_data_pages2 is not None and \
         if fig_wind: zip_file.writestr(f"charts/wind_chart.html", fig_wind.to_html())
         if fig_weather: zip_file.writestr(f"charts/weather_chart.html", fig_weather.to_html())
         if fig_pie: zip_file.writestr(f"charts/quality_chart.html", fig_pie.to_html())
-        zip_file.writestr(f"data/processed_data.csv", convert_df_to_csv(df_display))
-        zip_file.writestr(f"data/original_data.csv", convert_df_to_csv(df_month_original))
+        zip_file.writestr(f"data/processed_data.csv", convert_df_to_csv(df_display_export))
+        zip_file.writestr(f"data/original_data.csv", convert_df_to_csv(df_original_export))
         zip_file.writestr("summary_report.txt", summary_bytes)
 
     st.download_button(label="📥 **點此下載打包好的 ZIP 檔案**", data=zip_buffer.getvalue(), file_name=f"report_{current_station}_{time_range_str.replace(' ', '')}.zip", mime="application/zip")
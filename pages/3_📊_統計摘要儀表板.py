@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from utils.helpers import get_station_name_from_id, initialize_session_state, load_year_data, convert_df_to_csv, PARAMETER_INFO, analyze_data_quality
+from utils.helpers import get_station_name_from_id, get_station_years, initialize_session_state, load_rollup, load_year_data, convert_df_to_csv, PARAMETER_INFO, analyze_data_quality
 import io
 import zipfile
 
@@ -29,14 +29,9 @@ with col1:
     station_selected = st.selectbox("選擇測站", locations, key='pages_3_db_station_form', format_func=get_station_name_from_id)
     station_selected_name = get_station_name_from_id(station_selected)
 
-@st.cache_data
 def get_station_specific_years(station, years_to_check, data_path):
-    valid_years = []
-    for year in years_to_check:
-        df_check = load_year_data(data_path, station, year)
-        if df_check is not None and not df_check.empty:
-            valid_years.append(year)
-    return sorted(valid_years, reverse=True)
+    station_years = set(get_station_years(data_path, station))
+    return sorted((year for year in years_to_check if year in station_years), reverse=True)
 
 with st.spinner(f"正在查詢 {station_selected_name} 的可用年份..."):
     station_years = get_station_specific_years(station_selected, all_available_years, base_data_path)
@@ -183,13 +178,17 @@ if st.session_state.current_report_data is not None:
 
         if selected_trend_params_english:
             display_params_limited = selected_trend_params_english[:3]
+            # 概覽圖只需平均趨勢：全年讀取每日彙總、單月讀取每小時彙總，沒有彙總時才直接畫原始資料
+            df_trend = load_rollup(base_data_path, current_station, (current_year,), tuple(display_params_limited), 'D' if current_month == 0 else 'h')
+            if df_trend is not None and current_month != 0:
+                df_trend = df_trend[df_trend['time'].dt.month == current_month]
             cols_for_trend_charts = st.columns(len(display_params_limited))
             for i, param_col in enumerate(display_params_limited):
                 param_zh = PARAMETER_INFO.get(param_col, {}).get('display_zh', param_col)
                 param_unit = PARAMETER_INFO.get(param_col, {}).get('unit', '')
                 with cols_for_trend_charts[i]:
                     fig_trend = px.line(
-                        df_selection, x='time', y=param_col,
+                        df_trend if df_trend is not None and param_col in df_trend.columns else df_selection, x='time', y=param_col,
                         title=f"{param_zh} 趨勢",
                         labels={'time': '時間', param_col: f"{param_zh} ({param_unit})"}, height=200
                     )
@@ -5,37 +5,14 @@ import plotly.express as px
 import plotly.graph_objects as go
 import io
 import zipfile
+from itertools import groupby
 from scipy import signal
 from scipy.stats import mstats, linregress
 
-from utils.helpers import get_station_name_from_id, initialize_session_state
-
-# 為了讓此腳本能獨立運行，我們模擬輔助函式的功能
-# 在您的專案中，請確保 from utils.helpers import ... 是有效的
-def load_year_data(base_path, station, year):
-    """模擬從檔案載入資料的函式。"""
-    # 為了測試篩選功能，讓 StationC 在 2021 年沒有資料
-    if station == 'StationC' and year == '2021':
-        return None
-    
-    np.random.seed(hash(f"{station}{year}") % (2**32 - 1)) # 確保每次生成的假資料都一樣
-    date_rng = pd.date_range(start=f'{year}-01-01', end=f'{year}-12-31', freq='h')
-    df = pd.DataFrame(date_rng, columns=['time'])
-    df['Wave_Height_Significant'] = np.random.normal(1.5, 0.5, size=len(date_rng))
-    df['Wave_Mean_Period'] = np.random.normal(8, 1, size=len(date_rng))
-    df['Wave_Peak_Period'] = np.random.normal(12, 2, size=len(date_rng))
-    df['Wind_Speed'] = np.random.normal(10, 3, size=len(date_rng))
-    df['Wind_Gust_Speed'] = np.random.normal(15, 4, size=len(date_rng))
-    df['Air_Temperature'] = np.random.normal(25, 5, size=len(date_rng))
-    df['Sea_Temperature'] = np.random.normal(26, 3, size=len(date_rng))
-    df['Air_Pressure'] = np.random.normal(1010, 5, size=len(date_rng))
-    df['Wind_Direction'] = np.random.randint(0, 360, size=len(date_rng))
-    df['Wave_Main_Direction'] = np.random.randint(0, 360, size=len(date_rng))
-    # 隨機插入一些缺失值與異常值
-    df.loc[df.sample(frac=0.1).index, 'Wave_Height_Significant'] = np.nan
-    df.loc[df.sample(frac=0.02).index, 'Wind_Speed'] = 99.9 # 異常值
-    df.loc[df.sample(frac=0.01).index, 'Wave_Mean_Period'] = -10 # 異常值
-    return df
+from utils.helpers import (
+    cache_by_content_id, data_files_fingerprint, get_station_name_from_id, get_station_years, initialize_session_state,
+    load_year_data, scan_aggregate, scan_station_months, year_file_paths,
+)
 
 def convert_df_to_csv(df):
     """將 DataFrame 轉換為 CSV 格式的 bytes。"""
@@ -65,7 +42,7 @@ PARAM_UNITS = {
 }
 
 # --- 快取計算函式 (核心優化) ---
-@st.cache_data
+@cache_by_content_id
 def calculate_data_quality(df):
     """
     計算傳入的 DataFrame 的數據品質，包含異常值檢測 (IQR)。
@@ -74,7 +51,7 @@ def calculate_data_quality(df):
         return None
 
     quality_stats = []
-    params_to_check = [col for col in df.columns if col != 'time']
+    params_to_check = [col for col in PARAM_DISPLAY_NAMES if col in df.columns]
     total_records = len(df)
 
     for param in params_to_check:
@@ -103,13 +80,18 @@ def calculate_data_quality(df):
     
     return pd.DataFrame(quality_stats)
 
+def stations_fingerprint(base_path, stations, years):
+    """兩測站在指定年份所有月份檔的合併指紋，作為計算結果的快取鍵；資料檔更新時快取自動失效。"""
+    return data_files_fingerprint([path for station in stations for year in years for path in year_file_paths(base_path, station, year)])
+
 @st.cache_data
-def calculate_single_year_correlation(_base_path, station1, station2, year, param_col, analysis_type):
+def calculate_single_year_correlation(_base_path, station1_id, station2_id, station1, station2, year, param_col, analysis_type, fingerprint):
     """
     載入並計算單一年份的相關性資料，並包含兩測站的數據品質報告。
+    資料依測站 ID 載入，合併後的欄位以測站名稱 station1/station2 命名；fingerprint 為 stations_fingerprint 的結果，僅作為快取鍵。
     """
-    df1_raw = load_year_data(_base_path, station1, year)
-    df2_raw = load_year_data(_base_path, station2, year)
+    df1_raw = load_year_data(_base_path, station1_id, year)
+    df2_raw = load_year_data(_base_path, station2_id, year)
     
     quality1_df = calculate_data_quality(df1_raw)
     quality2_df = calculate_data_quality(df2_raw)
@@ -159,46 +141,69 @@ def calculate_single_year_correlation(_base_path, station1, station2, year, para
         
     return results
 
+def pair_moments(month_chunks, s1, s2, param_col):
+    """將同一月份兩測站的資料依時間配對，化簡為計算相關係數所需的統計量 (筆數、平均、離均差平方和與交叉乘積和)。"""
+    frames = [next((chunk['frame'] for chunk in month_chunks if chunk['station'] == station), None) for station in (s1, s2)]
+    if any(df is None for df in frames):
+        return None
+    merged = pd.merge(frames[0][['time', param_col]], frames[1][['time', param_col]], on='time', how='inner').dropna()
+    if merged.empty:
+        return None
+    x, y = merged.iloc[:, 1].astype('float64'), merged.iloc[:, 2].astype('float64')
+    x_mean, y_mean = x.mean(), y.mean()
+    return {'n': len(merged), 'x_mean': x_mean, 'y_mean': y_mean, 'x_m2': ((x - x_mean) ** 2).sum(),
+            'y_m2': ((y - y_mean) ** 2).sum(), 'xy_m2': ((x - x_mean) * (y - y_mean)).sum()}
+
+def merge_moments(a, b):
+    """合併兩組配對統計量 (平行變異數演算法)，結果與直接對合併後的資料計算相同。"""
+    if a is None or b is None:
+        return a if b is None else b
+    n = a['n'] + b['n']
+    dx, dy = b['x_mean'] - a['x_mean'], b['y_mean'] - a['y_mean']
+    weight = a['n'] * b['n'] / n
+    return {'n': n, 'x_mean': a['x_mean'] + dx * b['n'] / n, 'y_mean': a['y_mean'] + dy * b['n'] / n,
+            'x_m2': a['x_m2'] + b['x_m2'] + dx * dx * weight, 'y_m2': a['y_m2'] + b['y_m2'] + dy * dy * weight,
+            'xy_m2': a['xy_m2'] + b['xy_m2'] + dx * dy * weight}
+
 @st.cache_data
-def calculate_yearly_trend(_base_path, s1, s2, param_col, start_y, end_y):
+def calculate_yearly_trend(_base_path, s1, s2, param_col, start_y, end_y, fingerprint):
     """
     計算逐年相關性趨勢，並回傳用於計算的資料點數量。
+    逐月讀取兩測站的單一參數並累積配對統計量，不需載入整年資料。
+    fingerprint 為 stations_fingerprint 的結果，僅作為快取鍵。
     """
-    results_data = []
     years_to_analyze = range(int(start_y), int(end_y) + 1)
     bar = st.progress(0, "準備開始...")
-    for i, year_val in enumerate(years_to_analyze):
-        bar.progress((i + 1) / len(years_to_analyze), f"正在處理 {year_val} 年...")
-        df1 = load_year_data(_base_path, s1, str(year_val))
-        df2 = load_year_data(_base_path, s2, str(year_val))
-        
+
+    def add_month(moments_by_year, month_result):
+        year_val, moments = month_result
+        bar.progress((year_val - years_to_analyze.start + 1) / len(years_to_analyze), f"正在處理 {year_val} 年...")
+        moments_by_year[year_val] = merge_moments(moments_by_year.get(year_val), moments)
+        return moments_by_year
+
+    chunks = scan_station_months(_base_path, list(dict.fromkeys([s1, s2])), years_to_analyze, [param_col])
+    months = (list(group) for _, group in groupby(chunks, key=lambda chunk: (chunk['year'], chunk['month'])))
+    moments_by_year = scan_aggregate(months, lambda month_chunks: (month_chunks[0]['year'], pair_moments(month_chunks, s1, s2, param_col)), add_month, {})
+    bar.empty()
+
+    results_data = []
+    for year_val in years_to_analyze:
+        moments = moments_by_year.get(year_val)
+        pair_count = moments['n'] if moments else 0
         corr = np.nan
-        pair_count = 0
-        
-        if df1 is not None and not df1.empty and df2 is not None and not df2.empty and param_col in df1.columns and param_col in df2.columns:
-            merged = pd.merge(df1[['time', param_col]], df2[['time', param_col]], on='time', how='inner').dropna()
-            pair_count = len(merged)
-            if pair_count > 1:
-                corr = merged.iloc[:, 1].corr(merged.iloc[:, 2])
-                
+        if pair_count > 1 and moments['x_m2'] > 0 and moments['y_m2'] > 0:
+            corr = moments['xy_m2'] / np.sqrt(moments['x_m2'] * moments['y_m2'])
         results_data.append({'年份': year_val, '相關係數': corr, '配對資料點數': pair_count})
-    bar.empty()
-    
+
     results_df = pd.DataFrame(results_data)
     return results_df
 
-@st.cache_data
 def get_common_available_years(_base_path, station1, station2, all_years):
     """
-    查詢兩個指定測站共同擁有資料的年份列表。
+    從資料集目錄查詢兩個指定測站共同擁有資料的年份列表。
     """
-    common_years = []
-    for year in all_years:
-        df1_check = load_year_data(_base_path, station1, year)
-        if df1_check is not None and not df1_check.empty:
-            df2_check = load_year_data(_base_path, station2, year)
-            if df2_check is not None and not df2_check.empty:
-                common_years.append(year)
+    shared_years = set(get_station_years(_base_path, station1)) & set(get_station_years(_base_path, station2))
+    common_years = [year for year in all_years if int(year) in shared_years]
     return sorted(common_years, reverse=True)
 
 # --- 繪圖與UI渲染輔助函式 ---
@@ -517,6 +522,7 @@ def run_single_year_analysis(locations, available_years, base_data_path):
                 # 只有在所有條件都滿足時，才設定分析參數並啟用按鈕
                 if param_col:
                     analysis_params = {
+                        "station1_id": station1, "station2_id": station2,
                         "station1": station1_name, "station2": station2_name, "year": year, 
                         "param_col": param_col, "analysis_type": analysis_type
                     }
@@ -530,7 +536,8 @@ def run_single_year_analysis(locations, available_years, base_data_path):
         # 所以這裡不再需要 `if p.get("station1") == p.get("station2")` 的檢查。
 
         with st.spinner(f'正在載入與分析 {p["station1"]} vs {p["station2"]} 在 {p["year"]}年 的資料...'):
-            results = calculate_single_year_correlation(base_data_path, p["station1"], p["station2"], p["year"], p["param_col"], p["analysis_type"])
+            fingerprint = stations_fingerprint(base_data_path, [p["station1_id"], p["station2_id"]], [p["year"]])
+            results = calculate_single_year_correlation(base_data_path, p["station1_id"], p["station2_id"], p["station1"], p["station2"], p["year"], p["param_col"], p["analysis_type"], fingerprint)
 
         with st.expander("📊 點此查看輸入數據的品質概覽", expanded=True):
             col1, col2 = st.columns(2)
@@ -624,6 +631,7 @@ def run_yearly_trend_analysis(locations, available_years, base_data_path):
                 chart_type = st.selectbox('圖表類型:', ['長條圖', '折線圖', '面積圖', '散佈圖 (含趨勢線)'], key='chart_type')
                 
                 analysis_params = {
+                    "s1_id": s1, "s2_id": s2,
                     "s1": s1_name, "s2": s2_name, "param_col": param_col, "param_disp": param_disp,
                     "start_y": start_y, "end_y": end_y, "chart_type": chart_type
                 }
@@ -633,7 +641,8 @@ def run_yearly_trend_analysis(locations, available_years, base_data_path):
         p = analysis_params
         # 同樣地，這裡不再需要檢查 s1 == s2
 
-        results_df = calculate_yearly_trend(base_data_path, p["s1"], p["s2"], p["param_col"], p["start_y"], p["end_y"])
+        fingerprint = stations_fingerprint(base_data_path, [p["s1_id"], p["s2_id"]], range(int(p["start_y"]), int(p["end_y"]) + 1))
+        results_df = calculate_yearly_trend(base_data_path, p["s1_id"], p["s2_id"], p["param_col"], p["start_y"], p["end_y"], fingerprint)
         st.success("計算完成！")
         
         if results_df['相關係數'].dropna().empty:
@@ -664,13 +673,6 @@ def run_yearly_trend_analysis(locations, available_years, base_data_path):
 
 def main():
     """主函數，根據選擇的模式調用對應的分析函式"""
-    # 模擬從主頁面載入 session state
-    if 'locations' not in st.session_state:
-        st.session_state.locations = ['StationA', 'StationB', 'StationC']
-        st.session_state.available_years = ['2021', '2022', '2023']
-        st.session_state.base_data_path = '.'
-        st.info("偵測到測試模式，正在使用範例資料。")
-
     locations = st.session_state.get('locations', [])
     base_data_path = st.session_state.get('base_data_path', '')
     available_years = st.session_state.get('available_years', [])
@@ -1,11 +1,10 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from utils.helpers import get_station_name_from_id, load_year_data, prepare_windrose_data, convert_df_to_csv, PARAMETER_INFO, load_single_file, initialize_session_state
+from utils.helpers import CSV_COLUMNS, cache_by_content_id, get_dataset_catalog, get_station_name_from_id, get_station_years, load_station_range, prepare_windrose_data, convert_df_to_csv, PARAMETER_INFO, load_single_file, initialize_session_state
 import io
 import zipfile
 import os
-import re
 
 # 假設這些輔助函式存在於 utils/helpers.py 或其他地方
 # @st.cache_data(ttl=3600)
@@ -19,50 +18,18 @@ import re
 
 # --- 快取與輔助函式 ---
 
-@st.cache_data(ttl=3600)
-def cached_load_year_data(base_path, station, year):
-    """快取版本的 load_year_data"""
-    return load_year_data(base_path, station, year)
-
-@st.cache_data(ttl=3600)
+@cache_by_content_id
 def cached_prepare_windrose_data(df):
     """快取版本的 prepare_windrose_data"""
     return prepare_windrose_data(df)
 
-#TODO: unify helper
-@st.cache_data(ttl=3600)
 def get_available_years_for_station(base_path, station):
-    """掃描特定測站的資料目錄，找出所有包含數據的年份。"""
-    data_path = os.path.join(base_path, station)
-    if not data_path:
-        return []
-    years = set()
-    year_month_pattern = re.compile(r"(\d{4})\d{2}\.csv")
-    try:
-        for filename in os.listdir(data_path):
-            match = year_month_pattern.match(filename)
-            if match:
-                years.add(int(match.group(1)))
-    except FileNotFoundError:
-        return []
-    return sorted(list(years))
-
-@st.cache_data(ttl=3600)
+    """從資料集目錄查詢特定測站有資料的年份。"""
+    return get_station_years(base_path, station)
+
 def get_available_months_for_year(base_path, station, year):
-    """對於給定的測站和年份，找出所有存在數據的月份。"""
-    data_path = os.path.join(base_path, station)
-    if not data_path:
-        return []
-    months = set()
-    year_month_pattern = re.compile(r"(\d{4})(\d{2})\.csv")
-    try:
-        for filename in os.listdir(data_path):
-            match = year_month_pattern.match(filename)
-            if match and int(match.group(1)) == year:
-                months.add(int(match.group(2)))
-    except FileNotFoundError:
-        return []
-    return sorted(list(months))
+    """對於給定的測站和年份，從資料集目錄找出所有存在數據的月份。"""
+    return sorted(int(month[4:]) for month in get_dataset_catalog(base_path, [station]).months(station, year))
 
 
 # --- Streamlit App 主體 ---
@@ -150,18 +117,12 @@ if analysis_mode == "單期分析":
         if start_year > end_year or (start_year == end_year and start_month > end_month):
             st.error("錯誤：開始日期不能晚於結束日期。")
         else:
-            with st.spinner(f"正在為 {get_station_name_from_id(station)} 載入 {start_year} 年至 {end_year} 年的資料..."):
-                all_dfs = [cached_load_year_data(base_data_path, station, year) for year in range(start_year, end_year + 1)]
-                all_dfs = [df for df in all_dfs if df is not None]
-                if not all_dfs:
-                    st.error(f"在 {start_year} 年至 {end_year} 年的範圍內找不到 {station} 的任何資料。")
-                    st.stop()
-                combined_df = pd.concat(all_dfs, ignore_index=True)
-
             start_date = pd.to_datetime(f'{start_year}-{start_month:02d}-01')
             end_date = pd.to_datetime(f'{end_year}-{end_month:02d}-01') + pd.offsets.MonthEnd(0)
-            data_to_plot = combined_df[(combined_df['time'] >= start_date) & (combined_df['time'] <= end_date)]
-            
+            with st.spinner(f"正在為 {get_station_name_from_id(station)} 載入 {start_year} 年至 {end_year} 年的資料..."):
+                # 直接載入區間資料 (帶有內容 ID)，風玫瑰圖的快取不必重新雜湊整段資料
+                data_to_plot = load_station_range(base_data_path, station, tuple(CSV_COLUMNS), start_date, end_date)
+
             if data_to_plot.empty:
                 st.error(f"在指定的區間內找不到任何資料可供分析。")
                 st.session_state.analysis_results = None
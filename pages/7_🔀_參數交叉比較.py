@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from utils.helpers import get_station_name_from_id, load_year_data, PARAMETER_INFO, initialize_session_state
+from utils.helpers import cache_by_content_id, get_station_name_from_id, get_station_years, load_year_data, PARAMETER_INFO, initialize_session_state
 import io
 from zipfile import ZipFile
 from scipy.stats import linregress
@@ -28,17 +28,12 @@ if not all_available_years:
     st.stop()
 
 # --- 輔助函式 (修改處) ---
-@st.cache_data
 def get_station_specific_years(station, years_to_check, data_path):
-    """根據一個預先定義好的年份列表，檢查特定測站有哪些年份實際包含資料。"""
-    valid_years = []
-    for year in years_to_check:
-        df = load_year_data(data_path, station, year)
-        if df is not None and not df.empty:
-            valid_years.append(year)
-    return sorted(valid_years, reverse=True)
-
-@st.cache_data
+    """根據一個預先定義好的年份列表，從資料集目錄查詢特定測站有哪些年份實際包含資料。"""
+    station_years = set(get_station_years(data_path, station))
+    return sorted((year for year in years_to_check if year in station_years), reverse=True)
+
+@cache_by_content_id
 def calculate_data_quality(df):
     quality_stats = []
     total_records = len(df)
@@ -62,7 +57,7 @@ def calculate_data_quality(df):
         })
     return pd.DataFrame(quality_stats)
 
-@st.cache_data
+@cache_by_content_id
 def detect_outliers(df):
     total_outlier_count = 0
     numeric_cols = df.select_dtypes(include=np.number).columns
@@ -168,8 +163,6 @@ if df_year is None or df_year.empty:
     st.error(f"❌ 找不到 {station_name} 在 {year}年 的任何資料。")
     st.session_state.analysis_run = False
 else:
-    df_year['time'] = pd.to_datetime(df_year['time'])
-    
     df_quality = calculate_data_quality(df_year)
     outlier_count = detect_outliers(df_year)
     numeric_cols = df_year.select_dtypes(include=np.number).columns
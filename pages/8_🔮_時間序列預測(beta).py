@@ -9,7 +9,7 @@ from glob import glob
 import json
 import plotly.express as px
 from sklearn.metrics import mean_squared_error, mean_absolute_error, mean_absolute_percentage_error
-from utils.helpers import get_station_name_from_id, initialize_session_state, load_data
+from utils.helpers import get_station_data_span, get_station_name_from_id, initialize_session_state, load_data
 from scipy.stats import pearsonr 
 import plotly.io as pio 
 import logging 
@@ -254,16 +254,15 @@ if not locations:
 
 selected_station = st.sidebar.selectbox("選擇測站:", locations, key='pages_8_station', format_func=get_station_name_from_id)
 
-# 預載入數據以動態獲取可用參數
-df_initial_check = load_data(selected_station, st.session_state.get('parameter_info', {}))
+# 從資料集目錄取得可用參數與時間範圍，不必預先載入整個測站的歷史資料
+station_columns, min_time_available, max_time_available = get_station_data_span(selected_station)
 
 available_predictable_params_display_to_col = {}
 for col_name, display_name in predictable_params_config_map.items():
     param_col_in_data = st.session_state.get('parameter_info', {}).get(col_name, {}).get("column_name_in_data", col_name).lower()
     
-    if param_col_in_data in df_initial_check.columns and pd.api.types.is_numeric_dtype(df_initial_check[param_col_in_data]):
-        if df_initial_check[param_col_in_data].count() > 0: 
-            available_predictable_params_display_to_col[display_name] = param_col_in_data
+    if station_columns.get(param_col_in_data, 0) > 0:
+        available_predictable_params_display_to_col[display_name] = param_col_in_data
 
 if not available_predictable_params_display_to_col:
     st.sidebar.error("載入數據後，沒有可供預測的有效數值型參數。請檢查數據文件和 `config.json` 中的參數配置。")
@@ -312,9 +311,9 @@ forecast_period_value = st.sidebar.number_input(
 st.sidebar.markdown("---")
 st.sidebar.subheader("訓練數據時間範圍")
 
-if not df_initial_check.empty and 'ds' in df_initial_check.columns and not df_initial_check['ds'].isnull().all():
-    min_date_available = df_initial_check['ds'].min().date()
-    max_date_available = df_initial_check['ds'].max().date()
+if min_time_available is not None:
+    min_date_available = min_time_available.date()
+    max_date_available = max_time_available.date()
 else:
     min_date_available = pd.to_datetime('1990-01-01').date()
     max_date_available = pd.Timestamp.now().date()
@@ -596,7 +595,7 @@ if st.sidebar.button("🔮 執行預測"):
             st.stop()
 
 
-    df_loaded = load_data(selected_station, st.session_state.get('parameter_info', {})) # 載入原始數據
+    df_loaded = load_data(selected_station, st.session_state.get('parameter_info', {}), train_start_date, train_end_date) # 只載入訓練時間範圍內的原始數據
 
     selected_station_name = get_station_name_from_id(selected_station)
 
@@ -1,7 +1,7 @@
 import streamlit as st
 import pandas as pd
 import plotly.express as px
-from utils.helpers import get_station_name_from_id, load_year_data, PARAMETER_INFO, initialize_session_state
+from utils.helpers import get_station_name_from_id, load_rollup, load_year_data, PARAMETER_INFO, initialize_session_state
 import io
 import zipfile
 
@@ -179,18 +179,35 @@ if st.session_state.get('analysis_run', False):
             st.subheader("多樣化趨勢視覺化")
             chart_type = st.radio("選擇圖表類型：", options=["線形圖", "面積圖", "散佈圖", "熱力圖"], horizontal=True, key="chart_type_selector")
             y_axis_title = f"{PARAMETER_INFO[result_param_col]['display_zh']} ({PARAMETER_INFO[result_param_col]['unit']})"
+
+            def trend_frame(freq):
+                """各測站依 freq 的平均值：優先讀取預先彙總的資料，沒有彙總時才由原始資料重新取樣。"""
+                frames = []
+                for station_id, station_name in zip(results['selected_stations'], result_stations):
+                    df = load_rollup(base_data_path, station_id, (result_year,), (result_param_col,), freq)
+                    if df is None or result_param_col not in df.columns:
+                        df = combined_df[combined_df['測站'] == station_name].set_index('time')[[result_param_col]].resample(freq).mean().reset_index()
+                    df = df[['time', result_param_col]].dropna()
+                    df['測站'] = station_name
+                    frames.append(df)
+                return pd.concat(frames, ignore_index=True)
+
             fig = None
+            if chart_type != "熱力圖":
+                resolution_opts = {'D': '每日平均', 'h': '每小時平均', None: '原始資料'}
+                resolution = st.radio("資料解析度：", options=list(resolution_opts.keys()), format_func=lambda x: resolution_opts[x], horizontal=True, key="trend_resolution_selector")
+                trend_df = combined_df if resolution is None else trend_frame(resolution)
             if chart_type == "線形圖":
-                fig = px.line(combined_df, x='time', y=result_param_col, color='測站', title=f"{result_year} 年 {result_param_display} 趨勢 (線形圖)", labels={'time': '時間', result_param_col: y_axis_title, '測站': '測站'})
+                fig = px.line(trend_df, x='time', y=result_param_col, color='測站', title=f"{result_year} 年 {result_param_display} 趨勢 (線形圖)", labels={'time': '時間', result_param_col: y_axis_title, '測站': '測站'})
             elif chart_type == "面積圖":
-                fig = px.area(combined_df, x='time', y=result_param_col, color='測站', title=f"{result_year} 年 {result_param_display} 趨勢 (面積圖)", labels={'time': '時間', result_param_col: y_axis_title, '測站': '測站'})
+                fig = px.area(trend_df, x='time', y=result_param_col, color='測站', title=f"{result_year} 年 {result_param_display} 趨勢 (面積圖)", labels={'time': '時間', result_param_col: y_axis_title, '測站': '測站'})
             elif chart_type == "散佈圖":
-                fig = px.scatter(combined_df, x='time', y=result_param_col, color='測站', title=f"{result_year} 年 {result_param_display} 數據分佈 (散佈圖)", labels={'time': '時間', result_param_col: y_axis_title, '測站': '測站'}, opacity=0.6)
+                fig = px.scatter(trend_df, x='time', y=result_param_col, color='測站', title=f"{result_year} 年 {result_param_display} 數據分佈 (散佈圖)", labels={'time': '時間', result_param_col: y_axis_title, '測站': '測站'}, opacity=0.6)
             elif chart_type == "熱力圖":
-                freq_opts = {'D': '每日平均', 'W': '每週平均', 'M': '每月平均'}
+                freq_opts = {'D': '每日平均', 'W': '每週平均', 'ME': '每月平均'}
                 freq = st.selectbox("選擇時間聚合頻率：", options=list(freq_opts.keys()), format_func=lambda x: freq_opts[x])
                 try:
-                    resampled = combined_df.set_index('time').groupby('測站')[result_param_col].resample(freq).mean().reset_index()
+                    resampled = trend_frame(freq)
                     pivoted = resampled.pivot(index='測站', columns='time', values=result_param_col)
                     fig = px.imshow(pivoted, labels=dict(x="時間", y="測站", color=y_axis_title), aspect="auto", title=f"{result_year} 年 {result_param_display} 熱力圖 ({freq_opts[freq]})")
                 except Exception as e: st.error(f"繪製熱力圖時發生錯誤: {e}")
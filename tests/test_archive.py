@@ -0,0 +1,28 @@
+"""Tests of the raw response archive."""
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from utils.archive import ResponseArchiver, iter_archived_responses
+from utils.storage import TIME_FORMAT
+
+
+@pytest.mark.parametrize("host_tz", ["UTC", "America/New_York", "Asia/Taipei"])
+def test_segments_and_fetch_times_are_utc8_whatever_the_host_zone(host_tz, tmp_path, monkeypatch):
+    monkeypatch.setenv("TZ", host_tz)
+    time.tzset()
+    try:
+        before = datetime.now(timezone(timedelta(hours=8))).replace(tzinfo=None, microsecond=0)
+        archiver = ResponseArchiver(str(tmp_path), "TEST00", "http://stand-in/obs")
+        archiver.write(b"[]")
+        archiver.commit()
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+    (fetched_at, url, body), = iter_archived_responses(str(tmp_path), "TEST00")
+    assert body == "[]"
+    assert timedelta(0) <= datetime.strptime(fetched_at, TIME_FORMAT) - before < timedelta(seconds=5)
+    assert os.path.basename(archiver.segment_path) == f"{datetime.strptime(fetched_at, TIME_FORMAT):%Y%m%d}.jsonl.gz"
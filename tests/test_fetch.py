@@ -0,0 +1,304 @@
+"""
+Tests of the fetch engine against a local stand-in of the observation API.
+
+The stand-in is a threaded ``http.server`` that serves a device list of
+``stations`` floating buoys and, for each of them, an observation array after
+a configurable delay, recording when every request arrived. Run from the
+repository root: ``python -m pytest tests``.
+"""
+import json
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fetch
+
+SERVER_DELAY = 0.3  # Seconds the stand-in waits before answering an observation request
+STATIONS = 8
+
+
+def observation_rows(station_id: str, count: int) -> list:
+    start = datetime(2024, 1, 1)
+    return [{"StationID": station_id, "time": (start + timedelta(hours=i)).strftime(fetch.TIME_FORMAT),
+             "Wind_Speed": f"{i % 17 * 0.5:.1f}", "Wave_Height_Significant": f"{i % 7 * 0.25:.2f}"}
+            for i in range(count)]
+
+
+class StandInAPI:
+    """Threaded HTTP server answering the device list and observation endpoints."""
+
+    def __init__(self, stations: int, delay: float = 0.0, rows: int = 3):
+        self.station_ids = [f"TEST{i:02d}" for i in range(stations)]
+        self.delay = delay
+        self.bodies = {sid: json.dumps(observation_rows(sid, rows)).encode("utf-8") for sid in self.station_ids}
+        self.request_times = []
+        self.lock = threading.Lock()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with api.lock:
+                    api.request_times.append(time.monotonic())
+                if self.path.startswith("/query/OBS"):
+                    body = json.dumps([{"StationID": sid, "StationTypeID": "FB"} for sid in api.station_ids]).encode("utf-8")
+                else:
+                    time.sleep(api.delay)
+                    body = api.bodies.get(self.path.split("/")[4], b"[]")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def use_output(monkeypatch, folder):
+    """Point every output of the fetcher at `folder` and reset its shared state."""
+    output = folder / "buoy"
+    output.mkdir(parents=True)
+    monkeypatch.setattr(fetch, "OUTPUT", f"{output}/")
+    monkeypatch.setattr(fetch, "ARCHIVE_OUTPUT", f"{folder / 'buoy_archive'}/")
+    for name in ["DEVICES_FILE", "DEVICES_META_FILE", "STATUS_FILE", "METRICS_FILE", "WATERMARK_FILE"]:
+        monkeypatch.setattr(fetch, name, str(output / getattr(fetch, name).split("/")[-1]))
+    monkeypatch.setattr(fetch, "_watermarks", None)
+    monkeypatch.setattr(fetch, "_rate_limiters", {})
+    monkeypatch.setattr(fetch, "_metrics", fetch.FetchMetrics())
+
+
+@pytest.fixture
+def fetch_env(tmp_path, monkeypatch):
+    use_output(monkeypatch, tmp_path)
+    monkeypatch.setattr(fetch, "RATE_LIMIT_PER_HOST", 0)
+
+
+def timed_sweep(device_ids, concurrency):
+    started = time.monotonic()
+    results = fetch.fetch_stations(device_ids, concurrency)
+    return time.monotonic() - started, results
+
+
+def test_concurrent_sweep_beats_serial(fetch_env, tmp_path, monkeypatch):
+    # The derived-view refresh after each sweep costs the same either way and, on a loaded machine, can
+    # dwarf the server delay being overlapped; leave it out of the timing
+    monkeypatch.setattr(fetch, "refresh_views", lambda: None)
+    with StandInAPI(STATIONS, delay=SERVER_DELAY) as api:
+        monkeypatch.setattr(fetch, "API_BASE", api.url)
+        serial_seconds, serial = timed_sweep(api.station_ids, concurrency=1)
+        # Into an empty dataset again, so the second sweep writes the same rows
+        use_output(monkeypatch, tmp_path / "concurrent")
+        concurrent_seconds, concurrent = timed_sweep(api.station_ids, concurrency=STATIONS)
+
+    assert all(r["ok"] for r in serial + concurrent)
+    assert sorted(r["rows"] for r in serial) == sorted(r["rows"] for r in concurrent) == [3] * STATIONS
+    assert serial_seconds >= STATIONS * SERVER_DELAY
+    # Overlapping the server delay should win by far more than the per-station write cost
+    assert concurrent_seconds < serial_seconds / 2
+
+
+class FakeClock:
+    """Stand-in for the `time` module inside fetch: sleeping advances a shared virtual clock instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.lock = threading.Lock()
+        self.last_read = threading.local()
+
+    def monotonic(self) -> float:
+        with self.lock:
+            self.last_read.value = self.now
+            return self.now
+
+    def sleep(self, seconds: float):
+        # Sleepers overlap like real ones: each wakes at its own deadline, at least a microsecond later
+        with self.lock:
+            self.now = max(self.now, self.last_read.value + max(seconds, 1e-6))
+
+
+def test_rate_limiter_grants_at_most_burst_plus_rate_per_window(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(fetch, "time", clock)
+    rate, burst = 5.0, 3
+    limiter = fetch.RateLimiter(rate, burst)
+    grants, grants_lock = [], threading.Lock()
+
+    def worker():
+        for _ in range(10):
+            limiter.acquire()
+            # The clock reading the limiter granted the token at (taken under its lock)
+            with grants_lock:
+                grants.append(clock.last_read.value)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    grants.sort()
+    assert len(grants) == 40
+    for i, start in enumerate(grants):
+        for j in range(i, len(grants)):
+            # Within any window of t seconds the bucket allows at most burst + rate * t tokens
+            assert j - i + 1 <= burst + rate * (grants[j] - start) + 1e-9
+    # And it does not throttle harder than that: the last token comes when the bucket allows it
+    assert grants[-1] == pytest.approx((len(grants) - burst) / rate, abs=1e-3)
+
+
+def test_rate_limited_sweep_is_not_faster_than_the_rate(fetch_env, monkeypatch):
+    """Smoke check through HTTP: only a lower bound on the duration, which load cannot break."""
+    rate = 10.0
+    monkeypatch.setattr(fetch, "RATE_LIMIT_PER_HOST", rate)
+    with StandInAPI(STATIONS * 2) as api:
+        monkeypatch.setattr(fetch, "API_BASE", api.url)
+        started = time.monotonic()
+        results = fetch.fetch_all_devices(concurrency=STATIONS)
+        last_request = max(api.request_times)
+
+    assert len(results) == STATIONS * 2 and all(r["ok"] for r in results)
+    # Device list plus one request per station, all through the same token bucket
+    assert len(api.request_times) == STATIONS * 2 + 1
+    burst = fetch.get_rate_limiter(api.url).capacity
+    assert last_request - started >= (len(api.request_times) - burst) / rate
+
+
+def test_streamed_records_match_json_loads_in_bounded_memory():
+    with StandInAPI(1, rows=60000) as api:
+        payload = api.bodies[api.station_ids[0]]
+        expected = json.loads(payload)
+        assert len(payload) > 4 * 1024 * 1024
+
+        tracemalloc.start()
+        try:
+            url = fetch.observations_url(api.station_ids[0], datetime(2024, 1, 1), datetime(2024, 1, 2))
+            url = url.replace(fetch.API_BASE, api.url)
+            decoded = mismatches = 0
+            with fetch.get_session().get(url, stream=True, timeout=10) as response:
+                response.raise_for_status()
+                for record in fetch.iter_json_records(response.iter_content(fetch.STREAM_CHUNK_SIZE)):
+                    mismatches += record != expected[decoded]
+                    decoded += 1
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+    assert decoded == len(expected)
+    assert mismatches == 0
+    # Only the undecoded tail of the body is held, never the whole payload
+    assert peak < len(payload) / 8, f"peak {peak:,} bytes for a {len(payload):,}-byte payload"
+
+
+@pytest.mark.parametrize("host_tz", ["UTC", "America/New_York", "Asia/Taipei"])
+def test_poll_delay_ignores_host_time_zone(host_tz, monkeypatch):
+    monkeypatch.setenv("TZ", host_tz)
+    time.tzset()
+    try:
+        # As the API reports it, converted to naive UTC+8 like every stored time
+        newest = fetch.parse_time(datetime.now(timezone.utc).replace(microsecond=0).isoformat())
+        poller = fetch.StationPoller("TEST00", [newest - timedelta(hours=1), newest])
+        monkeypatch.setattr(fetch, "POLL_JITTER", 0)
+        delay = poller.next_delay(fetch.local_now())
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+    expected = (timedelta(hours=1) + fetch.POLL_GRACE).total_seconds()
+    assert expected - 5 <= delay <= expected
+
+
+def test_storage_errors_fail_the_station_instead_of_the_sweep(fetch_env, tmp_path, monkeypatch):
+    monkeypatch.setattr(fetch, "BACKOFF_BASE", 0)
+    with StandInAPI(2) as api:
+        monkeypatch.setattr(fetch, "API_BASE", api.url)
+        # The archive folder cannot be created under a regular file
+        (tmp_path / "not_a_folder").write_text("")
+        monkeypatch.setattr(fetch, "ARCHIVE_OUTPUT", f"{tmp_path / 'not_a_folder'}/")
+        archive_failures = fetch.fetch_stations(api.station_ids, concurrency=2)
+
+    assert [r["ok"] for r in archive_failures] == [False] * 2
+    assert all(r["error"] for r in archive_failures)
+    assert all(r["attempts"] == fetch.MAX_RETRIES for r in archive_failures)
+
+
+def test_corrupt_watermark_file_is_moved_aside_and_rebuilt(fetch_env, tmp_path, monkeypatch):
+    write_stored_rows("TEST00", datetime(2023, 12, 31), 2)
+    with open(fetch.WATERMARK_FILE, "w", encoding="utf-8") as f:
+        f.write("{not json")
+    with StandInAPI(2) as api:
+        monkeypatch.setattr(fetch, "API_BASE", api.url)
+        results = fetch.fetch_stations(api.station_ids, concurrency=2)
+
+    assert [r["ok"] for r in results] == [True, True]
+    assert [p.name.startswith("watermarks.json.corrupt-") for p in (tmp_path / "buoy").glob("watermarks.json.*")] == [True]
+    with open(fetch.WATERMARK_FILE, "r", encoding="utf-8") as f:
+        assert json.load(f) == {"TEST00": "2024-01-01T02:00:00", "TEST01": "2024-01-01T02:00:00"}
+
+
+def write_stored_rows(device_id: str, start: datetime, count: int):
+    writer = fetch.PartitionWriter(fetch.OUTPUT)
+    writer.extend(device_id, [{"StationID": device_id, "time": (start + timedelta(hours=i)).strftime(fetch.TIME_FORMAT),
+                               "Wind_Speed": "1.0"} for i in range(count)])
+    writer.flush(update_views=False)
+
+
+def test_first_advance_never_moves_the_watermark_behind_stored_data(fetch_env):
+    # Stored data but no watermarks.json entry yet, as right after upgrading
+    write_stored_rows("TEST00", datetime(2024, 6, 1), 3)
+    watermarks = fetch.get_watermarks()
+
+    watermarks.advance("TEST00", datetime(2024, 1, 1, 2))
+
+    assert watermarks.get("TEST00") == datetime(2024, 6, 1, 2)
+    assert fetch.WatermarkStore(fetch.WATERMARK_FILE).get("TEST00") == datetime(2024, 6, 1, 2)
+
+
+def test_backfill_leaves_the_live_watermark_alone(fetch_env, tmp_path, monkeypatch):
+    # TEST00 has a watermark older than the backfilled rows, TEST01 newer CSVs and no entry yet
+    with open(fetch.WATERMARK_FILE, "w", encoding="utf-8") as f:
+        json.dump({"TEST00": "2023-12-31T00:00:00"}, f)
+    write_stored_rows("TEST01", datetime(2024, 6, 1), 3)
+    with open(fetch.WATERMARK_FILE, "rb") as f:
+        before = f.read()
+
+    with StandInAPI(2) as api:
+        monkeypatch.setattr(fetch, "API_BASE", api.url)
+        failed = fetch.backfill(api.station_ids, datetime(2024, 1, 1), datetime(2024, 1, 2),
+                                state_file=str(tmp_path / "backfill_state.json"))
+
+    assert failed == 0
+    assert len(fetch.read_partition_times(str(tmp_path / "buoy" / "TEST00" / "202401.csv"))) == 3
+    with open(fetch.WATERMARK_FILE, "rb") as f:
+        assert f.read() == before
+    watermarks = fetch.WatermarkStore(fetch.WATERMARK_FILE)
+    assert watermarks.get("TEST00") == datetime(2023, 12, 31)
+    assert watermarks.get("TEST01") == datetime(2024, 6, 1, 2)
+
+
+def test_corrupt_device_validators_fall_back_to_a_full_fetch(fetch_env, monkeypatch):
+    with open(fetch.DEVICES_FILE, "w", encoding="utf-8") as f:
+        json.dump([], f)
+    with open(fetch.DEVICES_META_FILE, "w", encoding="utf-8") as f:
+        f.write('{"etag": "W/\\"trunc')
+    with StandInAPI(3) as api:
+        monkeypatch.setattr(fetch, "API_BASE", api.url)
+        devices = fetch.refresh_devices()
+
+    assert [device["StationID"] for device in devices] == api.station_ids
+    with open(fetch.DEVICES_META_FILE, "r", encoding="utf-8") as f:
+        assert json.load(f)["sha256"] == fetch.devices_digest(devices)
@@ -0,0 +1,31 @@
+"""Tests of the radar overlays read by the map page."""
+import os
+
+import numpy as np
+
+from utils import radar
+from utils.radar import Radar
+from utils.radar_prep import prepared_path
+from utils.radar_render import OVERLAY_FOLDER, render_overlay
+
+
+def station(tmp_path, monkeypatch) -> Radar:
+    station_path = tmp_path / "radar" / "R1"
+    (station_path / "20240101").mkdir(parents=True)
+    monkeypatch.setattr(radar, "get_data_path", lambda category, station_id: str(station_path))
+    return Radar({"StationID": "R1", "StationNameLocal": "R1", "CenterLatitude": 25.0, "CenterLongitude": 121.5}, 2.5)
+
+
+def test_page_reads_only_overlays_rendered_by_the_worker(tmp_path, monkeypatch):
+    r = station(tmp_path, monkeypatch)
+    date_folder = str(tmp_path / "radar" / "R1" / "20240101")
+    assert r.load_overlay("2024-01-01") is None
+
+    # Prepared but not rendered yet: the page must not render it in the request
+    np.save(prepared_path(date_folder), np.arange(12, dtype=np.float32).reshape(3, 4))
+    assert r.load_overlay("2024-01-01") is None
+    assert not os.path.exists(os.path.join(date_folder, OVERLAY_FOLDER))
+
+    rendered = render_overlay(date_folder)
+    assert r.load_overlay("2024-01-01") == rendered
+    assert rendered["shape"] == [3, 4] and os.path.exists(rendered["png_path"])
@@ -0,0 +1,54 @@
+"""Tests of the rollup pyramid."""
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+from utils.rollup import CIRCULAR_STATS, LEVELS, RollupStore
+from utils.storage import TIME_FORMAT, PartitionWriter
+from utils.tensor import TensorStore
+
+
+def angle_diff(a, b):
+    return ((a - b + 180) % 360 - 180).abs()
+
+
+def write_directions(base_path: str, start: datetime, count: int):
+    """10-minute wind directions scattered around north, where an arithmetic mean would point south."""
+    rng = np.random.default_rng(0)
+    rows = [{"StationID": "S", "time": (start + timedelta(minutes=10 * i)).strftime(TIME_FORMAT),
+             "Wind_Direction": f"{(355 + rng.normal(0, 15)) % 360:.2f}", "Wind_Speed": "5"} for i in range(count)]
+    writer = PartitionWriter(base_path)
+    writer.extend("S", rows)
+    writer.flush()
+    return pd.DataFrame(rows).astype({"time": "datetime64[ns]", "Wind_Direction": "float64"})
+
+
+def test_direction_means_are_circular_like_the_tensor(tmp_path):
+    base_path = str(tmp_path / "buoy")
+    raw = write_directions(base_path, datetime(2024, 1, 1), 6 * 24 * 3)
+    store = RollupStore(base_path)
+
+    hourly = store.resample("S", [2024], ["Wind_Direction"], "h").set_index("time")["mean"]
+    tensor = TensorStore(base_path).year_frame(2024, "Wind_Direction", ["S"])["S"].reindex(hourly.index)
+    assert angle_diff(hourly, tensor).max() < 1e-3
+
+    daily = store.resample("S", [2024], ["Wind_Direction"], "D").set_index("time")["mean"]
+    radians = np.radians(raw.set_index("time")["Wind_Direction"])
+    expected = np.degrees(np.arctan2(np.sin(radians).resample("D").sum(), np.cos(radians).resample("D").sum())) % 360
+    assert angle_diff(daily, expected).max() < 1e-3
+    assert (angle_diff(daily, pd.Series(355.0, index=daily.index)) < 10).all()
+
+
+def test_rollups_without_direction_sums_are_rebuilt(tmp_path):
+    base_path = str(tmp_path / "buoy")
+    write_directions(base_path, datetime(2024, 1, 1), 6 * 24)
+    store = RollupStore(base_path)
+    for level in LEVELS:
+        file_path = store.rollup_path("S", 2024, level)
+        pd.read_parquet(file_path).drop(columns=CIRCULAR_STATS).to_parquet(file_path, index=False)
+    assert store.resample("S", [2024], ["Wind_Direction"], "D") is None
+
+    write_directions(base_path, datetime(2024, 2, 1), 6 * 24)
+    daily = store.resample("S", [2024], ["Wind_Direction"], "D")
+    assert daily is not None and len(daily) == 2
@@ -0,0 +1,65 @@
+"""Tests of the memory-mapped frame cache shared between sessions and processes."""
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from utils import shared_cache
+from utils.shared_cache import SharedFrameCache
+
+
+def month_frame() -> pd.DataFrame:
+    return pd.DataFrame({
+        "time": pd.date_range("2024-01-01", periods=24, freq="h"),
+        "StationID": pd.Categorical(["TEST00"] * 24),
+        "Wind_Speed": np.arange(24, dtype=np.float32),
+    })
+
+
+def test_entry_pruned_before_mapping_is_rebuilt(tmp_path, monkeypatch):
+    key_path = str(tmp_path / "TEST00" / "202401")
+    SharedFrameCache().get(key_path, "v1", month_frame)
+
+    # Another process prunes the entry between the isdir check and the mapping
+    map_frame = shared_cache.map_frame
+    pruned = []
+
+    def prune_then_map(entry_path):
+        if not pruned:
+            pruned.append(entry_path)
+            shutil.rmtree(entry_path)
+        return map_frame(entry_path)
+
+    monkeypatch.setattr(shared_cache, "map_frame", prune_then_map)
+    cache = SharedFrameCache()
+    builds = []
+    df = cache.get(key_path, "v1", lambda: builds.append(1) or month_frame())
+
+    pd.testing.assert_frame_equal(df, month_frame())
+    assert pruned and builds == [1]
+    assert cache.stats()["misses"] == 1
+    # The rebuilt entry serves the next process from disk
+    assert SharedFrameCache().get(key_path, "v1", lambda: None) is not None
+
+
+def test_in_place_edits_stay_private_to_the_caller(tmp_path):
+    cache = SharedFrameCache()
+    key_path = str(tmp_path / "TEST00" / "202401")
+    first = cache.get(key_path, "v1", month_frame)
+    first.loc[first["Wind_Speed"] > 10, "Wind_Speed"] = -1
+    first["Wind_Speed"] *= 2
+
+    pd.testing.assert_frame_equal(cache.get(key_path, "v1", month_frame), month_frame())
+
+
+def test_mapped_measurements_are_one_block_in_column_order(tmp_path):
+    df = month_frame()
+    df["Air_Pressure"] = np.full(24, 1010, dtype=np.float32)
+    df["Note"] = ["ok"] * 24
+    df = df[["Wind_Speed", "time", "Note", "StationID", "Air_Pressure"]]
+    mapped = SharedFrameCache().get(str(tmp_path / "TEST00" / "202401"), "v1", lambda: df)
+
+    pd.testing.assert_frame_equal(mapped, df)
+    float_blocks = [block for block in mapped._mgr.blocks if block.dtype == np.float32]
+    # A deep copy (what pandas 2 callers get) is then one memcpy of the measurements
+    assert len(float_blocks) == 1 and float_blocks[0].shape == (2, 24)
@@ -0,0 +1,70 @@
+"""Tests of the partitioned writer's duplicate index and derived-view batching."""
+from datetime import datetime, timedelta
+
+import pytest
+
+from utils import storage
+from utils.storage import TIME_FORMAT, PartitionWriter, ViewRefreshQueue, read_partition_times
+
+
+def rows(start: datetime, count: int) -> list:
+    return [{"StationID": "TEST00", "time": (start + timedelta(hours=i)).strftime(TIME_FORMAT), "Wind_Speed": str(i)}
+            for i in range(count)]
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """Count partition re-parses and derived-view refreshes instead of building the views."""
+    counts = {"parses": 0, "views": []}
+    read_times = storage.read_partition_times
+
+    def counting_read(file_path):
+        counts["parses"] += 1
+        return read_times(file_path)
+
+    monkeypatch.setattr(storage, "read_partition_times", counting_read)
+    monkeypatch.setattr(storage, "update_derived_views", lambda base_path, csv_path: counts["views"].append(csv_path))
+    monkeypatch.setattr(storage, "_partition_times", storage.PartitionTimesIndex())
+    return counts
+
+
+def test_flushes_reuse_the_known_times_of_a_partition(tmp_path, calls):
+    writer = PartitionWriter(str(tmp_path))
+    batch = rows(datetime(2024, 1, 1), 48)
+    for i in range(0, 48, 8):
+        # Each batch repeats the previous one, which must be skipped
+        writer.extend("TEST00", batch[max(0, i - 8):i + 8])
+        writer.flush(update_views=False)
+
+    csv_path = str(tmp_path / "TEST00" / "202401.csv")
+    assert calls["parses"] == 1  # Only the first write, before the file existed
+    assert len(read_partition_times(csv_path)) == 48
+    assert calls["views"] == []
+    writer.flush()
+    assert calls["views"] == [csv_path]
+
+
+def test_partition_changed_by_another_process_is_read_again(tmp_path, calls):
+    writer = PartitionWriter(str(tmp_path))
+    writer.extend("TEST00", rows(datetime(2024, 1, 1), 4))
+    writer.flush()
+    csv_path = tmp_path / "TEST00" / "202401.csv"
+    with open(csv_path, "a", encoding="utf-8", newline="") as f:
+        f.write("TEST00,2024-01-01T10:00:00\n")
+
+    writer.extend("TEST00", rows(datetime(2024, 1, 1, 8), 4))
+    assert sum(writer.flush().values()) == 3  # 10:00 was added behind the writer's back
+    assert calls["parses"] == 2
+
+
+def test_view_queue_refreshes_each_partition_once(tmp_path, calls):
+    queue = ViewRefreshQueue()
+    for day in range(5):
+        writer = PartitionWriter(str(tmp_path), queue)
+        writer.extend("TEST00", rows(datetime(2024, 1, 31) + timedelta(days=day), 2))
+        writer.flush()
+
+    assert calls["views"] == []
+    assert queue.refresh() == 2
+    assert sorted(calls["views"]) == [str(tmp_path / "TEST00" / f"{month}.csv") for month in ("202401", "202402")]
+    assert queue.refresh() == 0
@@ -0,0 +1,55 @@
+"""Tests of the station x hour tensors."""
+import json
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from utils.storage import TIME_FORMAT, PartitionWriter, atomic_write_text
+from utils.tensor import TensorStore
+
+
+def write_station(base_path: str, device_id: str, speeds: list):
+    writer = PartitionWriter(base_path)
+    writer.extend(device_id, [{"StationID": device_id, "time": (datetime(2024, 1, 1) + timedelta(minutes=30 * i)).strftime(TIME_FORMAT),
+                               "Wind_Speed": str(speed)} for i, speed in enumerate(speeds)])
+    writer.flush()
+
+
+def test_year_frame_columns_are_views_of_the_tensor(tmp_path):
+    base_path = str(tmp_path / "buoy")
+    write_station(base_path, "A", [1, 3, 5, 7])
+    write_station(base_path, "B", [2, 2])
+    store = TensorStore(base_path)
+    tensor = store.open(2024, "Wind_Speed")
+    store.open = lambda year, parameter: tensor
+
+    frame = store.year_frame(2024, "Wind_Speed", ["B", "A", "missing"])
+
+    assert list(frame.columns) == ["B", "A"]
+    assert all(np.shares_memory(frame[col].to_numpy(), tensor) for col in frame.columns)
+    assert frame["A"].iloc[:2].tolist() == [2.0, 6.0]
+    assert frame["B"].iloc[:2].tolist()[0] == 2.0 and np.isnan(frame["B"].iloc[1])
+
+
+def test_year_frame_leaves_out_stations_the_tensor_does_not_cover(tmp_path):
+    base_path = str(tmp_path / "buoy")
+    write_station(base_path, "A", [1, 3])
+    write_station(base_path, "B", [2, 2])
+    store = TensorStore(base_path)
+    assert list(store.year_frame(2024, "Wind_Speed", ["A", "B"]).columns) == ["A", "B"]
+
+    # A month written before the tensor existed (or refreshed later) has no record for its station
+    index = store.read_index()
+    del index["months"]["B"]["202401"]
+    atomic_write_text(store.index_path, json.dumps(index))
+    assert list(store.year_frame(2024, "Wind_Speed", ["A", "B"]).columns) == ["A"]
+
+    # A monthly file changed since its slots were written
+    csv_path = os.path.join(base_path, "A", "202401.csv")
+    os.utime(csv_path, ns=(time.time_ns(), time.time_ns() + 10**9))
+    assert store.year_frame(2024, "Wind_Speed", ["A", "B"]).columns.empty
+
+    store.build(["A", "B"])
+    assert list(store.year_frame(2024, "Wind_Speed", ["A", "B"]).columns) == ["A", "B"]
@@ -0,0 +1,101 @@
+"""
+Append-only archive of raw observation API responses.
+
+Every response body is stored verbatim in a gzip segment per station and
+UTC+8 day (``<archive>/<StationID>/<YYYYMMDD>.jsonl.gz``). Each response is
+one JSON line ``{"fetched_at": ..., "url": ..., "body": "<raw response
+text>"}`` compressed as its own gzip member, so appending never rewrites
+earlier data and the segment still reads as a single gzip stream. The derived CSV and sidecar
+files can then be rebuilt from the archive without network access.
+"""
+import codecs
+import gzip
+import json
+import os
+import uuid
+from typing import Iterator, List, Tuple
+
+from utils.storage import TIME_FORMAT, FileLock, local_now
+
+
+def list_segments(archive_path: str, device_id: str) -> List[str]:
+    """List the station's day segments in chronological order."""
+    station_path = os.path.join(archive_path, device_id)
+    if not os.path.isdir(station_path):
+        return []
+    return [os.path.join(station_path, f) for f in sorted(os.listdir(station_path)) if f.endswith(".jsonl.gz")]
+
+
+def list_archived_stations(archive_path: str) -> List[str]:
+    if not os.path.isdir(archive_path):
+        return []
+    return sorted(d for d in os.listdir(archive_path) if os.path.isdir(os.path.join(archive_path, d)))
+
+
+class ResponseArchiver:
+    """
+    Streams one response body into a private temporary gzip member while it
+    downloads; `commit` appends the finished member to the day segment under
+    a lock, `discard` drops it (e.g. after a failed attempt).
+    """
+
+    def __init__(self, archive_path: str, device_id: str, url: str):
+        station_path = os.path.join(archive_path, device_id)
+        os.makedirs(station_path, exist_ok=True)
+        # UTC+8 like the observation times, whatever the host time zone
+        fetched_at = local_now()
+        self.segment_path = os.path.join(station_path, f"{fetched_at.strftime('%Y%m%d')}.jsonl.gz")
+        self.tmp_path = os.path.join(station_path, f".{uuid.uuid4().hex}.part")
+        self.utf8 = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.file = gzip.open(self.tmp_path, "wt", encoding="utf-8")
+        header = json.dumps({"fetched_at": fetched_at.strftime(TIME_FORMAT), "url": url})
+        # Leave the object open so the body can be streamed in as an escaped JSON string
+        self.file.write(header[:-1] + ', "body": "')
+
+    def write(self, chunk: bytes):
+        text = self.utf8.decode(chunk)
+        if text:
+            self.file.write(json.dumps(text)[1:-1])
+
+    def commit(self):
+        tail = self.utf8.decode(b"", final=True)
+        if tail:
+            self.file.write(json.dumps(tail)[1:-1])
+        self.file.write('"}\n')
+        self.file.close()
+        with FileLock(f"{self.segment_path}.lock"):
+            with open(self.tmp_path, "rb") as src, open(self.segment_path, "ab") as dst:
+                while True:
+                    block = src.read(1024 * 1024)
+                    if not block:
+                        break
+                    dst.write(block)
+                dst.flush()
+                os.fsync(dst.fileno())
+        os.remove(self.tmp_path)
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def iter_archived_responses(archive_path: str, device_id: str) -> Iterator[Tuple[str, str, str]]:
+    """Yield (fetched_at, url, raw body) for every archived response of a station, oldest first."""
+    for segment in list_segments(archive_path, device_id):
+        with gzip.open(segment, "rt", encoding="utf-8") as f:
+            try:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        print(f"⚠️ Skipping damaged record in {segment}")
+                        continue
+                    yield record["fetched_at"], record["url"], record["body"]
+            except (EOFError, OSError) as e:
+                # Only a crash during the final append can truncate a segment
+                print(f"⚠️ Segment {segment} ends early ({e}); later responses in it are lost")
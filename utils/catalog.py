@@ -0,0 +1,167 @@
+"""
+Persistent catalog of the monthly partitions in the buoy dataset.
+
+The catalog (``<base>/catalog.json``) records, per station and month, the
+CSV size and mtime, the row count, the first and last observation time and
+the non-null count of every column. It is refreshed incrementally: a station
+folder is only listed again when its mtime changed (the partition writer
+replaces files, which touches the folder), and a month is only re-read when
+its CSV size or mtime changed. Questions such as "which years does this
+station have" or "which columns does it report" then become lookups instead
+of directory walks and full-year loads.
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterable, List, Optional, TypedDict
+
+import pandas as pd
+
+from utils.storage import (
+    TEXT_COLUMNS, UTC8_OFFSET_SECONDS, FileLock, atomic_write_text, list_partitions, normalize_rows, read_csv_rows,
+    read_fresh_sidecar,
+)
+
+CATALOG_FILE = "catalog.json"
+CATALOG_VERSION = 1
+
+
+class MonthEntry(TypedDict):
+    size: int
+    mtime: float
+    rows: int
+    min_time: Optional[str]
+    max_time: Optional[str]
+    columns: Dict[str, int]  # Non-null (non-empty for text columns) values per column
+
+
+class StationEntry(TypedDict):
+    mtime: float
+    months: Dict[str, MonthEntry]  # Keyed by "YYYYMM"
+
+
+def summarize_partition(csv_path: str) -> MonthEntry:
+    """Read one monthly partition (store partition when fresh, CSV otherwise) and summarize it."""
+    stat = os.stat(csv_path)
+    df = read_fresh_sidecar(csv_path)
+    if df is None:
+        df = normalize_rows(read_csv_rows(csv_path))
+        df["time"] = pd.to_datetime(df["time"] + UTC8_OFFSET_SECONDS, unit="s")
+    columns = {}
+    for col in df.columns:
+        if col == "time":
+            continue
+        values = df[col]
+        count = int((values.astype(str).str.strip() != "").sum()) if col in TEXT_COLUMNS else int(values.notna().sum())
+        if count:
+            columns[col] = count
+    times = df["time"].dropna()
+    return {
+        "size": stat.st_size,
+        "mtime": stat.st_mtime,
+        "rows": len(df),
+        "min_time": times.min().isoformat() if not times.empty else None,
+        "max_time": times.max().isoformat() if not times.empty else None,
+        "columns": columns,
+    }
+
+
+class DatasetCatalog:
+    """Per-station, per-month summary of a dataset folder, persisted next to the data."""
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self.catalog_path = os.path.join(base_path, CATALOG_FILE)
+        self.stations: Dict[str, StationEntry] = {}
+        self.lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.catalog_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == CATALOG_VERSION:
+                self.stations = data.get("stations", {})
+        except (OSError, ValueError):
+            self.stations = {}
+
+    def save(self):
+        text = json.dumps({"version": CATALOG_VERSION, "stations": self.stations}, ensure_ascii=False)
+        with FileLock(f"{self.catalog_path}.lock"):
+            atomic_write_text(self.catalog_path, text)
+
+    def refresh(self, device_ids: Optional[Iterable[str]] = None) -> int:
+        """
+        Bring the catalog up to date with the files on disk.
+        :param device_ids: Stations to check (default: every station folder)
+        :return: Number of months that were (re)summarized or dropped
+        """
+        if not os.path.isdir(self.base_path):
+            return 0
+        if device_ids is None:
+            device_ids = [d for d in os.listdir(self.base_path) if os.path.isdir(os.path.join(self.base_path, d))]
+        changed = 0
+        with self.lock:
+            for device_id in device_ids:
+                changed += self._refresh_station(device_id)
+            if changed:
+                self.save()
+        return changed
+
+    def _refresh_station(self, device_id: str) -> int:
+        station_path = os.path.join(self.base_path, device_id)
+        try:
+            station_mtime = os.path.getmtime(station_path)
+        except OSError:
+            return 1 if self.stations.pop(device_id, None) else 0
+        entry = self.stations.get(device_id)
+        if entry is not None and entry["mtime"] == station_mtime:
+            return 0
+
+        months = dict(entry["months"]) if entry else {}
+        changed = 0
+        present = set()
+        for filename in list_partitions(station_path):
+            month = filename[:6]
+            present.add(month)
+            csv_path = os.path.join(station_path, filename)
+            try:
+                stat = os.stat(csv_path)
+            except OSError:
+                continue
+            known = months.get(month)
+            if known and known["size"] == stat.st_size and known["mtime"] == stat.st_mtime:
+                continue
+            try:
+                months[month] = summarize_partition(csv_path)
+                changed += 1
+            except Exception as e:
+                print(f"⚠️ [{device_id}] Cannot catalog {filename}: {e}")
+        for month in set(months) - present:
+            del months[month]
+            changed += 1
+        self.stations[device_id] = {"mtime": station_mtime, "months": months}
+        # Count the station itself so its new folder mtime is saved even when no month changed
+        return max(changed, 1)
+
+    def months(self, device_id: str, year: Optional[int] = None) -> Dict[str, MonthEntry]:
+        """Months of a station that hold at least one observation, optionally limited to one year."""
+        months = self.stations.get(device_id, {}).get("months", {})
+        return {m: e for m, e in months.items() if e["rows"] and (year is None or m[:4] == str(year))}
+
+    def years(self, device_id: str) -> List[int]:
+        return sorted({int(m[:4]) for m in self.months(device_id)})
+
+    def all_years(self, device_ids: Iterable[str]) -> List[int]:
+        return sorted({year for device_id in device_ids for year in self.years(device_id)})
+
+    def columns(self, device_id: str, years: Optional[Iterable[int]] = None) -> Dict[str, int]:
+        """Non-null value count per column over the given years (default: all years)."""
+        wanted = None if years is None else {str(y) for y in years}
+        counts: Dict[str, int] = {}
+        for month, entry in self.months(device_id).items():
+            if wanted is not None and month[:4] not in wanted:
+                continue
+            for col, count in entry["columns"].items():
+                counts[col] = counts.get(col, 0) + count
+        return counts
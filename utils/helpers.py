@@ -7,12 +7,26 @@ import numpy as np
 import os
 import json
 import re
+import time
+import hashlib
+import pickle
 import chardet
 
 # Optional: For Matplotlib related functions, if you still use them in other parts of your app
 import matplotlib.pyplot as plt
 import matplotlib.font_manager as fm
-from tensorflow import norm
+
+from utils.catalog import DatasetCatalog
+from utils.storage import (
+    CSV_COLUMNS, LAYER_COLUMNS, NUMERIC_COLUMNS, compact_frame, find_time_column, layer_table, parse_time_column,
+    read_fresh_sidecar, sniff_time_format,
+)
+from utils.rollup import LEVELS as ROLLUP_LEVELS, RollupStore
+from utils.shared_cache import (
+    CONTENT_ID_ATTR, DEFAULT_BUDGET_BYTES, SharedFrameCache, content_id_of, file_fingerprint, files_fingerprint,
+    frame_cache_root, stamp_content_id,
+)
+from utils.tensor import TensorStore
 
 # --- 全局配置變數 (在模組載入時初始化) ---
 PARAMETER_INFO = {}
@@ -21,6 +35,8 @@ DATA_SUBFOLDERS_PRIORITY = []
 BASE_DATA_PATH_FROM_CONFIG = "/dataset/buoy"
 CHINESE_FONT_NAME = None # 用於 Streamlit Plotly 圖表的中文字體名稱
 CHINESE_FONT_PATH_FULL = None # 用於 Matplotlib 的中文字體完整路徑
+SHARED_CACHE_BUDGET_MB = DEFAULT_BUDGET_BYTES // (1024 * 1024) # 共用資料快取的記憶體映射上限
+FINGERPRINT_TAIL_BYTES = 4096 # 快取鍵除 mtime/大小外另外雜湊的檔案尾端位元組數 (0 表示不雜湊)
 
 # --- 載入配置檔 ---
 def load_app_config_and_font():
@@ -28,7 +44,7 @@ def load_app_config_and_font():
     此函數會更新模組層級的全局變數。
     """
     global PARAMETER_INFO, DATA_SUBFOLDERS_PRIORITY, BASE_DATA_PATH_FROM_CONFIG, RISK_THRESHOLDS
-    global CHINESE_FONT_NAME, CHINESE_FONT_PATH_FULL, STATION_COORDS 
+    global CHINESE_FONT_NAME, CHINESE_FONT_PATH_FULL, STATION_COORDS, SHARED_CACHE_BUDGET_MB, FINGERPRINT_TAIL_BYTES
 
     CONFIG_FILE_NAME = 'config.json'
     current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -55,6 +71,8 @@ def load_app_config_and_font():
         DATA_SUBFOLDERS_PRIORITY = config.get("DATA_SUBFOLDERS_PRIORITY", ["qc", "QC", "real time", "real_time", "RealTime", "Real Time", "realtime"])
         BASE_DATA_PATH_FROM_CONFIG = config.get("base_data_path", "/dataset/buoy")
         RISK_THRESHOLDS = config.get("RISK_THRESHOLDS", {})
+        SHARED_CACHE_BUDGET_MB = config.get("SHARED_CACHE_BUDGET_MB", SHARED_CACHE_BUDGET_MB)
+        FINGERPRINT_TAIL_BYTES = config.get("FINGERPRINT_TAIL_BYTES", FINGERPRINT_TAIL_BYTES)
 
         font_path_relative = config.get("CHINESE_FONT_PATH")
         if font_path_relative:
@@ -81,6 +99,60 @@ except Exception as e:
     PARAMETER_INFO, DATA_SUBFOLDERS_PRIORITY, STATION_COORDS = {}, [], {}
     CHINESE_FONT_NAME, CHINESE_FONT_PATH_FULL = None, None
 
+# 所有工作階段共用的唯讀資料快取；pandas 3 (Copy-on-Write) 交出共用緩衝區的淺層副本，
+# pandas 2 則交出可寫入的私有副本，不更動全域選項，頁面既有的就地修改行為不受影響
+_SHARED_FRAMES = SharedFrameCache(int(SHARED_CACHE_BUDGET_MB) * 1024 * 1024)
+# 以資料檔指紋為鍵的 st.cache_data 不設 ttl：檔案變動時指紋改變而立即重新讀取，未變動的結果只在超過筆數上限時淘汰
+CACHED_RESULTS_MAX_ENTRIES = 128
+
+# 由月份快取組出的年度/區間資料次數 (不快取，僅供調校參考)
+_VIEW_ASSEMBLIES = {'year': 0, 'range': 0}
+# 批次掃描累計處理的列數與秒數 (換算每秒處理列數用)
+_SCAN_STATS = {'rows': 0, 'seconds': 0.0}
+
+def _count_view(kind):
+    _VIEW_ASSEMBLIES[kind] += 1
+
+def get_cache_stats():
+    """資料快取各層的命中/未命中次數與目前用量，供調校快取上限使用。
+    memory_hits: 記憶體中的月份資料；disk_hits: 重新映射磁碟上的月份檔；misses: 從 CSV/分區重新讀取。
+    scan_rows/scan_seconds: 批次掃描 (scan_station_months) 累計產生的列數與耗時，不經過月份快取。
+    """
+    return {**_SHARED_FRAMES.stats(), 'year_views': _VIEW_ASSEMBLIES['year'], 'range_views': _VIEW_ASSEMBLIES['range'],
+            'scan_rows': _SCAN_STATS['rows'], 'scan_seconds': _SCAN_STATS['seconds']}
+
+def derived_content_id(kind, *parts):
+    """由來源檔案指紋 (或其他內容 ID) 與載入參數推導的穩定內容 ID。"""
+    return hashlib.sha1(repr((kind,) + parts).encode()).hexdigest()[:20]
+
+def _frame_cache_key(df):
+    # 帶有效內容 ID 的資料直接以 ID 為鍵；沒有 (或已被修改而失效) 時才雜湊整份資料
+    content_id = content_id_of(df)
+    if content_id is not None:
+        return content_id
+    try:
+        digest = pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes()
+    except TypeError:
+        digest = pickle.dumps(df)  # 含不可雜湊物件 (例如 list) 的欄位
+    return hashlib.sha1(digest).hexdigest() + repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()])
+
+def cache_by_content_id(func=None, **cache_kwargs):
+    """與 st.cache_data 相同，但 DataFrame 參數以載入函式附加的內容 ID 作為快取鍵，不必每次重新雜湊整份資料。
+    內容 ID 由來源月份檔的指紋推導，資料檔更新時自動失效；經過篩選或修改的資料會退回完整雜湊。
+    pandas 2 未開啟 Copy-on-Write 時無法察覺就地修改，內容 ID 一律不採用，效果與 st.cache_data 相同
+    (每次以完整雜湊為鍵，一年份單站資料約 13 ms；pandas 3 檢查內容 ID 約 1.7 ms)。
+    """
+    decorator = st.cache_data(hash_funcs={pd.DataFrame: _frame_cache_key}, **cache_kwargs)
+    return decorator(func) if func is not None else decorator
+
+def data_fingerprint(file_path):
+    """資料檔的快取指紋 (mtime、大小與尾端雜湊)；檔案不存在時回傳 None。"""
+    return file_fingerprint(file_path, FINGERPRINT_TAIL_BYTES)
+
+def data_files_fingerprint(file_paths):
+    """多個資料檔合併的快取指紋；檔案都不存在時回傳 None。"""
+    return files_fingerprint(file_paths, FINGERPRINT_TAIL_BYTES)
+
 # --- 輔助函數 ---
 
 @st.cache_resource
@@ -104,120 +176,274 @@ def convert_df_to_csv(df):
         return pd.DataFrame().to_csv(index=False).encode('utf-8')
     return df.to_csv(index=False).encode('utf-8')
 
-@st.cache_data(ttl=3600)
+# 每個 CSV 檔案偵測到的 (編碼, 時間格式)，以 (路徑, mtime, 大小) 為鍵；檔案未變動時不必重新偵測
+_CSV_READ_HINTS = {}
+
+def _shared_frame_key(file_path):
+    """月份檔案在共用快取中的鍵：<base>_frames/<StationID>/<YYYYMM>。"""
+    station_path, filename = os.path.split(os.path.abspath(file_path))
+    return os.path.join(frame_cache_root(os.path.dirname(station_path)), os.path.basename(station_path), os.path.splitext(filename)[0])
+
 def load_single_file(file_path):
-    """載入並清理單一月份的 CSV 檔案。"""
-    df = None
+    """載入並清理單一月份的檔案，是 load_year_data、load_station_range 與 load_data 共用的讀取引擎。
+    回傳欄位為原始英文欄名，時間欄統一為 'time'；量測值為 float32、StationID 為 category，
+    分層流速/流向字串不包含在內 (改由 load_year_layers 讀取，匯出時以 with_layer_columns 併回)。
+    結果存放於跨工作階段共用的記憶體映射快取；pandas 3 下呼叫端取得共用同一份緩衝區的淺層副本，pandas 2 下為私有副本。
+    """
+    fingerprint = data_fingerprint(file_path)
+    if fingerprint is None:
+        return None
+    key_path = _shared_frame_key(file_path)
+    df = _SHARED_FRAMES.get(key_path, fingerprint, lambda: _read_single_file(file_path))
+    return None if df is None else stamp_content_id(df, derived_content_id('month', key_path, fingerprint))
+
+def _read_single_file(file_path):
+    # 優先讀取抓取程式寫入的型別化分區（不舊於 CSV 時），且不讀取分層字串欄位
+    df = read_fresh_sidecar(file_path, [col for col in CSV_COLUMNS if col not in LAYER_COLUMNS])
+    if df is None:
+        df = read_observation_file(file_path)
+    if df is None or df.empty:
+        return None
+    # 月份資料先依時間排序並去除重複，年度與區間資料合併時多半可省略重新排序
+    if 'time' in df.columns:
+        df = df.sort_values(by='time', kind='stable').drop_duplicates(subset=['time'], keep='first').reset_index(drop=True)
+    return compact_frame(df)
+
+def combine_monthly_frames(monthly_dfs):
+    """合併月份資料並依時間排序、去除重複時間；月份已各自排序且互不重疊時直接串接。"""
+    combined_df = pd.concat(monthly_dfs, ignore_index=True)
+    if not (combined_df['time'].is_monotonic_increasing and combined_df['time'].is_unique):
+        combined_df = combined_df.sort_values(by='time', kind='stable').drop_duplicates(subset=['time'], keep='first')
+    return combined_df.reset_index(drop=True)
+
+def year_file_paths(base_data_path, station, year):
+    """指定測站和年份 12 個月份檔案的路徑 (不論是否存在)。"""
+    return [os.path.join(base_data_path, station, f"{year}{month:02d}.csv") for month in range(1, 13)]
+
+def load_year_layers(base_data_path, station, year):
+    """載入指定測站和年份的分層流速/流向字串副表 (time 加上分層欄位，只含有剖面資料的列)。"""
+    fingerprint = data_files_fingerprint(year_file_paths(base_data_path, station, year))
+    return _load_year_layers(base_data_path, station, year, fingerprint)
+
+@st.cache_data(max_entries=CACHED_RESULTS_MAX_ENTRIES, show_spinner=False)
+def _load_year_layers(base_data_path, station, year, fingerprint):
+    monthly_layers = []
+    for file_path in year_file_paths(base_data_path, station, year):
+        if not os.path.exists(file_path):
+            continue
+        df_month = read_fresh_sidecar(file_path, ['time'] + LAYER_COLUMNS)
+        if df_month is None:
+            df_month = read_observation_file(file_path)
+        if df_month is not None and not df_month.empty:
+            monthly_layers.append(layer_table(df_month))
+    if not monthly_layers:
+        return pd.DataFrame(columns=['time'] + LAYER_COLUMNS)
+    combined_df = pd.concat(monthly_layers, ignore_index=True)
+    return combined_df.sort_values(by='time').drop_duplicates(subset=['time'], keep='first').reset_index(drop=True)
+
+def with_layer_columns(df, base_data_path, station, year):
+    """匯出用：依時間併回分層流速/流向字串 (load_year_layers)，欄位放回原始 CSV 的位置；沒有剖面資料的列為空字串。"""
+    if df is None or df.empty or 'time' not in df.columns:
+        return df
+    layers = load_year_layers(base_data_path, station, year)
+    merged = df.drop(columns=[col for col in LAYER_COLUMNS if col in df.columns]).merge(layers, on='time', how='left')
+    for col in LAYER_COLUMNS:
+        merged[col] = merged[col].fillna('') if col in merged.columns else ''
+    order = [col for col in CSV_COLUMNS if col in merged.columns]
+    return merged[order + [col for col in merged.columns if col not in order]]
+
+def read_observation_file(file_path):
+    """以 C 解析器讀取單一月份 CSV 的所有欄位，編碼與時間格式只在第一次讀取時偵測並依檔案快取。"""
     try:
-        # 自動偵測編碼
-        with open(file_path, 'rb') as f:
-            raw_data = f.read(100000)
-            result = chardet.detect(raw_data)
-            detected_encoding = result['encoding']
+        stat = os.stat(file_path)
+        hint_key = (file_path, stat.st_mtime, stat.st_size)
+        detected_encoding, time_format = _CSV_READ_HINTS.get(hint_key, (None, None))
+        if detected_encoding is None:
+            # 自動偵測編碼
+            with open(file_path, 'rb') as f:
+                detected_encoding = chardet.detect(f.read(100000))['encoding']
 
         encodings_to_try = list(dict.fromkeys([detected_encoding, 'utf-8', 'big5', 'cp950', 'gbk', 'latin-1']))
 
+        df = None
         for encoding in encodings_to_try:
             if encoding:
                 try:
-                    df = pd.read_csv(file_path, delimiter=',', on_bad_lines='warn', header=None, low_memory=False, encoding=encoding)
+                    # 標頭共 3 行：中文名稱、英文名稱、單位；以英文名稱為欄名並略過單位行
+                    df = pd.read_csv(file_path, header=1, skiprows=[2], on_bad_lines='warn', low_memory=False, encoding=encoding)
                     break
                 except (UnicodeDecodeError, pd.errors.ParserError):
                     continue
 
-        if df is None or len(df) < 3:
+        if df is None or df.empty:
             return None
 
-        # 處理標頭並清理欄位名稱
-        english_headers = df.iloc[1].astype(str).str.strip()
-        df.columns = english_headers
-        df = df[3:].reset_index(drop=True)
-        df.columns = df.columns.str.strip()
+        df.columns = df.columns.astype(str).str.strip()
 
         # --- 自動尋找並重新命名時間欄位 ---
-        time_col_candidates = ['time', 'Time', '觀測時間', 'Date', 'datetime', 'Datetime', '時間']
-        actual_time_col = None
-        for col in time_col_candidates:
-            if col in df.columns:
-                actual_time_col = col
-                break
-        
-        if actual_time_col and actual_time_col != 'time':
+        actual_time_col = find_time_column(df.columns)
+        if actual_time_col is None:
+            return None
+        if actual_time_col != 'time':
             df.rename(columns={actual_time_col: 'time'}, inplace=True)
-        
-        # 轉換數值型別
-        cols_to_convert = [col for col, info in PARAMETER_INFO.items() if info.get('type') in ['linear', 'circular']]
+
+        # 轉換數值型別 (C 解析器已將乾淨的數值欄位解析為數字，此處僅處理混有文字的欄位)
+        cols_to_convert = set(NUMERIC_COLUMNS) | {col for col, info in PARAMETER_INFO.items() if info.get('type') in ['linear', 'circular']}
         for col in cols_to_convert:
-            if col in df.columns:
+            if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
                 df[col] = pd.to_numeric(df[col], errors='coerce')
 
-        # 轉換時間型別
-        if 'time' in df.columns:
-            df['time'] = pd.to_datetime(df['time'], errors='coerce')
-            df.dropna(subset=['time'], inplace=True)
-            if df['time'].empty:
-                return None
-        
+        # 轉換時間型別：以少量樣本偵測一次格式後，整欄只解析一次
+        if time_format is None:
+            time_format = sniff_time_format(df['time'])
+        df['time'] = parse_time_column(df['time'], time_format)
+        _CSV_READ_HINTS[hint_key] = (encoding, time_format)
+        df.dropna(subset=['time'], inplace=True)
+        if df['time'].empty:
+            return None
+
         return df
     except Exception:
         return None
 
-@st.cache_data(ttl=3600)
 def load_year_data(base_data_path, station, year):
-    """載入並合併指定測站和年份的所有月份資料。"""
+    """載入並合併指定測站和年份的所有月份資料。
+    資料只存在月份快取中，年度資料每次由月份資料組出而不另存一份。
+    """
     monthly_dfs = []
-    dataset_path = os.path.join(base_data_path, station)
-
     # 載入該年度所有月份的檔案
-    for month in range(1, 13):
-        file_path = os.path.join(dataset_path, f"{year}{month:02d}.csv")
+    for file_path in year_file_paths(base_data_path, station, year):
         if os.path.exists(file_path):
             df_month = load_single_file(file_path)
             if df_month is not None and not df_month.empty:
                 monthly_dfs.append(df_month)
-                
+
     if not monthly_dfs:
         return None
+    if 'time' not in monthly_dfs[0].columns:
+        return None
 
-    combined_df = pd.concat(monthly_dfs, ignore_index=True)
-    
-    if 'time' in combined_df.columns:
-        if combined_df['time'].isnull().all():
-            return None # 如果所有時間值都無效，返回 None
-        
-        combined_df = combined_df.sort_values(by='time').drop_duplicates(subset=['time'], keep='first')
-    else:
+    _count_view('year')
+    combined_df = stamp_content_id(combine_monthly_frames(monthly_dfs), derived_content_id('year', *(df.attrs[CONTENT_ID_ATTR] for df in monthly_dfs)))
+    if combined_df['time'].isnull().all():
+        return None # 如果所有時間值都無效，返回 None
+    return combined_df
+
+def list_month_files(base_data_path, station, start, end):
+    """列出與 [start, end] 時間範圍重疊且存在的月份檔案路徑。"""
+    file_paths = []
+    for month in pd.period_range(pd.Timestamp(start).to_period('M'), pd.Timestamp(end).to_period('M'), freq='M'):
+        file_path = os.path.join(base_data_path, station, f"{month.year}{month.month:02d}.csv")
+        if os.path.exists(file_path):
+            file_paths.append(file_path)
+    return file_paths
+
+def load_station_range(base_data_path, station, columns, start, end):
+    """只讀取與 [start, end] 重疊的月份分區及指定欄位，回傳依時間排序並去除重複的資料 (含 time 欄)。
+    與 load_year_data 相同，由月份快取組出而不另存一份。
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    wanted = ['time'] + [col for col in columns if col != 'time']
+    monthly_dfs = []
+    for file_path in list_month_files(base_data_path, station, start, end):
+        df_month = load_single_file(file_path)
+        if df_month is None:
+            continue
+        df_month = df_month[[col for col in wanted if col in df_month.columns]]
+        monthly_dfs.append(df_month[(df_month['time'] >= start) & (df_month['time'] <= end)])
+
+    if not monthly_dfs:
+        return pd.DataFrame(columns=wanted)
+    _count_view('range')
+    content_id = derived_content_id('range', *(df.attrs[CONTENT_ID_ATTR] for df in monthly_dfs), *wanted, start, end)
+    return stamp_content_id(combine_monthly_frames(monthly_dfs), content_id)
+
+class ScanChunk(TypedDict):
+    station: str
+    year: int
+    month: int
+    frame: pd.DataFrame
+
+def read_month_columns(file_path, columns):
+    """只讀取單一月份檔案的 time 與指定欄位 (檔案缺少的欄位補 NaN)，依時間排序並去除重複。
+    不經過月份快取，批次掃描不會把整個資料集寫入或擠出互動頁面使用的快取。
+    """
+    wanted = ['time'] + [col for col in columns if col != 'time']
+    df = read_fresh_sidecar(file_path, [col for col in wanted if col in CSV_COLUMNS])
+    if df is None:
+        df = read_observation_file(file_path)
+    if df is None or df.empty or 'time' not in df.columns:
         return None
+    df = df.reindex(columns=wanted)
+    if df['time'].hasnans:
+        df = df[df['time'].notna()]
+    if not (df['time'].is_monotonic_increasing and df['time'].is_unique):
+        df = df.sort_values(by='time', kind='stable').drop_duplicates(subset=['time'], keep='first').reset_index(drop=True)
+    return compact_frame(df)
+
+def scan_station_months(base_data_path, stations, years, columns):
+    """依 年 → 月 → 測站 的順序逐一產生月份資料區塊 (ScanChunk)，只含 time 與指定欄位。
+    一次只讀取一個月份，呼叫端處理完即可釋放，多年、全測站的分析記憶體用量只與單月資料量有關；
+    同一個月份的各測站區塊相鄰產生，可用 itertools.groupby 依 (year, month) 配對。
+    產生的列數與掃描耗時 (含呼叫端處理時間) 計入 get_cache_stats 的 scan_rows/scan_seconds。
+    """
+    started = time.perf_counter()
+    try:
+        for year in years:
+            for month in range(1, 13):
+                for station in stations:
+                    file_path = os.path.join(base_data_path, station, f"{year}{month:02d}.csv")
+                    if not os.path.exists(file_path):
+                        continue
+                    df = read_month_columns(file_path, columns)
+                    if df is not None and not df.empty:
+                        _SCAN_STATS['rows'] += len(df)
+                        yield ScanChunk(station=station, year=int(year), month=month, frame=df)
+    finally:
+        _SCAN_STATS['seconds'] += time.perf_counter() - started
+
+def scan_aggregate(chunks, map_func, reduce_func, initial):
+    """對掃描區塊做 map/reduce：每個區塊以 map_func 化簡為小結果後即釋放，再以 reduce_func(累積值, 結果) 合併。"""
+    result = initial
+    for chunk in chunks:
+        result = reduce_func(result, map_func(chunk))
+    return result
+
+def load_hourly_grid(base_data_path, station_ids, parameter, year):
+    """從測站×小時張量讀取多個測站某年某參數的每小時平均 (欄為 StationID，已依時間對齊)。
+    張量未涵蓋該年所有月份檔 (尚未建立或月份檔之後又有更新) 的測站不會出現在欄位中，呼叫端應改用彙總或 load_year_data。
+    """
+    return TensorStore(base_data_path).year_frame(int(year), parameter, list(station_ids))
 
-    return combined_df.reset_index(drop=True)
+def load_rollup(base_data_path, station, years, parameters, freq, stat="mean"):
+    """從預先彙總的小時/日/月資料取得測站各參數依 freq 的統計值 (mean/std/min/max/count)。
+    回傳含 time 欄、各參數一欄的寬表；彙總不存在、過期或 freq 無法由彙總產生時回傳 None，呼叫端應改用原始資料。
+    """
+    store = RollupStore(base_data_path)
+    source_files = [path for year in years for path in year_file_paths(base_data_path, station, year)]
+    source_files += [store.rollup_path(station, int(year), level) for year in years for level in ROLLUP_LEVELS]
+    # 彙總檔以 mtime/大小判斷即可，不讀取尾端
+    fingerprint = files_fingerprint(source_files)
+    return _load_rollup(base_data_path, station, tuple(years), tuple(parameters), freq, stat, fingerprint)
+
+@st.cache_data(max_entries=CACHED_RESULTS_MAX_ENTRIES, show_spinner=False)
+def _load_rollup(base_data_path, station, years, parameters, freq, stat, fingerprint):
+    stats = RollupStore(base_data_path).resample(station, [int(y) for y in years], list(parameters), freq)
+    if stats is None:
+        return None
+    wide = stats.pivot(index="time", columns="parameter", values=stat)
+    wide.columns.name = None
+    return wide.reset_index()
 
 def load_data_for_prediction_page(station_name, param_col, start_date, end_date):
-    df_list = []
     base_data_path_full = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', BASE_DATA_PATH_FROM_CONFIG))
-    years_to_load = range(start_date.year, end_date.year + 1)
-    
-    for year in years_to_load:
-        df_year = load_year_data(base_data_path_full, station_name, year)
-        if df_year is not None and not df_year.empty and 'time' in df_year.columns:
-            df_year = df_year.set_index('time')
-            df_list.append(df_year)
-    
-    if not df_list: return pd.DataFrame()
-
-    combined_df = pd.concat(df_list)
-    combined_df = combined_df[~combined_df.index.duplicated(keep='first')].sort_index()
-
-    combined_df = combined_df[
-        (combined_df.index.to_series() >= pd.to_datetime(start_date)) &
-        (combined_df.index.to_series() <= pd.to_datetime(end_date) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1))
-    ].copy()
+    end_datetime = pd.to_datetime(end_date) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1)
+    combined_df = load_station_range(base_data_path_full, station_name, (param_col,), pd.to_datetime(start_date), end_datetime)
 
     if combined_df.empty or param_col not in combined_df.columns: return pd.DataFrame()
-    
-    df_filtered = combined_df[[param_col]].copy()
-    df_filtered.columns = ['y']
-    df_filtered.reset_index(inplace=True)
-    df_filtered.rename(columns={'time': 'ds'}, inplace=True)
+
+    df_filtered = combined_df[['time', param_col]].copy()
+    df_filtered.columns = ['ds', 'y']
 
     return df_filtered
 
@@ -282,160 +508,129 @@ def prepare_windrose_data(df):
     windrose_df['percentage'] = (windrose_df['frequency'] / len(df_wind)) * 100
     return windrose_df
 
+@st.cache_resource
+def _load_dataset_catalog(base_data_path):
+    return DatasetCatalog(base_data_path)
+
+def get_dataset_catalog(base_data_path, locations=None):
+    """取得資料集目錄 (catalog.json)，並依資料夾與檔案 mtime 增量更新後回傳。"""
+    catalog = _load_dataset_catalog(os.path.normpath(base_data_path))
+    catalog.refresh(locations)
+    return catalog
+
+def get_station_years(base_data_path, station):
+    """從資料集目錄查詢特定測站有資料的年份，無須載入任何資料。"""
+    return get_dataset_catalog(base_data_path, [station]).years(station)
+
 def get_available_years(base_data_path_from_config, locations):
-    all_years = set()
     base_data_path_full = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', base_data_path_from_config))
     if not os.path.exists(base_data_path_full):
         current_year = pd.Timestamp.now().year
         return list(range(current_year - 5, current_year + 1))
 
-    for location in locations:
-        location_path = os.path.join(base_data_path_full, location)
-        if not os.path.isdir(location_path): continue
-        
-        for dirpath, _, filenames in os.walk(location_path):
-            for filename in filenames:
-                match = re.match(r'(\d{4})\d{2}\.csv', filename, re.IGNORECASE)
-                if match:
-                    all_years.add(int(match.group(1)))
-                    
+    all_years = get_dataset_catalog(base_data_path_full, locations).all_years(locations)
     if not all_years:
         current_year = pd.Timestamp.now().year
         return list(range(current_year - 5, current_year + 1))
-    return sorted(list(all_years))
+    return all_years
+
+def _navigability_counts(chunk, wave_thresh, wind_thresh):
+    """單一月份區塊中各月份的有效筆數與可航行筆數 (波高、風速皆有值才算有效)。"""
+    df = chunk['frame']
+    wave, wind = df['Wave_Height_Significant'], df['Wind_Speed']
+    valid = wave.notna() & wind.notna()
+    navigable = valid & (wave < wave_thresh) & (wind < wind_thresh)
+    months = df['time'].dt.month.to_numpy()
+    valid_counts = np.bincount(months, weights=valid.to_numpy(), minlength=13)
+    navigable_counts = np.bincount(months, weights=navigable.to_numpy(), minlength=13)
+    return {(chunk['station'], chunk['year'], int(month)): (int(valid_counts[month]), int(navigable_counts[month]))
+            for month in np.unique(months)}
+
+def _add_counts(totals, counts):
+    for key, (valid, navigable) in counts.items():
+        total_valid, total_navigable = totals.get(key, (0, 0))
+        totals[key] = (total_valid + valid, total_navigable + navigable)
+    return totals
 
 def batch_process_all_data(base_data_path_from_config, locations, years_to_analyze, wave_thresh, wind_thresh):
-    all_results = []
-    missing_data_sources = []
+    """逐月掃描各測站的波高與風速，計算每月可航行時間比例；一次只讀取一個月份的兩個欄位。"""
     base_data_path_full = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', base_data_path_from_config))
+    chunks = scan_station_months(base_data_path_full, locations, years_to_analyze, ['Wave_Height_Significant', 'Wind_Speed'])
+    totals = scan_aggregate(chunks, lambda chunk: _navigability_counts(chunk, wave_thresh, wind_thresh), _add_counts, {})
 
-    for location in locations:
-        has_data_for_location = False
-        for year in years_to_analyze:
-            df_year = load_year_data(base_data_path_full, location, year)
-            if df_year is not None and not df_year.empty:
-                has_data_for_location = True
-                
-                # --- 第 1 個修改：將 'month' 欄位直接命名為 '月份' ---
-                df_year['月份'] = df_year['time'].dt.month
-                
-                # --- 第 2 個修改：使用 '月份' 進行分組 ---
-                monthly_results = df_year.groupby('月份').apply(
-                    lambda df_month: analyze_navigability(df_month, wave_thresh, wind_thresh),
-                    include_groups=False
-                ).reset_index(name='可航行時間比例(%)')
-                
-                monthly_results['地點'] = get_station_name_from_id(location)
-                monthly_results['年份'] = year
-                
-                # --- 現在這行可以正常運作，因為 '月份' 欄位存在 ---
-                monthly_results['年月'] = monthly_results.apply(lambda row: f"{row['年份']}-{int(row['月份']):02d}", axis=1)
-                all_results.append(monthly_results)
-
-        if not has_data_for_location:
-            missing_data_sources.append(location)
-            
-    if not all_results:
+    missing_data_sources = [location for location in locations if not any(key[0] == location for key in totals)]
+    if not totals:
         return pd.DataFrame(), missing_data_sources
-        
-    return pd.concat(all_results, ignore_index=True), missing_data_sources
 
-@st.cache_data(ttl=3600, show_spinner="正在載入並預處理數據...")
-def load_data(station_id, param_info_map):
+    station_order = {location: i for i, location in enumerate(locations)}
+    rows = []
+    for (station, year, month), (valid, navigable) in sorted(totals.items(), key=lambda item: (station_order[item[0][0]],) + item[0][1:]):
+        rows.append((month, navigable / valid * 100 if valid else np.nan, get_station_name_from_id(station), year, f"{year}-{month:02d}"))
+    results = pd.DataFrame(rows, columns=['月份', '可航行時間比例(%)', '地點', '年份', '年月'])
+    return results, missing_data_sources
+
+def file_overlaps_range(file_path, start_datetime, end_datetime):
+    """依檔名 (YYYYMM.csv) 判斷月份檔案是否與時間範圍重疊；無法辨識月份的檔案一律保留。"""
+    match = re.match(r'(\d{4})(\d{2})\.csv$', os.path.basename(file_path), re.IGNORECASE)
+    if not match:
+        return True
+    month_start = pd.Timestamp(int(match.group(1)), int(match.group(2)), 1)
+    month_end = month_start + pd.offsets.MonthBegin(1)
+    return (start_datetime is None or month_end > start_datetime) and (end_datetime is None or month_start <= end_datetime)
+
+def get_station_data_span(station_id):
+    """從資料集目錄取得測站有資料的欄位 (小寫欄名 -> 非空筆數) 與最早、最晚觀測時間，無須載入資料。"""
+    catalog = get_dataset_catalog(st.session_state.base_data_path, [station_id])
+    months = catalog.months(station_id)
+    if not months:
+        return {}, None, None
+    columns = {col.lower(): count for col, count in catalog.columns(station_id).items()}
+    min_time = min(pd.Timestamp(entry['min_time']) for entry in months.values())
+    max_time = max(pd.Timestamp(entry['max_time']) for entry in months.values())
+    return columns, min_time, max_time
+
+def load_data(station_id, param_info_map, start_date=None, end_date=None):
+    """載入測站資料供預測頁面使用；指定 start_date/end_date 時只讀取與該日期範圍重疊的月份檔案。
+    回傳小寫欄名，'ds' 為時間欄，只保留 param_info_map 中有足夠有效數據的線性/圓形參數。
+    """
+    start_datetime = pd.to_datetime(start_date) if start_date is not None else None
+    end_datetime = pd.to_datetime(end_date) + pd.Timedelta(days=1) - pd.Timedelta(microseconds=1) if end_date is not None else None
+
+    station_data_path = os.path.join(st.session_state.base_data_path, station_id)
+    csv_files = sorted(set(glob(os.path.join(station_data_path, '*.csv')) + glob(os.path.join(station_data_path, '*.CSV'))))
+    if start_datetime is not None or end_datetime is not None:
+        csv_files = [f for f in csv_files if file_overlaps_range(f, start_datetime, end_datetime)]
+    fingerprint = data_files_fingerprint(csv_files)
+    df = _load_data(station_id, param_info_map, tuple(csv_files), start_datetime, end_datetime, fingerprint)
+    return stamp_content_id(df, derived_content_id('data', station_id, json.dumps(param_info_map, sort_keys=True), start_datetime, end_datetime, fingerprint))
+
+@st.cache_data(max_entries=CACHED_RESULTS_MAX_ENTRIES, show_spinner="正在載入並預處理數據...")
+def _load_data(station_id, param_info_map, csv_files, start_datetime, end_datetime, fingerprint):
     station_name = get_station_name_from_id(station_id)
+    station_data_path = os.path.join(st.session_state.base_data_path, station_id)
 
-    # 使用 st.expander 將所有的載入訊息包裹起來
-    with st.expander(f"查看測站 '{station_name}' 的數據載入日誌"):
-        st.info(f"嘗試從基本路徑 `{st.session_state.base_data_path}` 載入測站 `{station_name}` 的數據。")
-        station_data_path = os.path.join(st.session_state.base_data_path, station_id)
-
-        all_dfs = []
-        found_any_file = False
-
-        csv_files = glob(os.path.join(station_data_path, '*.csv')) + glob(os.path.join(station_data_path, '*.CSV'))
-        if csv_files:
-            st.info(f"在 `{station_data_path}` 中找到 {len(csv_files)} 個 CSV 檔案。")
-            found_any_file = True
-            for file_path in sorted(csv_files):
-                try:
-                    encodings = ['utf-8', 'latin1', 'big5', 'cp950']
-                    df_part = None
-                    for enc in encodings:
-                        try:
-                            df_part = pd.read_csv(file_path, header=1, encoding=enc, engine='python')
-                            break
-                        except UnicodeDecodeError:
-                            continue
-                    if df_part is None:
-                        st.warning(f"文件 '{file_path}' 無法使用常見編碼解析。跳過此文件。")
-                        continue
-
-                    possible_time_cols = ['Time', 'time', 'UTC', 'GMT', 'Local_Time', 'Date', 'DateTime', 'TIME_UTC', 'Time (UTC)', 'time(UTC)', 'Time (LST)']
-                    
-                    # 清理列名，確保匹配時不會因為空格或大小寫問題錯過
-                    df_part.columns = df_part.columns.str.strip().str.lower()
-                    actual_time_cols_in_df = [col for col in df_part.columns if col in [pc.lower() for pc in possible_time_cols]]
-                    
-                    # --- 修正點 1: 更魯棒的日期時間解析 ---
-                    # 定義多種可能的日期時間格式
-                    possible_date_formats = [
-                        '%Y/%m/%d %H:%M:%S', '%Y-%m-%d %H:%M:%S', 
-                        '%Y/%m/%d %H:%M', '%Y-%m-%d %H:%M',      
-                        '%Y/%m/%d', '%Y-%m-%d',                  
-                        '%m/%d/%Y %H:%M:%S', '%d-%m-%Y %H:%M:%S', 
-                        '%m/%d/%Y %H:%M', '%d-%m-%Y %H:%M',      
-                        '%m/%d/%Y', '%d-%m-%Y',                  
-                        '%Y%m%d%H%M%S', 
-                        '%Y%m%d'      
-                    ]
-                    
-                    found_time_col_and_parsed = False
-                    for col in actual_time_cols_in_df:
-                        # 嘗試使用明確格式解析
-                        for fmt in possible_date_formats:
-                            parsed_dates = pd.to_datetime(df_part[col], format=fmt, errors='coerce')
-                            valid_time_ratio = parsed_dates.count() / len(df_part) if len(df_part) > 0 else 0
-                            if valid_time_ratio > 0.5: # 如果超過一半的日期成功解析
-                                df_part['ds'] = parsed_dates
-                                found_time_col_and_parsed = True
-                                st.info(f"文件 '{file_path}' 的時間列 '{col}' 已使用格式 '{fmt}' 成功解析。")
-                                break 
-                        if found_time_col_and_parsed:
-                            break 
-
-                    if not found_time_col_and_parsed:
-                        # 如果所有明確格式都失敗，最後嘗試自動推斷（可能產生 UserWarning）
-                        for col in actual_time_cols_in_df:
-                            parsed_dates = pd.to_datetime(df_part[col], errors='coerce', infer_datetime_format=True)
-                            valid_time_ratio = parsed_dates.count() / len(df_part) if len(df_part) > 0 else 0
-                            if valid_time_ratio > 0.5:
-                                df_part['ds'] = parsed_dates
-                                found_time_col_and_parsed = True
-                                st.warning(f"文件 '{file_path}' 的時間列 '{col}' 無法從預設格式中解析，已嘗試自動推斷格式 (可能較慢)。")
-                                break
-                            
-                    if not found_time_col_and_parsed or df_part['ds'].isnull().all():
-                        st.warning(f"文件 '{file_path}' 中未找到有效的時間列或時間格式無法解析。跳過此文件。")
-                        continue
-                    
-                    df_part.set_index('ds', inplace=True)
-                    all_dfs.append(df_part)
-                except Exception as e:
-                    st.warning(f"載入或處理文件 '{file_path}' 時發生錯誤：{e}。跳過此文件。")
-                    continue
-
-        if not found_any_file:
-            st.error(f"錯誤：在測站 '{station_name}' 的任何指定子文件夾中都沒有找到有效的數據文件。")
-            st.info(f"預期的測站數據根路徑: `{station_data_path}`")
-            return pd.DataFrame()
+    if not csv_files:
+        st.error(f"錯誤：在測站 '{station_name}' 的資料夾中沒有找到有效的數據文件。")
+        st.info(f"預期的測站數據根路徑: `{station_data_path}`")
+        return pd.DataFrame()
 
-        if not all_dfs:
-            st.error(f"錯誤：雖然找到了 CSV 檔案，但沒有任何檔案成功載入並解析出有效時間序列數據。")
-            return pd.DataFrame()
+    # 與 load_year_data 共用同一個讀取引擎，回傳相同的欄位結構
+    all_dfs = [df for df in map(load_single_file, csv_files) if df is not None and not df.empty]
+    if not all_dfs:
+        st.error(f"錯誤：雖然找到了 CSV 檔案，但沒有任何檔案成功載入並解析出有效時間序列數據。")
+        return pd.DataFrame()
+    if len(all_dfs) < len(csv_files):
+        st.warning(f"測站 '{station_name}' 有 {len(csv_files) - len(all_dfs)} 個檔案無法解析出有效的時間序列數據，已略過。")
 
-    # 合併所有 DataFrame，並移除重複索引
-    combined_df = pd.concat(all_dfs).sort_index()
+    # 合併所有 DataFrame，並移除重複時間；預測頁面使用小寫欄名與 'ds' 時間索引
+    combined_df = pd.concat(all_dfs, ignore_index=True)
+    combined_df.columns = combined_df.columns.str.lower()
+    combined_df = combined_df.rename(columns={'time': 'ds'}).set_index('ds').sort_index()
     combined_df = combined_df[~combined_df.index.duplicated(keep='first')]
+    if start_datetime is not None:
+        combined_df = combined_df[combined_df.index >= start_datetime]
+    if end_datetime is not None:
+        combined_df = combined_df[combined_df.index <= end_datetime]
 
     cleaned_df = combined_df.copy() 
 
@@ -494,8 +689,27 @@ def analyze_navigability(df, wave_threshold, wind_threshold):
     return (len(navigable_conditions) / len(df_navi)) * 100
 
 # --- 初始化 Session State，讓所有頁面能共享資料 ---
+def refresh_devices_if_changed():
+    """依 devices.json 的修改時間判斷測站清單是否被抓取程式更新，有變動才重新載入。
+    抓取程式只在測站清單內容改變時才改寫此檔，因此 mtime 可作為低成本的失效訊號。
+    """
+    devices_path = os.path.join(BASE_DATA_PATH_FROM_CONFIG, "devices.json")
+    mtime = os.path.getmtime(devices_path)
+    if st.session_state.get('devices_mtime') == mtime:
+        return False
+
+    with open(devices_path, 'r', encoding='utf-8') as f:
+        st.session_state.devices = json.load(f)
+    st.session_state.devices_mtime = mtime
+    st.session_state.locations = [device['StationID'] for device in st.session_state.devices if 'StationID' in device]
+    # 測站清單改變後，可用年份需重新計算
+    st.session_state.pop('available_years', None)
+    return True
+
 def initialize_session_state():
     if "initialized" in st.session_state and st.session_state.initialized:
+        if refresh_devices_if_changed():
+            st.session_state.available_years = get_available_years(st.session_state.base_data_path, st.session_state.locations)
         return
 
     st.session_state.initialized = True
@@ -522,15 +736,12 @@ def initialize_session_state():
         st.session_state.chinese_font_path = CHINESE_FONT_PATH_FULL
     if 'chinese_font_name' not in st.session_state: # 新增：Plotly 需要字體名稱
         st.session_state.chinese_font_name = CHINESE_FONT_NAME
-    if 'devices' not in st.session_state:
-        with open(os.path.join(BASE_DATA_PATH_FROM_CONFIG, "devices.json"), 'r', encoding='utf-8') as f:
-            st.session_state.devices = json.load(f)
+    if 'devices' not in st.session_state or 'devices_mtime' not in st.session_state:
+        refresh_devices_if_changed()
     if 'parameter_info' not in st.session_state:
         st.session_state.parameter_info = PARAMETER_INFO
     if 'data_subfolders_priority' not in st.session_state:
         st.session_state.data_subfolders_priority = DATA_SUBFOLDERS_PRIORITY
-    if 'locations' not in st.session_state:
-        st.session_state.locations = [device['StationID'] for device in st.session_state.devices if 'StationID' in device]
     if 'risk_thresholds' not in st.session_state:
         st.session_state.risk_thresholds = RISK_THRESHOLDS
 
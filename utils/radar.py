@@ -1,12 +1,8 @@
-import os
-from re import I, S
-from typing import List
-import numpy as np
-from numpy.typing import NDArray
-from pandas import pandas
-from streamlit_folium import st
+from typing import List, Optional
 
 from utils.helpers import DatasetCategory, StationDate, StationMetadata, get_data_path, list_station_dates
+from utils.radar_prep import is_preparing, prepared_state
+from utils.radar_render import RadarOverlay, cached_overlay
 
 class Radar:
     def __init__(
@@ -32,71 +28,24 @@ class Radar:
     def list_date(self) -> List[StationDate]:
         return list_station_dates(DatasetCategory.RADAR, self.path)
 
-    def load_data(self, date: str) -> NDArray[np.float32]:
+    def load_overlay(self, date: str, normalization: str = "linear") -> Optional[RadarOverlay]:
         """
-        Loads radar data for a specific date.
-        :param date: Date in the format 'YYYY-MM-DD'
-        :return: A np array of radar data for the specified date (2D array)
+        Colorized PNG overlay of a date, as rendered by `python -m utils.radar_worker`. Nothing is rendered here.
+        :return: The overlay, or None while the date or its overlay is not prepared yet
         """
-        return load_data(self.path, date)
+        return cached_overlay(date_path(self.path, date), normalization)
 
-    def prepare_data(self, path: str) -> NDArray[np.float32]:
-        return prepare_data(path)
+    def prepared_state(self, date: str) -> str:
+        """"ready", "stale" (newer scans are waiting to be prepared) or "missing"."""
+        return prepared_state(date_path(self.path, date))
 
+    def is_preparing(self, date: str) -> bool:
+        return is_preparing(date_path(self.path, date))
 
-@st.cache_data
-def load_data(station_path: str, date: str) -> NDArray[np.float32]:
-    """
-    Loads radar data for a specific date.
-    :return: A np array of radar data for the specified date (2D array)
-    """
-    dates = list_station_dates(DatasetCategory.RADAR, station_path)
 
-    path: str = ""
-    for d in dates:
-        if d["date"] != date: continue
-        path = d["path"]
-        break
-
-    if not path:
-        raise ValueError(f"Date {date} not found for radar ({path})")
-
-    # Check if data not prepared
-    npy_path = os.path.join(path, "prepared.npy")
-    if not os.path.exists(npy_path):
-        return prepare_data(path)
-
-    return np.load(npy_path).astype(np.float32)
-
-@st.cache_resource
-def prepare_data(path: str) -> NDArray[np.float32]:
-    """
-    Prepares radar data from a specified path.
-    :param path: Path to the data files
-    :return: A message indicating that data has been prepared
-    """
-    # load all .csv files in the path
-    # sort the files by filename
-    files = sorted([f for f in os.listdir(path) if f.endswith('.txt')])
-    if not files:
-        raise ValueError(f"No TXT files found in path: {path}")
-
-    # create a 2D np array to hold the data
-    data = np.empty((0, 6), dtype=np.float32)
-
-    # load each file
-    # split by 5space (but negative will less 1 space)
-    # the file have 6 columns
-    for file in files:
-        file_path = os.path.join(path, file)
-        colspecs = [(0, 13), (13, 26), (26, 39), (39, 52), (52, 65), (65, None)]
-        df = pandas.read_fwf(file_path, colspecs=colspecs, header=None)
-        df = df.fillna(0.0).astype(np.float32)
-        data = np.hstack((data, df.values)) if data.size else df.values
-
-
-    # save as gray image with float32 2d array
-    print(f"Preparing data for radar ({path})")
-    np.save(os.path.join(path, "prepared.npy"), data)
-    
-    return data
+def date_path(station_path: str, date: str) -> str:
+    """Folder holding the scans of a date ('YYYY-MM-DD')."""
+    for d in list_station_dates(DatasetCategory.RADAR, station_path):
+        if d["date"] == date:
+            return d["path"]
+    raise ValueError(f"Date {date} not found for radar ({station_path})")
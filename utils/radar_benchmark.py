@@ -0,0 +1,83 @@
+"""
+Benchmark of the radar day preparation on a synthetic day of scans.
+
+Writes ``--scans`` fixed-width scan files of ``--rows`` rows into a temporary
+folder and times the former preparation (``pandas.read_fwf`` per file, the
+result grown with ``np.hstack``) against ``utils.radar_prep.assemble_day``,
+checking that both produce the same array. Run with
+``python -m utils.radar_benchmark``.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from utils.radar_prep import FIELD_STARTS, FIELD_WIDTH, assemble_day, list_scan_files
+
+
+def write_synthetic_day(path: str, scans: int, rows: int, seed: int = 0):
+    """Scan files like the radar's: six 13-character fields, some short lines and blank fields."""
+    rng = np.random.default_rng(seed)
+    for i in range(scans):
+        values = rng.normal(0, 50, size=(rows, len(FIELD_STARTS)))
+        lines = []
+        for r, row in enumerate(values):
+            line = "".join(f"{value:{FIELD_WIDTH}.6f}" for value in row)
+            if r % 97 == 5:
+                line = line[:FIELD_STARTS[4]]
+            elif r % 131 == 7:
+                line = line[:FIELD_WIDTH] + " " * FIELD_WIDTH + line[2 * FIELD_WIDTH:]
+            lines.append(line)
+        with open(os.path.join(path, f"{i:04d}.txt"), "w") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+def hstack_prepare(path: str) -> np.ndarray:
+    """The former preparation, kept here as the baseline."""
+    import pandas
+
+    data = np.empty((0, 6), dtype=np.float32)
+    for file in list_scan_files(path):
+        colspecs = [(0, 13), (13, 26), (26, 39), (39, 52), (52, 65), (65, None)]
+        df = pandas.read_fwf(os.path.join(path, file), colspecs=colspecs, header=None)
+        df = df.fillna(0.0).astype(np.float32)
+        data = np.hstack((data, df.values)) if data.size else df.values
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the radar day preparation with the former read_fwf/np.hstack version.")
+    parser.add_argument("--scans", type=int, default=288, help="Scan files in the synthetic day (default: one every 5 minutes)")
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per scan file")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes for assemble_day")
+    args = parser.parse_args()
+
+    path = tempfile.mkdtemp(prefix="radar_day_")
+    try:
+        write_synthetic_day(path, args.scans, args.rows)
+        values = args.scans * args.rows * len(FIELD_STARTS)
+        print(f"📡 Synthetic day: {args.scans} scan(s) x {args.rows} row(s), {values:,} values")
+
+        started = time.perf_counter()
+        baseline = hstack_prepare(path)
+        baseline_seconds = time.perf_counter() - started
+        print(f"🐢 read_fwf + np.hstack: {baseline_seconds:.2f}s ({values / baseline_seconds:,.0f} values/s)")
+
+        for workers in sorted({1, args.workers}):
+            started = time.perf_counter()
+            data = assemble_day(path, workers=workers)
+            seconds = time.perf_counter() - started
+            print(f"🚀 assemble_day, {workers} worker(s): {seconds:.2f}s ({values / seconds:,.0f} values/s, "
+                  f"{baseline_seconds / seconds:.1f}x)")
+            if not np.array_equal(data, baseline):
+                raise SystemExit("❌ assemble_day result differs from the baseline")
+        print(f"✅ Same {data.shape} float32 array")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
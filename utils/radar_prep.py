@@ -0,0 +1,165 @@
+"""
+Parsing of the radar scan text files into the prepared day array.
+
+Each radar date folder holds one ``.txt`` file per scan: rows of six
+fixed-width numeric fields (13 characters each, the last one running to the
+end of the line; blank or missing fields read as 0). The prepared array of a
+day puts the scans side by side in filename order, shape (rows, 6 * scans),
+float32. The output is allocated once from the file list and every scan is
+parsed by slicing the raw bytes into fields and converting them in a single
+numpy cast, optionally across a pool of worker processes.
+
+``prepared.npy`` in the date folder is written atomically under a lock file
+and counts as ready while it is at least as new as every scan. It is built by
+``python -m utils.radar_worker``; the app only reads it. This module does not
+import Streamlit or the app helpers so that worker processes start quickly.
+"""
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+import numpy as np
+from numpy.typing import NDArray
+
+from utils.storage import FileLock
+
+FIELD_STARTS = [0, 13, 26, 39, 52, 65]
+FIELD_WIDTH = 13
+SCAN_COLUMNS = len(FIELD_STARTS)
+# Starting the workers takes up to a second; a process parses about 35 MB of scans per second, so
+# smaller days are faster in-process
+MIN_POOL_BYTES = 64 * 1024 * 1024
+PREPARED_FILE = "prepared.npy"
+LOCK_FILE = ".prepare.lock"
+# A lock file older than this is left over from a crashed preparation
+LOCK_STALE_AFTER = 300.0
+
+
+def list_scan_files(path: str) -> List[str]:
+    """Scan files of a date folder in filename order."""
+    return sorted(f for f in os.listdir(path) if f.endswith(".txt"))
+
+
+def newest_scan_mtime_ns(path: str) -> int:
+    return max((os.stat(os.path.join(path, f)).st_mtime_ns for f in list_scan_files(path)), default=0)
+
+
+def prepared_path(path: str) -> str:
+    return os.path.join(path, PREPARED_FILE)
+
+
+def prepared_state(path: str) -> str:
+    """"ready" when the prepared array covers every scan of the date folder, "stale" when scans are newer, else "missing"."""
+    try:
+        prepared_mtime_ns = os.stat(prepared_path(path)).st_mtime_ns
+    except OSError:
+        return "missing"
+    return "ready" if prepared_mtime_ns >= newest_scan_mtime_ns(path) else "stale"
+
+
+def is_preparing(path: str) -> bool:
+    """True while a process holds the preparation lock of the date folder."""
+    try:
+        return time.time() - os.path.getmtime(os.path.join(path, LOCK_FILE)) <= LOCK_STALE_AFTER
+    except OSError:
+        return False
+
+
+def parse_scan(file_path: str) -> NDArray[np.float32]:
+    """Parse one fixed-width scan file into a (rows, 6) float32 array (blank lines skipped, blank fields 0)."""
+    buffer = np.fromfile(file_path, dtype=np.uint8)
+    if len(buffer) and buffer[-1] != ord("\n"):
+        buffer = np.append(buffer, np.uint8(ord("\n")))
+    buffer[(buffer == ord("\r")) | (buffer == ord("\t"))] = ord(" ")
+    ends = np.flatnonzero(buffer == ord("\n"))
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts
+
+    # Lay the lines out as a space-padded byte matrix; the last field runs to the end of the line
+    line_width = max(int(lengths.max(initial=0)), FIELD_STARTS[-1] + FIELD_WIDTH)
+    if len(ends) and lengths.min() == line_width:
+        # Every line is full width: the file itself is the matrix (plus the newline column)
+        raw = buffer.reshape(len(ends), line_width + 1)[:, :line_width]
+    else:
+        offsets = np.arange(line_width)
+        positions = np.minimum(starts[:, None] + offsets, max(len(buffer) - 1, 0))
+        raw = np.where(offsets < lengths[:, None], buffer[positions], np.uint8(ord(" "))) if len(buffer) else np.empty((0, line_width), np.uint8)
+    raw = raw[(raw != ord(" ")).any(axis=1)]
+    if not len(raw):
+        return np.zeros((0, SCAN_COLUMNS), dtype=np.float32)
+
+    width = line_width - FIELD_STARTS[-1]
+    if width == FIELD_WIDTH:
+        fields = raw.reshape(len(raw), SCAN_COLUMNS, FIELD_WIDTH)
+    else:
+        fields = np.full((len(raw), SCAN_COLUMNS, width), ord(" "), dtype=np.uint8)
+        for i, start in enumerate(FIELD_STARTS[:-1]):
+            fields[:, i, :FIELD_WIDTH] = raw[:, start:start + FIELD_WIDTH]
+        fields[:, -1, :] = raw[:, FIELD_STARTS[-1]:]
+    fields[(fields == ord(" ")).all(axis=2), 0] = ord("0")
+
+    values = fields.view(f"S{width}").reshape(len(raw), SCAN_COLUMNS).astype(np.float64).astype(np.float32)
+    values[np.isnan(values)] = 0.0
+    return values
+
+
+def assemble_day(path: str, workers: Optional[int] = None) -> NDArray[np.float32]:
+    """
+    Parse every scan of a date folder into the prepared (rows, 6 * scans) array.
+    :param workers: Worker processes (default: CPU count, for days of at least MIN_POOL_BYTES); 1 parses in this process
+    """
+    files = [os.path.join(path, f) for f in list_scan_files(path)]
+    if not files:
+        raise ValueError(f"No TXT files found in path: {path}")
+
+    if workers is None:
+        workers = (os.cpu_count() or 1) if sum(os.path.getsize(f) for f in files) >= MIN_POOL_BYTES else 1
+    workers = min(workers, len(files))
+    if workers > 1:
+        # Spawned rather than forked: the app server is multi-threaded, and the workers only import numpy
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        scans = executor.map(parse_scan, files, chunksize=max(1, len(files) // (workers * 4)))
+    else:
+        executor = None
+        scans = map(parse_scan, files)
+
+    try:
+        data = None
+        for i, (file_path, scan) in enumerate(zip(files, scans)):
+            if data is None:
+                data = np.empty((scan.shape[0], SCAN_COLUMNS * len(files)), dtype=np.float32)
+            if scan.shape[0] != data.shape[0]:
+                raise ValueError(f"{file_path} has {scan.shape[0]} rows, expected {data.shape[0]} like the other scans")
+            data[:, i * SCAN_COLUMNS:(i + 1) * SCAN_COLUMNS] = scan
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    return data
+
+
+def prepare_date(path: str, force: bool = False, workers: Optional[int] = 1) -> bool:
+    """
+    Write the prepared array of a date folder unless it is already ready.
+    :param force: Rebuild even when the prepared array is up to date
+    :param workers: Passed to `assemble_day`
+    :return: True when the array was (re)written, False when another process had already done it
+    """
+    with FileLock(os.path.join(path, LOCK_FILE), stale_after=LOCK_STALE_AFTER):
+        if not force and prepared_state(path) == "ready":
+            return False
+        # Stamp the array with the newest scan it was built from, so a scan arriving meanwhile leaves it stale
+        scans_mtime_ns = newest_scan_mtime_ns(path)
+        data = assemble_day(path, workers)
+        tmp_path = f"{prepared_path(path)}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, data)
+            os.utime(tmp_path, ns=(scans_mtime_ns, scans_mtime_ns))
+            os.replace(tmp_path, prepared_path(path))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    return True
@@ -0,0 +1,138 @@
+"""
+Colorized radar overlays cached as PNG files.
+
+A prepared radar day (see ``utils.radar_prep``) is scaled to 0-255 and
+colored through a 256-entry RGBA lookup table built once from the legend's
+hue ramp (red at the minimum, through blue, to green at the maximum), then
+encoded as a PNG under ``<date folder>/overlay/``. The file name holds the
+normalization and the fingerprint of ``prepared.npy``, so a re-prepared day
+gets a new image; the bounds of the color scale and the array shape are kept
+in a JSON file next to it. The map only reads these files, so drawing the
+overlay does not depend on the radar resolution.
+"""
+import json
+import os
+import uuid
+from typing import Callable, List, Optional, Tuple, TypedDict
+
+import numpy as np
+from numpy.typing import NDArray
+from PIL import Image
+
+from utils.helpers import hsl_to_rgb
+from utils.radar_prep import prepared_path
+from utils.shared_cache import file_fingerprint
+
+OVERLAY_FOLDER = "overlay"
+NORMALIZATIONS = ["linear"]
+
+
+class RadarOverlay(TypedDict):
+    png_path: str
+    vmin: float
+    vmax: float
+    shape: List[int]  # (rows, columns) of the prepared array
+
+
+def build_color_lut() -> NDArray[np.uint8]:
+    """RGBA color of every scaled value 0-255, the hue ramp of the legend on page 1."""
+    lut = np.empty((256, 4), dtype=np.uint8)
+    for value in range(256):
+        lut[value, :3] = hsl_to_rgb(1 - value / 255 * 3 / 4, 0.5, 0.5)
+    lut[:, 3] = 255
+    return lut
+
+
+COLOR_LUT = build_color_lut()
+
+
+def normalize(data: NDArray[np.float32], normalization: str) -> Tuple[NDArray[np.float32], float, float]:
+    """Scale the array to 0-255; returns the scaled array and the values at both ends of the scale."""
+    if normalization != "linear":
+        raise ValueError(f"Unknown radar normalization: {normalization}")
+    vmax = np.ceil(np.nanmax(data))
+    vmin = np.floor(np.nanmin(data))
+    if vmax == vmin:
+        return np.zeros_like(data), float(vmin), float(vmax)
+    return (data - vmin) / (vmax - vmin) * 255, float(vmin), float(vmax)
+
+
+def colorize(scaled: NDArray[np.float32]) -> NDArray[np.uint8]:
+    """RGBA image of a scaled array (NaN transparent), transposed to the overlay orientation."""
+    missing = np.isnan(scaled)
+    rgba = COLOR_LUT[np.where(missing, 0, scaled).astype(np.uint8).T]
+    rgba[missing.T, 3] = 0
+    return rgba
+
+
+def overlay_base(path: str, normalization: str, fingerprint: str) -> str:
+    return os.path.join(path, OVERLAY_FOLDER, f"{normalization}-{fingerprint}")
+
+
+def cached_overlay(path: str, normalization: str = "linear") -> Optional[RadarOverlay]:
+    """Overlay of a date folder if its PNG is already cached for the current prepared array, else None."""
+    fingerprint = file_fingerprint(prepared_path(path))
+    if fingerprint is None:
+        return None
+    base = overlay_base(path, normalization, fingerprint)
+    try:
+        with open(f"{base}.json", "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return RadarOverlay(png_path=f"{base}.png", **meta)
+
+
+def render_overlay(path: str, normalization: str = "linear") -> Optional[RadarOverlay]:
+    """
+    Overlay of a date folder, rendered and cached on disk when missing.
+    :return: None when the date has no prepared array
+    """
+    overlay = cached_overlay(path, normalization)
+    if overlay is not None:
+        return overlay
+    npy_path = prepared_path(path)
+    fingerprint = file_fingerprint(npy_path)
+    if fingerprint is None:
+        return None
+
+    data = np.load(npy_path)
+    scaled, vmin, vmax = normalize(data, normalization)
+    base = overlay_base(path, normalization, fingerprint)
+    os.makedirs(os.path.dirname(base), exist_ok=True)
+    _write_atomically(f"{base}.png", lambda tmp_path: Image.fromarray(colorize(scaled), "RGBA").save(tmp_path, format="PNG"))
+    # Written last: its presence marks the PNG as complete
+    meta = {"vmin": vmin, "vmax": vmax, "shape": list(data.shape)}
+    _write_atomically(f"{base}.json", lambda tmp_path: _write_json(tmp_path, meta))
+    _prune_overlays(path, normalization, fingerprint)
+    return RadarOverlay(png_path=f"{base}.png", **meta)
+
+
+def _write_json(file_path: str, value):
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump(value, f)
+
+
+def _write_atomically(file_path: str, write: Callable[[str], None]):
+    """Write through a private temp file and rename it, so sessions rendering the same overlay never see a partial file."""
+    tmp_path = f"{file_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        write(tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _prune_overlays(path: str, normalization: str, fingerprint: str):
+    """Remove the overlays of earlier prepared arrays of the same normalization."""
+    folder = os.path.join(path, OVERLAY_FOLDER)
+    current = os.path.basename(overlay_base(path, normalization, fingerprint))
+    for name in os.listdir(folder):
+        stem = name.split(".")[0]
+        if stem.startswith(f"{normalization}-") and stem != current and not name.endswith(".tmp"):
+            try:
+                os.remove(os.path.join(folder, name))
+            except FileNotFoundError:
+                pass
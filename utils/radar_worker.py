@@ -0,0 +1,95 @@
+"""
+Offline preparation of the radar day arrays.
+
+Lists every radar station of ``<dataset_path>/radar/stations.json`` and every
+date folder of it, and writes ``prepared.npy`` (see ``utils.radar_prep``) for
+the dates that have none or whose scans are newer, one date per worker
+process, then renders their map overlay (``utils.radar_render``). The app
+never parses scans or renders overlays itself and shows a "preparing" state
+for dates without a rendered overlay, so run this after new scans arrive, or
+keep it running with ``--interval``: ``python -m utils.radar_worker``.
+"""
+import argparse
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple
+
+from utils.helpers import DatasetCategory, get_data_path, list_station_dates, list_station_metadata
+from utils.radar_prep import prepare_date, prepared_state
+from utils.radar_render import cached_overlay, render_overlay
+
+
+def pending_dates(station_ids: Optional[List[str]] = None, force: bool = False) -> List[Tuple[str, str, str]]:
+    """(StationID, date, date folder) of every radar date whose prepared array is missing or stale, or has no overlay yet."""
+    # Both lookups are st.cache_data; drop their results so new stations and dates are seen on every pass
+    list_station_dates.clear()
+    get_data_path.clear()
+    pending = []
+    for metadata in list_station_metadata(DatasetCategory.RADAR):
+        station_id = metadata["StationID"]
+        if station_ids and station_id not in station_ids:
+            continue
+        try:
+            station_path = get_data_path(DatasetCategory.RADAR, station_id)
+        except FileNotFoundError as e:
+            print(f"⚠️ [{station_id}] {e}")
+            continue
+        for date in list_station_dates(DatasetCategory.RADAR, station_path):
+            if force or prepared_state(date["path"]) != "ready" or cached_overlay(date["path"]) is None:
+                pending.append((station_id, date["date"], date["path"]))
+    return pending
+
+
+def prepare_and_render(path: str, force: bool) -> bool:
+    """Prepare one date folder and render its overlay; True when the prepared array was (re)written."""
+    written = prepare_date(path, force)
+    render_overlay(path)
+    return written
+
+
+def prepare_pending(station_ids: Optional[List[str]], workers: Optional[int], force: bool) -> int:
+    """Prepare every pending date in a process pool; returns the number of arrays written."""
+    pending = pending_dates(station_ids, force)
+    if not pending:
+        print("✅ Every radar date is prepared")
+        return 0
+    print(f"📡 Preparing {len(pending)} radar date(s)")
+    started = time.monotonic()
+    written = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(prepare_and_render, path, force): (station_id, date) for station_id, date, path in pending}
+        for future in as_completed(futures):
+            station_id, date = futures[future]
+            try:
+                if future.result():
+                    written += 1
+                    print(f"✅ [{station_id}] {date} prepared")
+                else:
+                    print(f"⏭️ [{station_id}] {date} already prepared, overlay rendered")
+            except Exception as e:
+                print(f"❌ [{station_id}] {date} preparation failed: {e}")
+    print(f"📊 {written} date(s) prepared in {time.monotonic() - started:.1f}s")
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Prepare the radar day arrays that are missing or older than their scans.")
+    parser.add_argument("--stations", nargs="+", help="Radar StationIDs to prepare (default: every station in stations.json)")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Rebuild every date, even the up-to-date ones")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="Seconds between passes; keeps running and prepares new scans as they arrive (default: one pass)")
+    args = parser.parse_args()
+
+    force = args.force
+    while True:
+        prepare_pending(args.stations, args.workers, force)
+        if args.interval <= 0:
+            break
+        # --force only applies to the first pass; later passes pick up new scans
+        force = False
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
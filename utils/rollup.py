@@ -0,0 +1,248 @@
+"""
+Multi-resolution rollups of the buoy observations.
+
+For every station and year, ``<base>_rollup/<StationID>/<YYYY>/<level>.parquet``
+holds hourly, daily and monthly buckets in long form: ``time`` (bucket
+start), ``parameter``, ``count``, ``sum``, ``sumsq``, ``min``, ``max``,
+``sin_sum`` and ``cos_sum``. These statistics merge exactly, so any coarser
+frequency (weeks, years) and any range can be derived from the level below
+it, and means and standard deviations follow from them without touching the
+raw rows. Directions are averaged circularly, like the hourly tensors: their
+mean and standard deviation come from the sums of the unit vectors
+(``sin_sum``, ``cos_sum``; zero for other parameters). Files written before
+those columns existed are rebuilt on the next write of their year. The writer
+refreshes the buckets of every station-month it wrote, in batches (see
+``storage.PartitionWriter``), and ``python -m utils.rollup`` builds the
+rollups of an existing dataset.
+"""
+import argparse
+import os
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.storage import (
+    DIRECTION_COLUMNS, NUMERIC_COLUMNS, UTC8_OFFSET_SECONDS, FileLock, circular_mean, list_partitions,
+    normalize_rows, pyarrow_available, read_csv_rows, read_fresh_sidecar,
+)
+
+LEVELS = ["hourly", "daily", "monthly"]
+CIRCULAR_STATS = ["sin_sum", "cos_sum"]
+STAT_COLUMNS = ["count", "sum", "sumsq", "min", "max"] + CIRCULAR_STATS
+STAT_MERGE = {"count": "sum", "sum": "sum", "sumsq": "sum", "min": "min", "max": "max", "sin_sum": "sum", "cos_sum": "sum"}
+
+
+def rollup_root(base_path: str) -> str:
+    return f"{os.path.normpath(base_path)}_rollup"
+
+
+def read_partition(csv_path: str) -> pd.DataFrame:
+    """Typed rows of one monthly partition (store partition when fresh, CSV otherwise)."""
+    df = read_fresh_sidecar(csv_path)
+    if df is None:
+        df = normalize_rows(read_csv_rows(csv_path))
+        df["time"] = pd.to_datetime(df["time"] + UTC8_OFFSET_SECONDS, unit="s")
+    return df
+
+
+def level_for(freq: str) -> Optional[str]:
+    """Coarsest stored level from which a pandas frequency can be built, or None if it needs raw rows."""
+    unit = freq.lstrip("0123456789").upper()
+    if unit in ("H",):
+        return "hourly"
+    if unit in ("D", "W") or unit.startswith("W-"):
+        return "daily"
+    if unit in ("M", "ME", "MS", "Q", "QE", "QS", "Y", "YE", "YS", "A"):
+        return "monthly"
+    return None
+
+
+def bucket_start(times: pd.Series, level: str) -> pd.Series:
+    if level == "hourly":
+        return times.dt.floor("h")
+    if level == "daily":
+        return times.dt.floor("D")
+    return times.dt.to_period("M").dt.start_time
+
+
+def aggregate(df: pd.DataFrame, level: str) -> pd.DataFrame:
+    """Bucket typed observations (datetime `time`) into long-form rollup statistics."""
+    columns = [col for col in NUMERIC_COLUMNS if col in df.columns]
+    df = df.dropna(subset=["time"])
+    values = df[columns].astype("float64")
+    buckets = bucket_start(df["time"], level).rename("time")
+    grouped = values.groupby(buckets, sort=True)
+    radians = np.radians(values[[col for col in columns if col in DIRECTION_COLUMNS]])
+    stats = {"count": grouped.count(), "sum": grouped.sum(), "sumsq": (values ** 2).groupby(buckets).sum(),
+             "min": grouped.min(), "max": grouped.max(),
+             "sin_sum": np.sin(radians).groupby(buckets).sum(), "cos_sum": np.cos(radians).groupby(buckets).sum()}
+    result = pd.concat({stat: frame.rename_axis(columns="parameter").stack() for stat, frame in stats.items()}, axis=1)
+    result = result.reset_index()
+    result = result[result["count"] > 0].astype({"count": "int64"})
+    result[CIRCULAR_STATS] = result[CIRCULAR_STATS].fillna(0.0)
+    return result[["time", "parameter"] + STAT_COLUMNS].sort_values(["time", "parameter"]).reset_index(drop=True)
+
+
+def regroup(frame: pd.DataFrame, freq: str) -> pd.DataFrame:
+    """Merge rollup buckets into a coarser pandas frequency (labels as `DataFrame.resample` would give)."""
+    if frame.empty:
+        return frame
+    grouped = frame.groupby(["parameter", pd.Grouper(key="time", freq=freq)])
+    merged = grouped.agg(**{col: (col, how) for col, how in STAT_MERGE.items()}).reset_index()
+    return merged[merged["count"] > 0][["time", "parameter"] + STAT_COLUMNS].reset_index(drop=True)
+
+
+def with_moments(frame: pd.DataFrame) -> pd.DataFrame:
+    """
+    Add `mean` and sample `std` derived from count, sum and sumsq. For directions both are circular
+    (degrees): the direction of the summed unit vectors and sqrt(-2 ln R), R being their mean length.
+    """
+    frame = frame.copy()
+    count = frame["count"].astype("float64")
+    frame["mean"] = frame["sum"] / count
+    variance = (frame["sumsq"] - frame["sum"] ** 2 / count) / (count - 1)
+    frame["std"] = np.sqrt(variance.clip(lower=0)).where(count > 1)
+    circular = frame["parameter"].isin(DIRECTION_COLUMNS)
+    if circular.any():
+        resultant = np.hypot(frame["sin_sum"], frame["cos_sum"]) / count
+        with np.errstate(divide="ignore"):
+            circular_std = np.degrees(np.sqrt(-2 * np.log(resultant.clip(upper=1))))
+        frame["mean"] = frame["mean"].mask(circular, circular_mean(frame["sin_sum"], frame["cos_sum"]))
+        frame["std"] = frame["std"].mask(circular, circular_std.where((count > 1) & (resultant > 0)))
+    return frame
+
+
+class RollupStore:
+    """Hourly, daily and monthly rollup files of each station and year."""
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self.root = rollup_root(base_path)
+
+    def rollup_path(self, device_id: str, year: int, level: str) -> str:
+        return os.path.join(self.root, device_id, str(year), f"{level}.parquet")
+
+    def is_fresh(self, device_id: str, year: int) -> bool:
+        """True when every rollup level of the year is at least as new as all of that year's monthly files."""
+        station_path = os.path.join(self.base_path, device_id)
+        try:
+            newest_csv = max((os.path.getmtime(os.path.join(station_path, f))
+                              for f in list_partitions(station_path) if f.startswith(str(year))), default=None)
+            if newest_csv is None:
+                return False
+            return all(os.path.getmtime(self.rollup_path(device_id, year, level)) >= newest_csv for level in LEVELS)
+        except OSError:
+            return False
+
+    def read(self, device_id: str, years: Iterable[int], level: str,
+             parameters: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+        """Long-form buckets of the given years, or None when any of them is missing or stale."""
+        if not pyarrow_available:
+            return None
+        frames = []
+        for year in years:
+            if not self.is_fresh(device_id, year):
+                return None
+            filters = [("parameter", "in", list(parameters))] if parameters else None
+            frame = pd.read_parquet(self.rollup_path(device_id, year, level), filters=filters)
+            if not set(CIRCULAR_STATS).issubset(frame.columns):
+                return None  # Written before the direction sums were stored
+            frames.append(frame)
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True)
+
+    def resample(self, device_id: str, years: Iterable[int], parameters: List[str], freq: str) -> Optional[pd.DataFrame]:
+        """Statistics per `freq` bucket built from the coarsest level that can produce it, or None if unavailable."""
+        level = level_for(freq)
+        if level is None:
+            return None
+        frame = self.read(device_id, years, level, parameters)
+        if frame is None:
+            return None
+        if level != "hourly" or freq.lower() != "h":
+            frame = regroup(frame, freq)
+        return with_moments(frame)
+
+    def update_month(self, device_id: str, csv_path: str):
+        """Recompute the buckets of one station-month from its partition and splice them into the year files."""
+        if not pyarrow_available:
+            return
+        month = os.path.splitext(os.path.basename(csv_path))[0]
+        month_start = datetime(int(month[:4]), int(month[4:6]), 1)
+        if not self._has_current_layout(device_id, month_start.year):
+            # The other months of the year lack the direction sums too
+            self.build_year(device_id, month_start.year)
+            return
+        self._write_year(device_id, month_start.year, read_partition(csv_path), month_start,
+                         month_start + pd.offsets.MonthBegin(1))
+
+    def _has_current_layout(self, device_id: str, year: int) -> bool:
+        """False when a level file of the year was written without the direction sums."""
+        import pyarrow.parquet as pq
+        for level in LEVELS:
+            file_path = self.rollup_path(device_id, year, level)
+            if os.path.exists(file_path) and not set(CIRCULAR_STATS).issubset(pq.read_schema(file_path).names):
+                return False
+        return True
+
+    def _write_year(self, device_id: str, year: int, df: pd.DataFrame, start: datetime, end: datetime):
+        """Replace the buckets in [start, end) of every level of one station-year with those of `df`."""
+        df = df[(df["time"] >= start) & (df["time"] < end)]
+        year_path = os.path.join(self.root, device_id, str(year))
+        os.makedirs(year_path, exist_ok=True)
+        with FileLock(os.path.join(year_path, ".lock")):
+            for level in LEVELS:
+                file_path = self.rollup_path(device_id, year, level)
+                buckets = aggregate(df, level)
+                if os.path.exists(file_path):
+                    existing = pd.read_parquet(file_path)
+                    existing = existing[(existing["time"] < start) | (existing["time"] >= end)]
+                    buckets = pd.concat([existing, buckets], ignore_index=True)
+                buckets = buckets.sort_values(["time", "parameter"], kind="stable")
+                tmp_path = f"{file_path}.tmp"
+                buckets.to_parquet(tmp_path, index=False)
+                os.replace(tmp_path, file_path)
+
+    def build_year(self, device_id: str, year: int) -> int:
+        """Rewrite one station-year from all of its monthly files; returns the number of months read."""
+        station_path = os.path.join(self.base_path, device_id)
+        csv_paths = [os.path.join(station_path, f) for f in list_partitions(station_path) if f.startswith(str(year))]
+        if not csv_paths:
+            return 0
+        df = pd.concat([read_partition(csv_path) for csv_path in csv_paths], ignore_index=True)
+        self._write_year(device_id, year, df, datetime(year, 1, 1), datetime(year + 1, 1, 1))
+        return len(csv_paths)
+
+    def build(self, device_ids: List[str]) -> int:
+        """Rewrite every year of the given stations in one pass; returns the number of station-months read."""
+        if not pyarrow_available:
+            return 0
+        months = 0
+        for device_id in device_ids:
+            station_path = os.path.join(self.base_path, device_id)
+            for year in sorted({int(filename[:4]) for filename in list_partitions(station_path)}):
+                months += self.build_year(device_id, year)
+        return months
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the hourly/daily/monthly rollups from the monthly buoy files.")
+    parser.add_argument("--base", default="dataset/buoy/", help="Dataset folder holding <StationID>/<YYYYMM>.csv")
+    parser.add_argument("--stations", nargs="+", help="StationIDs to build (default: every station folder)")
+    args = parser.parse_args()
+
+    if not pyarrow_available:
+        raise SystemExit("pyarrow is required to build the rollups: pip install pyarrow")
+    device_ids = args.stations or sorted(d for d in os.listdir(args.base) if list_partitions(os.path.join(args.base, d)))
+    print(f"🔺 Building rollups of {len(device_ids)} station(s) into {rollup_root(args.base)}")
+    started = time.monotonic()
+    months = RollupStore(args.base).build(device_ids)
+    print(f"📊 {months} station-month(s) written in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
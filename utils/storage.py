@@ -0,0 +1,712 @@
+"""
+On-disk layout of the buoy dataset and the partitioned writer used by the fetcher.
+
+Observations are stored as one CSV per station and month
+(``<base>/<StationID>/<YYYYMM>.csv``) with a 3-line header: Chinese names,
+English names and units. For every CSV the writer keeps a typed Parquet
+partition in a columnar store next to the dataset
+(``<base>_store/<StationID>/<YYYY>/<MM>.parquet``) with float32 measurements
+and an int64 epoch time sorted ascending, so readers can skip encoding
+detection and type conversion. This module has no Streamlit dependency so
+that it can be shared by the fetcher and the app.
+
+Run ``python -m utils.storage`` to build the store for an existing dataset.
+"""
+import argparse
+import csv
+import os
+import shutil
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Parquet sidecars need pyarrow; without it only the CSV files are written and read
+try:
+    import pyarrow  # noqa: F401
+    pyarrow_available = True
+except ImportError:
+    pyarrow_available = False
+
+TIME_FORMAT = "%Y-%m-%dT%H:%M:%S"
+LOCAL_TZ = timezone(timedelta(hours=8))  # Stored times are UTC+8
+
+CSV_COLUMNS = [
+    "StationID",
+    "time",
+    "Wind_Gust_Speed",
+    "Wind_Speed",
+    "Wind_Direction",
+    "Air_Pressure",
+    "Air_Temperature",
+    "Sea_Temperature",
+    "Wave_Height_Significant",
+    "Wave_Mean_Period",
+    "Wave_Main_Direction",
+    "Wave_Peak_Period",
+    "Current_Speed",
+    "Current_Speed_Layer",
+    "Current_Direction",
+    "Current_Direction_Layer",
+    "Current_Speed_knot",
+    "Tide_Height"
+]
+
+CSV_CHINESE_COLUMNS = [
+    "測站編號",
+    "時間",
+    "陣風_風速",
+    "風速",
+    "風向",
+    "氣壓",
+    "氣溫",
+    "海面溫度",
+    "示性波高",
+    "平均週期",
+    "波向",
+    "波浪尖峰週期",
+    "流速",
+    "分層流速{深度:流速}",
+    "流向",
+    "分層流向{深度:流向}",
+    "流速(節)",
+    "潮高"
+]
+
+CSV_UNITS = [
+    "",
+    "UTC+8",
+    "m/s",
+    "m/s",
+    "degree",
+    "hPa",
+    "C",
+    "C",
+    "m",
+    "sec",
+    "degree",
+    "sec",
+    "m/s",
+    "m/s",
+    "degree",
+    "degree",
+    "knot",
+    "m"
+]
+
+
+# Columns of the typed sidecar that are not float32 measurements
+TEXT_COLUMNS = ["StationID", "Current_Speed_Layer", "Current_Direction_Layer"]
+# Per-depth current profiles: long strings that few views need, so loaders keep them in a side table
+LAYER_COLUMNS = ["Current_Speed_Layer", "Current_Direction_Layer"]
+NUMERIC_COLUMNS = [col for col in CSV_COLUMNS if col != "time" and col not in TEXT_COLUMNS]
+# Directions in degrees: averaged as unit vectors, so 350° and 10° average to 0°, not 180°
+DIRECTION_COLUMNS = [col for col in NUMERIC_COLUMNS if col.endswith("_Direction")]
+UTC8_OFFSET_SECONDS = 8 * 3600
+
+
+def parse_time(value) -> Optional[datetime]:
+    """Parse an observation time into a naive UTC+8 datetime, or None if it is not a time."""
+    if not isinstance(value, str) or not value.strip():
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.strip().replace("/", "-"))
+    except ValueError:
+        return None
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(LOCAL_TZ).replace(tzinfo=None)
+    return parsed
+
+
+def circular_mean(sin_total, cos_total):
+    """Mean direction in degrees [0, 360) from the summed (or averaged) sines and cosines of the angles."""
+    return np.degrees(np.arctan2(sin_total, cos_total)) % 360
+
+
+def local_now() -> datetime:
+    """Current time as a naive UTC+8 datetime, comparable with stored observation times whatever the host's time zone."""
+    return datetime.now(LOCAL_TZ).replace(tzinfo=None)
+
+
+def partition_name(value: datetime) -> str:
+    """Return the monthly CSV file name holding an observation at `value`."""
+    return f"{value.strftime('%Y%m')}.csv"
+
+
+def list_partitions(station_path: str) -> List[str]:
+    """List the station's monthly CSV file names in chronological order."""
+    if not os.path.isdir(station_path):
+        return []
+    return sorted(f for f in os.listdir(station_path) if len(f) == 10 and f[:6].isdigit() and f.endswith(".csv"))
+
+
+def read_partition_times(file_path: str) -> Set[datetime]:
+    """Return every observation time stored in a monthly CSV file."""
+    times: Set[datetime] = set()
+    if not os.path.exists(file_path):
+        return times
+    with open(file_path, newline="", encoding="utf-8", errors="replace") as f:
+        reader = csv.reader(f)
+        header = [next(reader, None) for _ in range(3)]
+        if header[1] is None or "time" not in header[1]:
+            return times
+        time_index = header[1].index("time")
+        for row in reader:
+            parsed = parse_time(row[time_index]) if len(row) > time_index else None
+            if parsed:
+                times.add(parsed)
+    return times
+
+
+class PartitionTimesIndex:
+    """
+    Observation times of the partitions this process wrote last, so a writer
+    does not re-parse a whole monthly CSV on every flush. An entry is only
+    used while the file's inode, mtime and size are the ones recorded after
+    the write; a file changed by another process is read again.
+    """
+
+    def __init__(self, max_partitions: int = 256):
+        self.max_partitions = max_partitions
+        self.entries: "OrderedDict[str, Tuple[Tuple[int, int, int], Set[datetime]]]" = OrderedDict()
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def _file_key(file_path: str) -> Optional[Tuple[int, int, int]]:
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def times(self, file_path: str) -> Set[datetime]:
+        """Every observation time stored in the partition (a private set the caller may extend)."""
+        key = self._file_key(file_path)
+        with self.lock:
+            cached = self.entries.get(file_path)
+            if key is not None and cached is not None and cached[0] == key:
+                self.entries.move_to_end(file_path)
+                return set(cached[1])
+        return read_partition_times(file_path)
+
+    def remember(self, file_path: str, times: Set[datetime]):
+        """Record the times of a partition just written by this process."""
+        key = self._file_key(file_path)
+        if key is None:
+            return
+        with self.lock:
+            self.entries[file_path] = (key, set(times))
+            self.entries.move_to_end(file_path)
+            while len(self.entries) > self.max_partitions:
+                self.entries.popitem(last=False)
+
+
+_partition_times = PartitionTimesIndex()
+
+
+def latest_stored_time(base_path: str, device_id: str) -> Optional[datetime]:
+    """Return the newest time already written to the station's monthly CSV files."""
+    station_path = os.path.join(base_path, device_id)
+    # Newest month first; older months only matter if the newest one is empty
+    for filename in reversed(list_partitions(station_path)):
+        times = read_partition_times(os.path.join(station_path, filename))
+        if times:
+            return max(times)
+    return None
+
+
+# Time column names found in older hand-collected CSV files, in order of preference
+TIME_COLUMN_ALIASES = [
+    "time", "Time", "觀測時間", "Date", "datetime", "Datetime", "DateTime", "時間",
+    "UTC", "GMT", "Local_Time", "TIME_UTC", "Time (UTC)", "time(UTC)", "Time (LST)",
+]
+
+# Time formats tried when sniffing a CSV time column, most common first
+TIME_FORMAT_CANDIDATES = [
+    TIME_FORMAT, "%Y-%m-%dT%H:%M:%S%z", "%Y-%m-%d %H:%M:%S", "%Y/%m/%d %H:%M:%S",
+    "%Y-%m-%d %H:%M", "%Y/%m/%d %H:%M", "%Y-%m-%d", "%Y/%m/%d",
+    "%m/%d/%Y %H:%M:%S", "%d-%m-%Y %H:%M:%S", "%m/%d/%Y %H:%M", "%d-%m-%Y %H:%M",
+    "%m/%d/%Y", "%d-%m-%Y", "%Y%m%d%H%M%S", "%Y%m%d",
+]
+
+
+def find_time_column(columns: Iterable[str]) -> Optional[str]:
+    """Return the column holding observation times, matching the known aliases exactly first, then ignoring case."""
+    columns = list(columns)
+    for alias in TIME_COLUMN_ALIASES:
+        if alias in columns:
+            return alias
+    lowered = {str(col).lower(): col for col in columns}
+    for alias in TIME_COLUMN_ALIASES:
+        if alias.lower() in lowered:
+            return lowered[alias.lower()]
+    return None
+
+
+def sniff_time_format(values: pd.Series, sample_size: int = 50) -> Optional[str]:
+    """Pick the first candidate format that parses most of a small sample; None lets pandas infer the format."""
+    sample = values.dropna().astype(str).str.strip()
+    sample = sample[sample != ""].head(sample_size)
+    if sample.empty:
+        return None
+    for time_format in TIME_FORMAT_CANDIDATES:
+        parsed = pd.to_datetime(sample, format=time_format, errors="coerce", utc="%z" in time_format)
+        if parsed.notna().mean() > 0.5:
+            return time_format
+    return None
+
+
+def parse_time_column(values: pd.Series, time_format: Optional[str]) -> pd.Series:
+    """Parse a whole time column in one pass into naive UTC+8 datetimes; unparseable values become NaT."""
+    if time_format is None:
+        parsed = pd.to_datetime(values, errors="coerce")
+    else:
+        parsed = pd.to_datetime(values, format=time_format, errors="coerce", utc="%z" in time_format)
+    if isinstance(parsed.dtype, pd.DatetimeTZDtype):
+        parsed = parsed.dt.tz_convert(LOCAL_TZ).dt.tz_localize(None)
+    return parsed
+
+
+def read_csv_rows(file_path: str) -> List[dict]:
+    """Read a monthly CSV file into raw row dicts keyed by the English header."""
+    with open(file_path, newline="", encoding="utf-8", errors="replace") as f:
+        next(f, None)  # Chinese names
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader, [])]
+        next(reader, None)  # Units
+        alias = find_time_column(header)
+        if alias and alias != "time":
+            header[header.index(alias)] = "time"
+        return [dict(zip(header, row)) for row in reader]
+
+
+def to_epoch(value: datetime) -> int:
+    """Epoch seconds of a naive UTC+8 time."""
+    return int(value.replace(tzinfo=LOCAL_TZ).timestamp())
+
+
+def normalize_rows(rows: Iterable[dict]) -> pd.DataFrame:
+    """Convert raw observation rows to the typed layout (int64 epoch time, float32 measurements)."""
+    records = []
+    for row in rows:
+        row_time = parse_time(row.get("time"))
+        if row_time is None:
+            continue
+        record = {key: row.get(key) for key in CSV_COLUMNS}
+        record["time"] = to_epoch(row_time)
+        records.append(record)
+
+    df = pd.DataFrame.from_records(records, columns=CSV_COLUMNS)
+    df["time"] = df["time"].astype("int64")
+    for col in NUMERIC_COLUMNS:
+        df[col] = pd.to_numeric(df[col], errors="coerce").astype("float32")
+    for col in TEXT_COLUMNS:
+        df[col] = df[col].fillna("").astype(str)
+    return df
+
+
+def store_root(base_path: str) -> str:
+    """Root of the columnar store that mirrors the dataset at `base_path`."""
+    return f"{os.path.normpath(base_path)}_store"
+
+
+def sidecar_path(csv_path: str) -> str:
+    """Columnar store partition of a monthly CSV: <base>_store/<station>/<YYYY>/<MM>.parquet."""
+    station_path = os.path.dirname(os.path.normpath(csv_path))
+    month = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(store_root(os.path.dirname(station_path)), os.path.basename(station_path),
+                        month[:4], f"{month[4:6]}.parquet")
+
+
+def is_sidecar_fresh(csv_path: str) -> bool:
+    """True when the store partition exists and is at least as new as its CSV."""
+    try:
+        return os.path.getmtime(sidecar_path(csv_path)) >= os.path.getmtime(csv_path)
+    except OSError:
+        return False
+
+
+def update_sidecar(csv_path: str, new_rows: List[dict], append: bool):
+    """
+    Bring the store partition of `csv_path` up to date after new rows were written.
+    :param append: Merge `new_rows` into the existing partition instead of rebuilding it from the whole CSV
+    """
+    if not pyarrow_available:
+        return
+    target = sidecar_path(csv_path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    if append and os.path.exists(target):
+        df = pd.concat([pd.read_parquet(target), normalize_rows(new_rows)], ignore_index=True)
+    else:
+        df = normalize_rows(read_csv_rows(csv_path))
+    df = df.sort_values("time", kind="stable").drop_duplicates(subset=["time"], keep="first")
+    tmp_path = f"{target}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, target)
+
+
+def read_fresh_sidecar(csv_path: str, columns: Optional[List[str]] = None) -> Optional[pd.DataFrame]:
+    """
+    Read the store partition of a monthly CSV if it is not older than the CSV.
+    :return: Frame with `time` as naive UTC+8 datetime64, or None when the CSV must be parsed instead
+    """
+    if not pyarrow_available or not is_sidecar_fresh(csv_path):
+        return None
+    try:
+        df = pd.read_parquet(sidecar_path(csv_path), columns=columns)
+    except (OSError, ValueError):
+        return None
+    if "time" in df.columns:
+        df["time"] = pd.to_datetime(df["time"] + UTC8_OFFSET_SECONDS, unit="s")
+    return df
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Shrink a loaded observation frame: float32 measurements, categorical
+    StationID and no layered-current strings (see `layer_table`).
+    """
+    df = df.drop(columns=[col for col in LAYER_COLUMNS if col in df.columns])
+    for col in df.columns:
+        if col == "time":
+            continue
+        if col == "StationID":
+            df[col] = df[col].astype("category")
+        elif pd.api.types.is_numeric_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col]) and df[col].dtype != "float32":
+            df[col] = df[col].astype("float32")
+    return df
+
+
+def layer_table(df: pd.DataFrame) -> pd.DataFrame:
+    """Side table of the layered-current strings: `time` plus the layer columns, only rows that carry a profile."""
+    columns = [col for col in LAYER_COLUMNS if col in df.columns]
+    layers = df[["time"] + columns]
+    if not columns:
+        return layers
+    present = (layers[columns].fillna("").astype(str).apply(lambda values: values.str.strip()) != "").any(axis=1)
+    return layers[present].reset_index(drop=True)
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+def memory_report(base_path: str, device_ids: List[str]) -> pd.DataFrame:
+    """
+    Bytes per station-year of the loader output with the old dtypes (float64
+    measurements, object strings including the layer columns) and with
+    `compact_frame`.
+    """
+    records = []
+    for device_id in device_ids:
+        station_path = os.path.join(base_path, device_id)
+        by_year: Dict[str, List[pd.DataFrame]] = defaultdict(list)
+        for filename in list_partitions(station_path):
+            csv_path = os.path.join(station_path, filename)
+            df = read_fresh_sidecar(csv_path)
+            if df is None:
+                df = normalize_rows(read_csv_rows(csv_path))
+                df["time"] = pd.to_datetime(df["time"] + UTC8_OFFSET_SECONDS, unit="s")
+            by_year[filename[:4]].append(df)
+        for year, frames in sorted(by_year.items()):
+            df = pd.concat(frames, ignore_index=True)
+            legacy = df.astype({col: "float64" for col in NUMERIC_COLUMNS if col in df.columns})
+            legacy = legacy.astype({col: "object" for col in TEXT_COLUMNS if col in df.columns})
+            records.append({
+                "station": device_id,
+                "year": year,
+                "rows": len(df),
+                "before_bytes": frame_bytes(legacy),
+                "after_bytes": frame_bytes(compact_frame(df)),
+                "layer_table_bytes": frame_bytes(layer_table(df)),
+            })
+    return pd.DataFrame.from_records(records)
+
+
+def atomic_write_text(file_path: str, text: str):
+    """Replace `file_path` with `text` in one step (temp file plus rename)."""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+class FileLock:
+    """Cross-process lock backed by an exclusively created lock file."""
+
+    def __init__(self, lock_path: str, timeout: float = 60.0, stale_after: float = 300.0):
+        """
+        :param lock_path: Path of the lock file
+        :param timeout: Seconds to wait for the lock before raising TimeoutError
+        :param stale_after: Age in seconds after which a left-over lock file is broken
+        """
+        self.lock_path = lock_path
+        self.timeout = timeout
+        self.stale_after = stale_after
+
+    def __enter__(self):
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                fd = os.open(self.lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+                os.write(fd, str(os.getpid()).encode())
+                os.close(fd)
+                return self
+            except FileExistsError:
+                try:
+                    if time.time() - os.path.getmtime(self.lock_path) > self.stale_after:
+                        os.remove(self.lock_path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Timed out waiting for lock {self.lock_path}")
+                time.sleep(0.05)
+
+    def __exit__(self, *exc):
+        try:
+            os.remove(self.lock_path)
+        except FileNotFoundError:
+            pass
+
+
+class PartitionWriter:
+    """
+    Buffers observation rows per station and month, then writes each
+    partition in one atomic step.
+
+    Rows are routed by their own ``time`` value, so a batch spanning a month
+    boundary lands in both monthly files. A flush copies the current file to a
+    temporary file, appends the new rows and renames it over the original, so
+    readers only ever see complete files. Rows whose time is already stored
+    in the partition are skipped (see `PartitionTimesIndex`). The typed
+    sidecar is updated after the CSV. The derived views (tensors, rollups)
+    cost a station-year of I/O, so they are refreshed once per written
+    partition at the end of a flush with ``update_views``, or handed to a
+    shared `ViewRefreshQueue` that coalesces many writers' flushes.
+    """
+
+    def __init__(self, base_path: str, view_queue: Optional["ViewRefreshQueue"] = None):
+        """
+        :param base_path: Dataset folder holding <StationID>/<YYYYMM>.csv
+        :param view_queue: Queue the written partitions are added to instead of refreshing their views here
+        """
+        self.base_path = base_path
+        self.view_queue = view_queue
+        self.buffers: Dict[Tuple[str, str], List[dict]] = defaultdict(list)
+        self.stale_views: Set[str] = set()
+        self.lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """Number of buffered rows not yet flushed."""
+        with self.lock:
+            return sum(len(rows) for rows in self.buffers.values())
+
+    def add(self, device_id: str, row: dict) -> bool:
+        """Buffer a row; returns False when the row has no usable time."""
+        row_time = parse_time(row.get("time"))
+        if row_time is None:
+            return False
+        with self.lock:
+            self.buffers[(device_id, partition_name(row_time))].append(row)
+        return True
+
+    def extend(self, device_id: str, rows: Iterable[dict]) -> int:
+        """Buffer many rows; returns how many were accepted."""
+        return sum(self.add(device_id, row) for row in rows)
+
+    def flush(self, update_views: bool = True) -> Dict[Tuple[str, str], int]:
+        """
+        Write every buffered partition and return the rows written per (station, file).
+        :param update_views: Also refresh the derived views of every partition written since the last refresh;
+                             False leaves them for a later flush (e.g. between the batches of one response)
+        """
+        with self.lock:
+            buffers, self.buffers = self.buffers, defaultdict(list)
+
+        written: Dict[Tuple[str, str], int] = {}
+        for (device_id, filename), rows in sorted(buffers.items()):
+            station_path = os.path.join(self.base_path, device_id)
+            os.makedirs(station_path, exist_ok=True)
+            file_path = os.path.join(station_path, filename)
+            written[(device_id, filename)] = self._write_partition(file_path, rows)
+            if written[(device_id, filename)]:
+                self.stale_views.add(file_path)
+
+        if buffers:
+            summary = ", ".join(f"{filename}: +{count}" for (_, filename), count in written.items())
+            skipped = sum(len(rows) for rows in buffers.values()) - sum(written.values())
+            stations = sorted({device_id for device_id, _ in buffers})
+            print(f"📝 [{', '.join(stations)}] Wrote {sum(written.values())} rows ({summary})"
+                  + (f", skipped {skipped} duplicates" if skipped else ""))
+        if update_views:
+            self.update_views()
+        return written
+
+    def update_views(self):
+        """Refresh (or queue) the derived views of the partitions written since the last call."""
+        stale, self.stale_views = sorted(self.stale_views), set()
+        for file_path in stale:
+            if self.view_queue is not None:
+                self.view_queue.add(self.base_path, file_path)
+            else:
+                refresh_derived_views(self.base_path, file_path)
+
+    def _write_partition(self, file_path: str, rows: List[dict]) -> int:
+        with FileLock(f"{file_path}.lock"):
+            stored_times = _partition_times.times(file_path)
+            new_rows = []
+            for row in sorted(rows, key=lambda r: parse_time(r.get("time"))):
+                row_time = parse_time(row.get("time"))
+                if row_time in stored_times:
+                    continue
+                stored_times.add(row_time)
+                new_rows.append(row)
+            if not new_rows:
+                return 0
+
+            # Only extend the sidecar in place if it already matched the CSV before this write
+            sidecar_was_fresh = is_sidecar_fresh(file_path)
+            tmp_path = f"{file_path}.tmp"
+            if os.path.exists(file_path):
+                shutil.copyfile(file_path, tmp_path)
+            with open(tmp_path, mode="a", newline="", encoding="utf-8") as file:
+                writer = csv.DictWriter(file, fieldnames=CSV_COLUMNS, extrasaction="ignore")
+
+                if file.tell() == 0:
+                    # Header have 3 lines: Chinese names, English names, and units
+                    writer.writerow(dict(zip(CSV_COLUMNS, CSV_CHINESE_COLUMNS)))
+                    writer.writeheader()
+                    writer.writerow(dict(zip(CSV_COLUMNS, CSV_UNITS)))
+
+                writer.writerows({key: row.get(key, "") for key in CSV_COLUMNS} for row in new_rows)
+                file.flush()
+                os.fsync(file.fileno())
+            os.replace(tmp_path, file_path)
+            _partition_times.remember(file_path, stored_times)
+
+            try:
+                update_sidecar(file_path, new_rows, append=sidecar_was_fresh)
+            except Exception as e:
+                # A stale sidecar is ignored by readers, which fall back to the CSV
+                print(f"⚠️ Failed to update typed sidecar of {file_path}: {e}")
+            return len(new_rows)
+
+
+class ViewRefreshQueue:
+    """
+    Partitions whose derived views are out of date, shared by the writers of
+    one process. `refresh` updates each queued partition once, however many
+    flushes wrote to it since the previous refresh.
+    """
+
+    def __init__(self):
+        self.pending: Dict[str, str] = {}  # CSV path -> dataset folder
+        self.lock = threading.Lock()
+
+    def __len__(self) -> int:
+        with self.lock:
+            return len(self.pending)
+
+    def add(self, base_path: str, csv_path: str):
+        with self.lock:
+            self.pending[csv_path] = base_path
+
+    def refresh(self) -> int:
+        """Refresh every queued partition; returns how many were refreshed."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for csv_path, base_path in sorted(pending.items()):
+            refresh_derived_views(base_path, csv_path)
+        return len(pending)
+
+
+def refresh_derived_views(base_path: str, csv_path: str):
+    """`update_derived_views`, reporting instead of raising: stale views are rebuilt on the next write."""
+    try:
+        update_derived_views(base_path, csv_path)
+    except Exception as e:
+        print(f"⚠️ Failed to update derived views of {csv_path}: {e}")
+
+
+def update_derived_views(base_path: str, csv_path: str):
+    """Refresh the views built from one monthly partition (station x hour tensors, rollups) after it changed."""
+    # Imported here because the derived views are themselves built on this module
+    from utils.rollup import RollupStore
+    from utils.tensor import TensorStore
+    device_id = os.path.basename(os.path.dirname(csv_path))
+    TensorStore(base_path).update_month(device_id, csv_path)
+    RollupStore(base_path).update_month(device_id, csv_path)
+
+
+def convert_station(base_path: str, device_id: str) -> Tuple[int, int]:
+    """
+    Build missing or stale store partitions for one station's monthly CSVs.
+    :return: Tuple of (partitions written, partitions already up to date)
+    """
+    station_path = os.path.join(base_path, device_id)
+    written = fresh = 0
+    for filename in list_partitions(station_path):
+        csv_path = os.path.join(station_path, filename)
+        # Sidecars used to be written next to the CSV; the store replaces them
+        legacy_path = f"{os.path.splitext(csv_path)[0]}.parquet"
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+        if is_sidecar_fresh(csv_path):
+            fresh += 1
+            continue
+        with FileLock(f"{csv_path}.lock"):
+            update_sidecar(csv_path, [], append=False)
+        written += 1
+    return written, fresh
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the typed columnar store from the monthly buoy CSV files.")
+    parser.add_argument("--base", default="dataset/buoy/", help="Dataset folder holding <StationID>/<YYYYMM>.csv")
+    parser.add_argument("--stations", nargs="+", help="StationIDs to convert (default: every station folder)")
+    parser.add_argument("--workers", type=int, default=None, help="Parallel processes (default: CPU count)")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Print loaded-frame bytes per station-year with the old and the compact dtypes instead of converting")
+    args = parser.parse_args()
+
+    if args.memory_report:
+        device_ids = args.stations or sorted(d for d in os.listdir(args.base) if list_partitions(os.path.join(args.base, d)))
+        report = memory_report(args.base, device_ids)
+        if report.empty:
+            print("⚠️ No monthly files found")
+            return
+        report["ratio"] = (report["before_bytes"] / report["after_bytes"]).round(2)
+        print(report.to_string(index=False))
+        print(f"📊 Total: {report['before_bytes'].sum() / 2**20:.1f} MiB before, "
+              f"{report['after_bytes'].sum() / 2**20:.1f} MiB after "
+              f"(+{report['layer_table_bytes'].sum() / 2**20:.1f} MiB layer side tables)")
+        return
+
+    if not pyarrow_available:
+        raise SystemExit("pyarrow is required to build the columnar store: pip install pyarrow")
+    device_ids = args.stations or sorted(d for d in os.listdir(args.base) if list_partitions(os.path.join(args.base, d)))
+    print(f"🗜️ Converting {len(device_ids)} station(s) into {store_root(args.base)}")
+    started = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(convert_station, args.base, device_id): device_id for device_id in device_ids}
+        for future in as_completed(futures):
+            device_id = futures[future]
+            try:
+                written, fresh = future.result()
+                print(f"✅ [{device_id}] {written} partition(s) written, {fresh} already up to date")
+            except Exception as e:
+                print(f"❌ [{device_id}] Conversion failed: {e}")
+    print(f"📊 Conversion finished in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+"""
+Dense station x hour tensors for cross-station work.
+
+For every year and parameter, ``<base>_tensor/<YYYY>/<Parameter>.f32`` is a
+float32 memmap of shape (station rows, hours in the year) with NaN where a
+station reported nothing. Each hourly slot holds the mean of the observations
+in that hour (a circular mean for directions). ``index.json`` maps StationID
+to its row; the column of a time is its hour offset from 1 January of its
+year. Aligning several stations on time is then array slicing instead of a
+merge on ``time``. ``index.json`` also records, per station, the mtime of
+every monthly file when its slots were last written; a station-year is only
+read from the tensor when all of its monthly files are recorded and unchanged
+since (``TensorStore.is_fresh``), so readers fall back to the monthly files
+for months written before the tensor existed or not refreshed yet.
+
+The writer refreshes every station-month it wrote, in batches (see
+``storage.PartitionWriter``), and ``python -m utils.tensor`` (re)builds the
+tensors from existing monthly files.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from utils.storage import (
+    DIRECTION_COLUMNS, NUMERIC_COLUMNS, UTC8_OFFSET_SECONDS, FileLock, atomic_write_text, circular_mean,
+    list_partitions, normalize_rows, read_csv_rows, read_fresh_sidecar,
+)
+
+TENSOR_PARAMETERS = NUMERIC_COLUMNS
+INITIAL_ROWS = 16
+
+
+def tensor_root(base_path: str) -> str:
+    return f"{os.path.normpath(base_path)}_tensor"
+
+
+def hours_in_year(year: int) -> int:
+    return (datetime(year + 1, 1, 1) - datetime(year, 1, 1)).days * 24
+
+
+def year_hours(year: int) -> pd.DatetimeIndex:
+    """Hour timestamps (naive UTC+8) of the tensor columns of `year`."""
+    return pd.date_range(datetime(year, 1, 1), periods=hours_in_year(year), freq="h")
+
+
+def hourly_means(df: pd.DataFrame) -> pd.DataFrame:
+    """Aggregate typed observations (datetime `time`) to hourly means indexed by the hour."""
+    df = df.dropna(subset=["time"])
+    hours = df["time"].dt.floor("h")
+    linear = [col for col in TENSOR_PARAMETERS if col in df.columns and col not in DIRECTION_COLUMNS]
+    result = df[linear].astype("float64").groupby(hours).mean()
+    for col in DIRECTION_COLUMNS:
+        if col not in df.columns:
+            continue
+        radians = np.radians(df[col].astype("float64"))
+        sin_mean = np.sin(radians).groupby(hours).mean()
+        cos_mean = np.cos(radians).groupby(hours).mean()
+        result[col] = circular_mean(sin_mean, cos_mean)
+    return result
+
+
+class TensorStore:
+    """Per-year, per-parameter station x hour memmaps plus the StationID row index."""
+
+    def __init__(self, base_path: str):
+        self.base_path = base_path
+        self.root = tensor_root(base_path)
+        self.index_path = os.path.join(self.root, "index.json")
+        self.lock = threading.Lock()
+
+    def read_index(self) -> dict:
+        """{"stations": StationIDs in row order, "months": {StationID: {YYYYMM: mtime_ns of the monthly file when written}}}."""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                index = json.load(f)
+            return {"stations": list(index["stations"]), "months": dict(index.get("months", {}))}
+        except (OSError, ValueError, KeyError, TypeError):
+            return {"stations": [], "months": {}}
+
+    def stations(self) -> List[str]:
+        """StationIDs in row order."""
+        return self.read_index()["stations"]
+
+    def is_fresh(self, device_id: str, year: int, index: Optional[dict] = None) -> bool:
+        """True when the station's row holds every monthly file of the year, none of them changed since it was written."""
+        built = (index or self.read_index())["months"].get(device_id, {})
+        station_path = os.path.join(self.base_path, device_id)
+        months = [f for f in list_partitions(station_path) if f.startswith(str(year))]
+        if not months:
+            return False
+        try:
+            return all(built.get(f[:6], -1) >= os.stat(os.path.join(station_path, f)).st_mtime_ns for f in months)
+        except OSError:
+            return False
+
+    def station_rows(self, device_ids: List[str], index: Optional[dict] = None) -> Dict[str, int]:
+        """Row of each requested station that has one."""
+        rows = {device_id: row for row, device_id in enumerate((index or self.read_index())["stations"])}
+        return {device_id: rows[device_id] for device_id in device_ids if device_id in rows}
+
+    def tensor_path(self, year: int, parameter: str) -> str:
+        return os.path.join(self.root, str(year), f"{parameter}.f32")
+
+    def open(self, year: int, parameter: str, mode: str = "r") -> Optional[np.memmap]:
+        """Memmap of one year and parameter, shape (rows, hours); None when it was never built."""
+        file_path = self.tensor_path(year, parameter)
+        if not os.path.exists(file_path):
+            return None
+        hours = hours_in_year(year)
+        rows = os.path.getsize(file_path) // (4 * hours)
+        if rows == 0:
+            return None
+        return np.memmap(file_path, dtype=np.float32, mode=mode, shape=(rows, hours))
+
+    def year_frame(self, year: int, parameter: str, device_ids: List[str]) -> pd.DataFrame:
+        """
+        Hourly values of several stations side by side (columns are StationIDs), already aligned on time.
+        Each column is a read-only view of its station's row of the memmap, not a copy. Stations whose row is
+        missing or not fresh for the year (see `is_fresh`) are left out; read their monthly files instead.
+        """
+        tensor = self.open(year, parameter)
+        index = self.read_index()
+        rows = {} if tensor is None else {
+            device_id: row for device_id, row in self.station_rows(device_ids, index).items()
+            if row < tensor.shape[0] and self.is_fresh(device_id, year, index)
+        }
+        if not rows:
+            return pd.DataFrame(index=year_hours(year))
+        # One basic-indexed row per column; indexing several rows at once would copy them
+        return pd.DataFrame({device_id: tensor[row] for device_id, row in rows.items()}, index=year_hours(year), copy=False)
+
+    def update_month(self, device_id: str, csv_path: str):
+        """Rewrite the slots of one station-month from its partition (store partition if fresh, CSV otherwise)."""
+        # Taken before reading, so a write racing with this refresh leaves the month stale rather than marked fresh
+        source_mtime_ns = os.stat(csv_path).st_mtime_ns
+        df = read_fresh_sidecar(csv_path)
+        if df is None:
+            df = normalize_rows(read_csv_rows(csv_path))
+            df["time"] = pd.to_datetime(df["time"] + UTC8_OFFSET_SECONDS, unit="s")
+        month = os.path.splitext(os.path.basename(csv_path))[0]
+        year, month_start = int(month[:4]), datetime(int(month[:4]), int(month[4:6]), 1)
+        first = int((month_start - datetime(year, 1, 1)).total_seconds() // 3600)
+        last = first + pd.Period(month_start, freq="M").days_in_month * 24
+        hourly = hourly_means(df)
+        hourly = hourly[(hourly.index >= month_start) & (hourly.index < month_start + pd.offsets.MonthBegin(1))]
+        slots = ((hourly.index - datetime(year, 1, 1)) // pd.Timedelta(hours=1)).to_numpy()
+
+        os.makedirs(os.path.join(self.root, str(year)), exist_ok=True)
+        with self.lock, FileLock(os.path.join(self.root, ".lock")):
+            index = self.read_index()
+            if device_id not in index["stations"]:
+                index["stations"].append(device_id)
+            row = index["stations"].index(device_id)
+            for parameter in TENSOR_PARAMETERS:
+                tensor = self._open_for_row(year, parameter, row)
+                tensor[row, first:last] = np.nan
+                if parameter in hourly.columns:
+                    tensor[row, slots] = hourly[parameter].to_numpy(dtype=np.float32)
+                tensor.flush()
+                del tensor
+            # Recorded after the slots are written, so readers never trust a half-written month
+            index["months"].setdefault(device_id, {})[month[:6]] = source_mtime_ns
+            atomic_write_text(self.index_path, json.dumps(index))
+
+    def _open_for_row(self, year: int, parameter: str, row: int) -> np.memmap:
+        """Open a tensor for writing, creating it or growing its rows (filled with NaN) so `row` fits."""
+        hours = hours_in_year(year)
+        file_path = self.tensor_path(year, parameter)
+        rows = os.path.getsize(file_path) // (4 * hours) if os.path.exists(file_path) else 0
+        if row >= rows:
+            new_rows = max(INITIAL_ROWS, rows * 2, row + 1)
+            with open(file_path, "ab") as f:
+                np.full((new_rows - rows, hours), np.nan, dtype=np.float32).tofile(f)
+            rows = new_rows
+        return np.memmap(file_path, dtype=np.float32, mode="r+", shape=(rows, hours))
+
+    def build(self, device_ids: List[str]) -> int:
+        """Refresh every month of the given stations; returns the number of station-months written."""
+        months = 0
+        for device_id in device_ids:
+            station_path = os.path.join(self.base_path, device_id)
+            for filename in list_partitions(station_path):
+                self.update_month(device_id, os.path.join(station_path, filename))
+                months += 1
+        return months
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the station x hour tensors from the monthly buoy files.")
+    parser.add_argument("--base", default="dataset/buoy/", help="Dataset folder holding <StationID>/<YYYYMM>.csv")
+    parser.add_argument("--stations", nargs="+", help="StationIDs to build (default: every station folder)")
+    args = parser.parse_args()
+
+    device_ids = args.stations or sorted(d for d in os.listdir(args.base) if list_partitions(os.path.join(args.base, d)))
+    print(f"🧊 Building tensors of {len(device_ids)} station(s) into {tensor_root(args.base)}")
+    started = time.monotonic()
+    months = TensorStore(args.base).build(device_ids)
+    print(f"📊 {months} station-month(s) written in {time.monotonic() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()